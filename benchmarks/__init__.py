@@ -0,0 +1 @@
+"""Hardware-free benchmarks for the Tecscanner web application."""
@@ -0,0 +1,60 @@
+"""Run the hardware-free benchmark suite.
+
+Usage::
+
+    python -m benchmarks [--scenario record_loop --scenario status_latency ...]
+                         [--latency 0.1] [--points 20000] [--output results.jsonl]
+
+The recorder is replaced by :mod:`benchmarks.fake_save_laz` and the USB
+drive by a temporary directory (see :mod:`benchmarks.environment`), so the
+suite runs on any development machine.  Each scenario prints one JSON record;
+compare two result files with ``python -m benchmarks.compare``.
+"""
+
+import argparse
+import sys
+from pathlib import Path
+
+from .common import emit
+from .environment import SimulatedEnvironment
+
+
+def main(argv=None) -> int:
+    from .scenarios import SCENARIOS
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scenario", action="append", choices=sorted(SCENARIOS))
+    parser.add_argument("--latency", type=float, default=0.1, help="fake sensor wait per frame (s)")
+    parser.add_argument("--points", type=int, default=20000, help="points per fake frame")
+    parser.add_argument("--duration", type=float, default=5.0, help="seconds per timed scenario")
+    parser.add_argument("--pollers", type=int, default=8)
+    parser.add_argument("--history", type=int, default=10000, help="log entries for save_log")
+    parser.add_argument("--recorder-mode", choices=("persistent", "spawn"), default="persistent")
+    parser.add_argument("--output", type=Path, help="append JSON records to this file")
+    args = parser.parse_args(argv)
+
+    params = {
+        "record_loop": {"duration": args.duration},
+        "status_latency": {"pollers": args.pollers, "duration": args.duration},
+        "save_log": {"history": args.history},
+        "start_stop": {},
+        "startup": {},
+    }
+    env = {"LIVOX_RECORDER_MODE": args.recorder_mode}
+    with SimulatedEnvironment(args.latency, args.points, env):
+        import webapp
+
+        try:
+            for name in args.scenario or list(SCENARIOS):
+                results = SCENARIOS[name](**params[name])
+                results.update(
+                    latency=args.latency, points=args.points, recorder_mode=args.recorder_mode
+                )
+                emit(name, results, args.output)
+        finally:
+            webapp.manager.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
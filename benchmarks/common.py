@@ -0,0 +1,67 @@
+"""Shared helpers for the benchmark scripts."""
+
+import json
+import platform
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Optional
+
+
+def write_synthetic_frame(path: Path, points: int, seed: int = 0) -> Path:
+    """Write an uncompressed LAS 1.2/format 1 frame shaped like ``save_laz`` output."""
+    from webapp import las_io
+
+    np = las_io.numpy()
+    rng = np.random.default_rng(seed)
+    with las_io.LasWriter(path) as writer:
+        step = las_io.DEFAULT_CHUNK_POINTS
+        for start in range(0, points, step):
+            n = min(step, points - start)
+            records = np.zeros(n, dtype=writer.dtype)
+            for name in ("X", "Y", "Z"):
+                records[name] = rng.integers(-400000, 400000, n, dtype=np.int32)
+            records["intensity"] = rng.integers(0, 255, n)
+            records["raw_classification"] = rng.integers(0, 4, n)
+            records["user_data"] = rng.integers(0, 4, n)
+            records["gps_time"] = (start + np.arange(n)) * 1e-6
+            writer.write(records)
+    return path
+
+
+def git_revision() -> Optional[str]:
+    try:
+        out = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=Path(__file__).resolve().parent,
+        )
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return out.stdout.strip() or None
+
+
+def emit(name: str, results: dict, output: Optional[Path] = None) -> dict:
+    """Print a machine-readable benchmark record and return it.
+
+    When ``output`` is given the record is also appended to that JSON-lines
+    file so runs can later be diffed with :mod:`benchmarks.compare`.
+    """
+    record = {
+        "benchmark": name,
+        "revision": git_revision(),
+        "timestamp": time.time(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "results": results,
+    }
+    json.dump(record, sys.stdout)
+    sys.stdout.write("\n")
+    sys.stdout.flush()
+    if output:
+        with open(output, "a") as f:
+            f.write(json.dumps(record) + "\n")
+    return record
@@ -0,0 +1,61 @@
+"""Diff two benchmark result files.
+
+Usage::
+
+    python -m benchmarks.compare baseline.jsonl candidate.jsonl
+
+Both files hold records written with ``--output``.  For every benchmark
+present in both, numeric results are printed side by side with the relative
+change; the last record per benchmark wins.
+"""
+
+import argparse
+import json
+import sys
+from pathlib import Path
+from typing import Dict
+
+
+def load(path: Path) -> Dict[str, dict]:
+    records = {}
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                rec = json.loads(line)
+                records[rec["benchmark"]] = rec
+    return records
+
+
+def _flatten(results: dict, prefix: str = "") -> Dict[str, float]:
+    flat = {}
+    for key, value in results.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(_flatten(value, name + "."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("baseline", type=Path)
+    parser.add_argument("candidate", type=Path)
+    args = parser.parse_args(argv)
+
+    base = load(args.baseline)
+    cand = load(args.candidate)
+    for name in sorted(set(base) & set(cand)):
+        print(f"{name}  ({base[name].get('revision')} -> {cand[name].get('revision')})")
+        old = _flatten(base[name]["results"])
+        new = _flatten(cand[name]["results"])
+        for key in sorted(set(old) & set(new)):
+            a, b = old[key], new[key]
+            change = f"{(b - a) / a * 100:+.1f}%" if a else "n/a"
+            print(f"  {key:<40} {a:>14g} {b:>14g} {change:>9}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
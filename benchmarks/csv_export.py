@@ -0,0 +1,69 @@
+"""Compare the built-in CSV exporter with the ``LIVOX_CONVERT_CMD`` subprocess.
+
+Usage::
+
+    python -m benchmarks.csv_export --points 2000000 [--convert-cmd las2txt-wrapper]
+
+The external command is invoked as ``<cmd> <input> <output>`` exactly like
+``RecordingManager._convert_to_csv`` does.
+"""
+
+import argparse
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+from pathlib import Path
+
+from webapp import csv_export
+
+from .common import emit, write_synthetic_frame
+
+
+def _throughput(points: int, seconds: float) -> dict:
+    return {
+        "seconds": round(seconds, 4),
+        "points_per_sec": round(points / seconds) if seconds > 0 else None,
+    }
+
+
+def main(argv=None) -> dict:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--points", type=int, default=1_000_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--columns", default=",".join(csv_export.DEFAULT_COLUMNS))
+    parser.add_argument("--convert-cmd", default=os.getenv("LIVOX_CONVERT_CMD"))
+    args = parser.parse_args(argv)
+    columns = [c for c in args.columns.split(",") if c]
+
+    results = {"points": args.points, "columns": columns}
+    with tempfile.TemporaryDirectory() as tmp:
+        src = write_synthetic_frame(Path(tmp) / "frame.las", args.points)
+        dst = Path(tmp) / "frame.csv"
+
+        best = float("inf")
+        for _ in range(args.repeat):
+            t0 = time.perf_counter()
+            csv_export.convert(src, dst, columns)
+            best = min(best, time.perf_counter() - t0)
+        results["builtin"] = _throughput(args.points, best)
+
+        cmd = shutil.which(args.convert_cmd) if args.convert_cmd else None
+        if cmd:
+            best = float("inf")
+            for _ in range(args.repeat):
+                t0 = time.perf_counter()
+                subprocess.run([cmd, str(src), str(dst)], check=True)
+                best = min(best, time.perf_counter() - t0)
+            results["subprocess"] = _throughput(args.points, best)
+            results["speedup"] = round(
+                results["subprocess"]["seconds"] / results["builtin"]["seconds"], 2
+            )
+        else:
+            results["subprocess"] = None
+    return emit("csv_export", results)
+
+
+if __name__ == "__main__":
+    main()
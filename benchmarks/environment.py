@@ -0,0 +1,81 @@
+"""Simulated hardware for the benchmarks.
+
+:class:`SimulatedEnvironment` prepares a temporary directory that looks like
+a Raspberry Pi with a LiDAR and a USB stick attached:
+
+* ``<tmp>/media/usb0`` acts as the USB drive.  A fake ``mountinfo`` file
+  listing it is exposed via ``LIVOX_MOUNTINFO`` and the mount root via
+  ``LIVOX_MOUNT_ROOTS``.
+* ``<tmp>/bin/save_laz`` wraps :mod:`benchmarks.fake_save_laz` and is used as
+  ``LIVOX_RECORD_CMD``.
+* :class:`benchmarks.fake_lidar.FakeLidar` sends LiDAR traffic to two free
+  local UDP ports exposed via ``LIDAR_HEARTBEAT_PORTS``; stop and start
+  ``env.lidar`` to unplug and plug the sensor.
+
+The environment variables must be in place before :mod:`webapp` is
+imported, because the application builds its manager at import time.
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+from pathlib import Path
+from typing import Dict, Optional
+
+from .fake_lidar import FakeLidar, free_udp_ports
+
+
+class SimulatedEnvironment:
+    def __init__(self, latency: float = 0.1, points: int = 20000, extra_env: Optional[Dict[str, str]] = None):
+        self.latency = latency
+        self.points = points
+        self.extra_env = dict(extra_env or {})
+        self.root: Optional[Path] = None
+        self.lidar: Optional[FakeLidar] = None
+        self._saved: Dict[str, Optional[str]] = {}
+
+    @property
+    def usb(self) -> Path:
+        return self.root / "media" / "usb0"
+
+    def __enter__(self) -> "SimulatedEnvironment":
+        self.root = Path(tempfile.mkdtemp(prefix="tecscanner-bench-"))
+        self.usb.mkdir(parents=True)
+        mountinfo = self.root / "mountinfo"
+        mountinfo.write_text(f"100 1 8:1 / {self.usb} rw,relatime - vfat /dev/sda1 rw\n")
+
+        bindir = self.root / "bin"
+        bindir.mkdir()
+        stub = Path(__file__).resolve().parent / "fake_save_laz.py"
+        recorder = bindir / "save_laz"
+        recorder.write_text(f'#!/bin/sh\nexec "{sys.executable}" "{stub}" "$@"\n')
+        recorder.chmod(0o755)
+
+        self.lidar = FakeLidar(free_udp_ports(2))
+        env = {
+            "LIVOX_RECORD_CMD": str(recorder),
+            "LIDAR_HEARTBEAT_PORTS": ",".join(str(p) for p in self.lidar.ports),
+            "LIVOX_MOUNT_ROOTS": str(self.root / "media"),
+            "LIVOX_MOUNTINFO": str(mountinfo),
+            "FAKE_SAVE_LAZ_LATENCY": str(self.latency),
+            "FAKE_SAVE_LAZ_POINTS": str(self.points),
+            "LOG_LEVEL": "WARNING",
+        }
+        env.update(self.extra_env)
+        for key, value in env.items():
+            self._saved[key] = os.environ.get(key)
+            os.environ[key] = value
+        self.lidar.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        if self.lidar:
+            self.lidar.stop()
+        for key, value in self._saved.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+        if self.root:
+            shutil.rmtree(self.root, ignore_errors=True)
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""Local UDP stand-in for a connected MID360.
+
+Sends small datagrams to the host ports that
+:class:`webapp.lidar_detect.HeartbeatDetector` listens on, the way a powered
+LiDAR pushes status and point packets.  :meth:`FakeLidar.stop` and
+:meth:`FakeLidar.start` emulate unplugging and plugging the sensor.  Like
+:mod:`benchmarks.fake_save_laz` it only needs the standard library::
+
+    python -m benchmarks.fake_lidar --ports 56201,56301 --rate 100
+"""
+
+import argparse
+import socket
+import threading
+from typing import List, Optional
+
+
+def free_udp_ports(count: int) -> List[int]:
+    """Return ``count`` currently unused local UDP ports."""
+    sockets = []
+    try:
+        for _ in range(count):
+            s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            s.bind(("127.0.0.1", 0))
+            sockets.append(s)
+        return [s.getsockname()[1] for s in sockets]
+    finally:
+        for s in sockets:
+            s.close()
+
+
+class FakeLidar:
+    def __init__(self, ports: List[int], host: str = "127.0.0.1", rate: float = 50.0):
+        self.ports = list(ports)
+        self.host = host
+        self.rate = rate
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> None:
+        if self.running:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="fake-lidar", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self) -> None:
+        s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        payload = bytes(64)
+        try:
+            while not self._stop.is_set():
+                for port in self.ports:
+                    try:
+                        s.sendto(payload, (self.host, port))
+                    except OSError:
+                        pass
+                self._stop.wait(1.0 / self.rate)
+        finally:
+            s.close()
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--ports", default="56201,56301", help="comma separated UDP ports")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--rate", type=float, default=50.0, help="packets per second and port")
+    args = parser.parse_args(argv)
+    lidar = FakeLidar([int(p) for p in args.ports.split(",")], args.host, args.rate)
+    lidar.start()
+    try:
+        lidar._thread.join()
+    except KeyboardInterrupt:
+        lidar.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
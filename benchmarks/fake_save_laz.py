@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""Hardware-free stand-in for the ``save_laz`` recorder.
+
+Supports the same command line as the real utility (optionally preceded by
+``--device <serial>``):
+
+* ``--check`` – exit 0 (or ``FAKE_SAVE_LAZ_CHECK`` if set) immediately
+* ``--server`` – long-lived mode speaking the ``FRAME <path>`` /
+  ``DECIMATE <n>`` protocol
+* ``<path>`` – write a single frame and exit
+
+Each frame is an uncompressed LAS 1.2 / point format 1 file with
+``FAKE_SAVE_LAZ_POINTS`` random points, written after sleeping
+``FAKE_SAVE_LAZ_LATENCY`` seconds to emulate waiting for the sensor.  The
+module deliberately depends on the standard library only so that it starts
+as quickly as a native binary would.  A recorder started for the serial in
+``FAKE_SAVE_LAZ_FAIL_DEVICE`` fails every frame, emulating a sensor that
+drops out of a multi-LiDAR session.
+"""
+
+import json
+import os
+import random
+import struct
+import sys
+import time
+
+HEADER_FMT = "<4sHH16sBB32s32sHHHIIBHI5I3d3d6d"
+HEADER_SIZE = struct.calcsize(HEADER_FMT)
+RECORD = struct.Struct("<iiiHBBbBHd")
+
+
+def build_frame(points: int, seed: int = 0) -> bytes:
+    rng = random.Random(seed)
+    body = bytearray()
+    for i in range(points):
+        body += RECORD.pack(
+            rng.randint(-400000, 400000),
+            rng.randint(-400000, 400000),
+            rng.randint(-40000, 40000),
+            rng.randint(0, 255),
+            0,
+            rng.randint(0, 3),
+            0,
+            rng.randint(0, 3),
+            0,
+            i * 1e-6,
+        )
+    header = struct.pack(
+        HEADER_FMT,
+        b"LASF", 4711, 1, b"\0" * 16, 1, 2,
+        b"fake_save_laz".ljust(32, b"\0"), b"fake_save_laz".ljust(32, b"\0"),
+        0, 0, HEADER_SIZE, HEADER_SIZE, 0, 1, RECORD.size, points,
+        points, 0, 0, 0, 0,
+        0.0001, 0.0001, 0.0001, 0.0, 0.0, 0.0,
+        40.0, -40.0, 40.0, -40.0, 4.0, -4.0,
+    )
+    return header + bytes(body)
+
+
+def save(path: str, frame: bytes, points: int, latency: float) -> dict:
+    time.sleep(latency)
+    start = time.perf_counter()
+    with open(path, "wb") as f:
+        f.write(frame)
+    return {
+        "filename": path,
+        "points_count": points,
+        "save_duration_sec1": time.perf_counter() - start,
+        "save_duration_sec2": -1,
+        "size_mb": len(frame) / (1024 * 1024),
+        "decimation_step": 1,
+    }
+
+
+def main(argv) -> int:
+    device = None
+    if len(argv) >= 3 and argv[1] == "--device":
+        device = argv[2]
+        argv = argv[:1] + argv[3:]
+    failing = device is not None and device == os.getenv("FAKE_SAVE_LAZ_FAIL_DEVICE")
+    points = int(os.getenv("FAKE_SAVE_LAZ_POINTS", "20000"))
+    latency = float(os.getenv("FAKE_SAVE_LAZ_LATENCY", "0.1"))
+    if len(argv) < 2:
+        print(f"usage: {argv[0]} [--device <serial>] [--check | --server | <output.laz>]", file=sys.stderr)
+        return 1
+    if argv[1] == "--check":
+        return int(os.getenv("FAKE_SAVE_LAZ_CHECK", "0"))
+    frames = {1: build_frame(points)}
+    if argv[1] == "--server":
+        step = 1
+        out = sys.stdout
+        out.write(json.dumps({"ready": True}) + "\n")
+        out.flush()
+        for line in sys.stdin:
+            line = line.strip()
+            if line == "QUIT":
+                break
+            if line.startswith("DECIMATE "):
+                step = max(1, int(line[len("DECIMATE "):]))
+                if step not in frames:
+                    frames[step] = build_frame(points // step)
+                reply = {"ok": True, "decimation_step": step}
+            elif line.startswith("FRAME ") and failing:
+                time.sleep(latency)
+                reply = {"ok": False, "error": "save failed"}
+            elif line.startswith("FRAME "):
+                reply = save(line[len("FRAME "):], frames[step], points // step, latency)
+                reply["decimation_step"] = step
+                reply["ok"] = True
+            else:
+                reply = {"ok": False, "error": "unknown command"}
+            if device:
+                reply["device"] = device
+            out.write(json.dumps(reply) + "\n")
+            out.flush()
+        return 0
+    if failing:
+        time.sleep(latency)
+        return 1
+    save(argv[1], frames[1], points, latency)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
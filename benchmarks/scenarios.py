@@ -0,0 +1,236 @@
+"""Benchmark scenarios run by ``python -m benchmarks``.
+
+Every scenario takes its parameters as keyword arguments and returns a flat
+dictionary of results.  They must run inside a
+:class:`~benchmarks.environment.SimulatedEnvironment`.
+"""
+
+import json
+import os
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from .fake_lidar import free_udp_ports
+
+
+def _percentiles(samples: List[float]) -> dict:
+    if not samples:
+        return {"p50": None, "p95": None, "p99": None, "max": None}
+    ordered = sorted(samples)
+    n = len(ordered)
+
+    def pick(q: float) -> float:
+        return round(ordered[min(n - 1, int(q * n))], 6)
+
+    return {"p50": pick(0.5), "p95": pick(0.95), "p99": pick(0.99), "max": round(ordered[-1], 6)}
+
+
+def _manager():
+    import webapp
+
+    return webapp.manager
+
+
+def record_loop(duration: float = 5.0) -> dict:
+    """Frames per second of ``_record_loop`` against the stub recorder."""
+    manager = _manager()
+    started, error = manager.start_recording()
+    if not started:
+        raise RuntimeError(f"recording did not start: {error}")
+    t0 = time.perf_counter()
+    time.sleep(duration)
+    frames = manager.status()["frames_recorded"]
+    elapsed = time.perf_counter() - t0
+    metrics = manager.metrics.summary()
+    manager.stop_recording()
+    return {
+        "duration": round(elapsed, 3),
+        "frames": frames,
+        "frames_per_sec": round(frames / elapsed, 3),
+        "stages": metrics["stages"],
+    }
+
+
+def status_latency(pollers: int = 8, duration: float = 5.0) -> dict:
+    """``/status`` latency with ``pollers`` concurrent clients while recording."""
+    import webapp
+
+    manager = _manager()
+    started, error = manager.start_recording()
+    if not started:
+        raise RuntimeError(f"recording did not start: {error}")
+    latencies: List[float] = []
+    lock = threading.Lock()
+    stop = threading.Event()
+
+    def poll() -> None:
+        client = webapp.app.test_client()
+        local = []
+        while not stop.is_set():
+            t = time.perf_counter()
+            resp = client.get("/status")
+            local.append(time.perf_counter() - t)
+            resp.close()
+        with lock:
+            latencies.extend(local)
+
+    threads = [threading.Thread(target=poll) for _ in range(pollers)]
+    for t in threads:
+        t.start()
+    time.sleep(duration)
+    stop.set()
+    for t in threads:
+        t.join()
+    frames = manager.status()["frames_recorded"]
+    manager.stop_recording()
+    result = {
+        "pollers": pollers,
+        "requests": len(latencies),
+        "requests_per_sec": round(len(latencies) / duration, 1),
+        "frames_during_test": frames,
+    }
+    result.update({f"latency_{k}": v for k, v in _percentiles(latencies).items()})
+    return result
+
+
+def save_log(history: int = 10000, appends: int = 200) -> dict:
+    """Cost of logging a session on top of ``history`` existing entries."""
+    manager = _manager()
+    segment = manager.recordings_log.segment_size
+    manager._close_log()
+    log_dir = Path(manager.output_dir) / "recordings.d"
+    shutil.rmtree(log_dir, ignore_errors=True)
+    log_dir.mkdir()
+    # Seed the history directly as segments rather than via slow appends
+    for start in range(0, history, segment):
+        number = start // segment + 1
+        lines = [
+            json.dumps({"folder": f"session_seed_{i:06d}", "frames": 100, "started": None, "stopped": None})
+            for i in range(start, min(start + segment, history))
+        ]
+        (log_dir / f"segment-{number:06d}.jsonl").write_text("\n".join(lines) + "\n")
+
+    t0 = time.perf_counter()
+    manager._open_log()
+    open_seconds = time.perf_counter() - t0
+
+    samples = []
+    for i in range(appends):
+        entry = {"folder": f"session_bench_{i:06d}", "frames": 1, "started": None, "stopped": None}
+        t = time.perf_counter()
+        manager._save_log(entry)
+        samples.append(time.perf_counter() - t)
+    result = {"history": history, "appends": appends, "open_seconds": round(open_seconds, 4)}
+    result.update({f"append_{k}": v for k, v in _percentiles(samples).items()})
+    result["append_mean"] = round(statistics.mean(samples), 6)
+    return result
+
+
+def start_stop(iterations: int = 5, record_seconds: float = 0.5) -> dict:
+    """Latency of ``start_recording`` and of stopping.
+
+    ``stop_request`` is the time for ``request_stop`` to return (what
+    ``POST /stop`` is bounded by), ``stop`` the time until the session has
+    been finalized.
+    """
+    manager = _manager()
+    starts: List[float] = []
+    requests: List[float] = []
+    stops: List[float] = []
+    for _ in range(iterations):
+        t = time.perf_counter()
+        started, error = manager.start_recording()
+        starts.append(time.perf_counter() - t)
+        if not started:
+            raise RuntimeError(f"recording did not start: {error}")
+        time.sleep(record_seconds)
+        t = time.perf_counter()
+        op = manager.request_stop()
+        requests.append(time.perf_counter() - t)
+        manager.wait_operation(op["id"])
+        stops.append(time.perf_counter() - t)
+        # Session directories are named with one-second resolution
+        time.sleep(1.0)
+    result = {"iterations": iterations}
+    result.update({f"start_{k}": v for k, v in _percentiles(starts).items()})
+    result.update({f"stop_request_{k}": v for k, v in _percentiles(requests).items()})
+    result.update({f"stop_{k}": v for k, v in _percentiles(stops).items()})
+    return result
+
+
+def _poll_status(url: str, deadline: float, initializing: bool) -> Optional[float]:
+    """Poll ``url`` until it answers (and, with ``initializing`` false, until
+    the service has left the ``initializing`` state)."""
+    while time.perf_counter() < deadline:
+        try:
+            with urllib.request.urlopen(url, timeout=1) as resp:
+                state = json.loads(resp.read()).get("state")
+            if initializing or state != "initializing":
+                return time.perf_counter()
+        except (OSError, urllib.error.URLError, ValueError):
+            pass
+        time.sleep(0.002)
+    return None
+
+
+def startup(iterations: int = 5, timeout: float = 30.0) -> dict:
+    """Time from launching the web app to its first and first ready response.
+
+    Each iteration starts :mod:`benchmarks.serve` in a fresh interpreter, so
+    the figures include Python start-up and all imports.
+    """
+    first: List[float] = []
+    ready: List[float] = []
+    imports: List[float] = []
+    for _ in range(iterations):
+        with socket.socket() as s:
+            s.bind(("127.0.0.1", 0))
+            port = s.getsockname()[1]
+        env = dict(os.environ)
+        # The in-process manager already listens on the heartbeat ports
+        env["LIDAR_HEARTBEAT_PORTS"] = ",".join(str(p) for p in free_udp_ports(2))
+        t0 = time.perf_counter()
+        proc = subprocess.Popen(
+            [sys.executable, "-m", "benchmarks.serve", "--port", str(port)],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True,
+            env=env,
+            cwd=Path(__file__).resolve().parent.parent,
+        )
+        try:
+            url = f"http://127.0.0.1:{port}/status"
+            deadline = t0 + timeout
+            t_first = _poll_status(url, deadline, initializing=True)
+            t_ready = _poll_status(url, deadline, initializing=False)
+            if t_first is None or t_ready is None:
+                raise RuntimeError("web app did not answer within the timeout")
+            first.append(t_first - t0)
+            ready.append(t_ready - t0)
+            imports.append(json.loads(proc.stdout.readline())["import_seconds"])
+        finally:
+            proc.terminate()
+            proc.wait(timeout=10)
+    result = {"iterations": iterations}
+    result.update({f"first_response_{k}": v for k, v in _percentiles(first).items()})
+    result.update({f"ready_{k}": v for k, v in _percentiles(ready).items()})
+    result.update({f"import_{k}": v for k, v in _percentiles(imports).items()})
+    return result
+
+
+SCENARIOS: Dict[str, Callable[..., dict]] = {
+    "record_loop": record_loop,
+    "status_latency": status_latency,
+    "save_log": save_log,
+    "start_stop": start_stop,
+    "startup": startup,
+}
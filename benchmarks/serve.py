@@ -0,0 +1,36 @@
+#!/usr/bin/env python3
+"""Serve the web app on a local port for the ``startup`` benchmark.
+
+Prints one JSON line with the time spent importing :mod:`webapp` and then
+serves until terminated::
+
+    python -m benchmarks.serve --port 5000
+"""
+
+import argparse
+import json
+import sys
+import time
+
+
+def main(argv=None) -> int:
+    t0 = time.perf_counter()
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, required=True)
+    args = parser.parse_args(argv)
+
+    import webapp
+    from werkzeug.serving import make_server
+
+    server = make_server(args.host, args.port, webapp.app, threaded=True)
+    print(json.dumps({"import_seconds": round(time.perf_counter() - t0, 4)}), flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,18 +2,108 @@
 #include <memory>
 #include <string>
 #include <iostream>
+#include <algorithm>
+#include <stdexcept>
+#include <vector>
+
+namespace {
+
+// Long-lived recorder mode used by the web application.  Commands are read
+// line by line from stdin and every command is answered with exactly one
+// JSON line on stdout:
+//
+//   FRAME <path>   capture the next frame to <path>
+//   DECIMATE <n>   keep at most every n-th point in subsequent frames
+//   QUIT           terminate the recorder
+//
+// Diagnostic output of ``saveLaz`` is redirected to stderr so that stdout
+// only carries protocol replies.
+int runServer() {
+    std::ostream reply(std::cout.rdbuf());
+    std::cout.rdbuf(std::cerr.rdbuf());
+
+    nlohmann::json ready;
+    ready["ready"] = true;
+    reply << ready.dump() << std::endl;
+
+    int minDecimationStep = 1;
+    std::string line;
+    while (std::getline(std::cin, line)) {
+        if (!line.empty() && line.back() == '\r') {
+            line.pop_back();
+        }
+        if (line.empty()) {
+            continue;
+        }
+        if (line == "QUIT") {
+            break;
+        }
+        nlohmann::json response;
+        const std::string decimateCmd = "DECIMATE ";
+        if (line.rfind(decimateCmd, 0) == 0) {
+            try {
+                minDecimationStep = std::max(1, std::stoi(line.substr(decimateCmd.size())));
+                response["ok"] = true;
+                response["decimation_step"] = minDecimationStep;
+            } catch (const std::exception&) {
+                response["ok"] = false;
+                response["error"] = "invalid decimation step";
+            }
+            reply << response.dump() << std::endl;
+            continue;
+        }
+        const std::string frameCmd = "FRAME ";
+        if (line.rfind(frameCmd, 0) != 0) {
+            response["ok"] = false;
+            response["error"] = "unknown command";
+            reply << response.dump() << std::endl;
+            continue;
+        }
+        const std::string filename = line.substr(frameCmd.size());
+        mandeye::LivoxPointsBufferPtr buffer = std::make_shared<mandeye::LivoxPointsBuffer>();
+        auto stats = mandeye::saveLaz(filename, buffer, minDecimationStep);
+        if (stats) {
+            response = stats->produceStatus();
+            response["ok"] = true;
+        } else {
+            response["ok"] = false;
+            response["filename"] = filename;
+            response["error"] = "save failed";
+        }
+        reply << response.dump() << std::endl;
+    }
+    return 0;
+}
+
+} // namespace
 
 int main(int argc, char** argv) {
-    if (argc >= 2 && std::string(argv[1]) == "--check") {
+    std::vector<std::string> args;
+    for (int i = 1; i < argc; ++i) {
+        const std::string arg = argv[i];
+        if (arg == "--device") {
+            // This build records from a single, implicit LiDAR and has no way
+            // to pick a sensor by serial number.  Refuse rather than record
+            // the same sensor for every device of a multi-LiDAR session.
+            std::cerr << "--device is not supported by this save_laz build" << std::endl;
+            return 2;
+        }
+        args.push_back(arg);
+    }
+    if (!args.empty() && args[0] == "--check") {
         // In this simplified version the presence of the executable implies
         // that the LiDAR software stack is available.
         return 0;
     }
-    if (argc < 2) {
-        std::cerr << "usage: " << argv[0] << " <output.laz>" << std::endl;
+    if (!args.empty() && args[0] == "--server") {
+        return runServer();
+    }
+    if (args.empty()) {
+        std::cerr << "usage: " << argv[0] << " [--check | --server | <output.laz>]"
+                  << std::endl;
         return 1;
     }
-    std::string filename = argv[1];
+    std::string filename = args[0];
     mandeye::LivoxPointsBufferPtr buffer = std::make_shared<mandeye::LivoxPointsBuffer>();
     auto stats = mandeye::saveLaz(filename, buffer);
     if (!stats) {
@@ -12,7 +12,7 @@ nlohmann::json mandeye::LazStats::produceStatus() const {
 	status["decimation_step"] = m_decimationStep;
 	return status;
 }
-std::optional<mandeye::LazStats> mandeye::saveLaz(const std::string& filename, LivoxPointsBufferPtr buffer)
+std::optional<mandeye::LazStats> mandeye::saveLaz(const std::string& filename, LivoxPointsBufferPtr buffer, int minDecimationStep)
 {
 	mandeye::LazStats stats;
 	stats.m_filename = filename;
@@ -68,6 +68,9 @@ std::optional<mandeye::LazStats> mandeye::saveLaz(const std::string& filename, L
 	if(buffer->size() > 4000000){
 		step = ceil((double)buffer->size() / 2000000.0);
 	}
+	if(step < minDecimationStep){
+		step = minDecimationStep;
+	}
 	if(step < 1){
 		step = 1;
 	}
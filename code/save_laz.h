@@ -16,5 +16,7 @@ struct LazStats {
 
 };
 
-std::optional<LazStats> saveLaz(const std::string& filename, LivoxPointsBufferPtr buffer);
+// ``minDecimationStep`` raises the heuristic decimation step, e.g. when the
+// storage cannot keep up with full-density frames.
+std::optional<LazStats> saveLaz(const std::string& filename, LivoxPointsBufferPtr buffer, int minDecimationStep = 1);
 }
\ No newline at end of file
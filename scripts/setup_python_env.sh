@@ -12,7 +12,5 @@ fi
 # shellcheck source=/dev/null
 source "$PROJECT_ROOT/.venv/bin/activate"
 pip install --upgrade pip
-if ! pip show Flask >/dev/null 2>&1; then
-  pip install Flask
-fi
+pip install -r "$PROJECT_ROOT/requirements.txt"
 
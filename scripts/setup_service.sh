@@ -1,5 +1,6 @@
 #!/usr/bin/env bash
-# Create and enable a systemd service for the Tecscanner Flask app.
+# Create and enable the systemd services for the Tecscanner control process
+# and web workers.
 set -e
 
 SERVICE_NAME=tecscanner
@@ -17,17 +18,43 @@ if [ ! -f "$PYTHON_BIN" ]; then
   PYTHON_BIN=$(command -v python3)
 fi
 
-sudo tee /etc/systemd/system/${SERVICE_NAME}.service > /dev/null <<SERVICE
+VENV_BIN="$(dirname "$PYTHON_BIN")"
+WEB_WORKERS=${WEB_WORKERS:-2}
+CONTROL_SOCKET=/run/${SERVICE_NAME}/control.sock
+
+# The control process owns the recorder; the HTTP workers are stateless and
+# reach it over a Unix socket.
+sudo tee /etc/systemd/system/${SERVICE_NAME}-control.service > /dev/null <<SERVICE
 [Unit]
-Description=Tecscanner Flask Service
+Description=Tecscanner recorder control process
 After=network.target
 
 [Service]
 Type=simple
 User=${USER_NAME}
 WorkingDirectory=${PROJECT_ROOT}
-Environment=FLASK_APP=webapp
-ExecStart=${PYTHON_BIN} -m flask run --host=0.0.0.0 --port=5000
+RuntimeDirectory=${SERVICE_NAME}
+RuntimeDirectoryPreserve=yes
+Environment=LIVOX_CONTROL_SOCKET=${CONTROL_SOCKET}
+ExecStart=${PYTHON_BIN} -m webapp.control_process
+Restart=on-failure
+
+[Install]
+WantedBy=multi-user.target
+SERVICE
+
+sudo tee /etc/systemd/system/${SERVICE_NAME}.service > /dev/null <<SERVICE
+[Unit]
+Description=Tecscanner web service
+After=network.target ${SERVICE_NAME}-control.service
+Wants=${SERVICE_NAME}-control.service
+
+[Service]
+Type=simple
+User=${USER_NAME}
+WorkingDirectory=${PROJECT_ROOT}
+Environment=LIVOX_CONTROL_SOCKET=${CONTROL_SOCKET}
+ExecStart=${VENV_BIN}/gunicorn --workers ${WEB_WORKERS} --worker-class gthread --threads 8 --bind 0.0.0.0:5000 webapp:app
 Restart=on-failure
 
 [Install]
@@ -35,7 +62,7 @@ WantedBy=multi-user.target
 SERVICE
 
 sudo systemctl daemon-reload
-sudo systemctl enable ${SERVICE_NAME}
-sudo systemctl start ${SERVICE_NAME}
+sudo systemctl enable ${SERVICE_NAME}-control ${SERVICE_NAME}
+sudo systemctl start ${SERVICE_NAME}-control ${SERVICE_NAME}
 
 echo "Service ${SERVICE_NAME} installed and started."
@@ -0,0 +1,49 @@
+"""Tests for the background log writer."""
+
+import io
+import logging
+import os
+import queue
+import time
+
+from webapp.logging_config import LogWriter
+
+
+def _record(message: str) -> logging.LogRecord:
+    return logging.LogRecord("test", logging.INFO, __file__, 1, message, None, None)
+
+
+def _wait_for(condition, timeout: float = 5.0) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def test_failed_rotation_falls_back_to_console(tmp_path, monkeypatch):
+    stream = io.StringIO()
+    q: "queue.Queue" = queue.Queue()
+    writer = LogWriter(
+        q, logging.Formatter("%(message)s"), stream=stream, flush_interval=0.01, max_bytes=64
+    )
+    path = tmp_path / "tecscanner.log"
+    writer.set_file(path)
+    q.put(_record("first " + "x" * 40))
+    assert _wait_for(lambda: path.exists() and path.stat().st_size > 0)
+
+    def fail(src, dst):
+        raise OSError(5, "Input/output error")
+
+    monkeypatch.setattr(os, "replace", fail)
+    q.put(_record("second " + "x" * 40))
+    assert _wait_for(lambda: writer.path is None)
+    assert "cannot rotate log file" in stream.getvalue()
+
+    # The writer thread survives and keeps logging to the console
+    q.put(_record("after the failure"))
+    assert _wait_for(lambda: "after the failure" in stream.getvalue())
+    assert writer._thread.is_alive()
+    writer.stop()
+    assert "after the failure" not in path.read_text(encoding="utf-8")
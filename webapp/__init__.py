@@ -1,15 +1,98 @@
-from flask import Flask
+from flask import Flask, Response, request, stream_with_context
+from werkzeug.wsgi import wrap_file
+import logging
+import multiprocessing
 import os
+import time
+from . import downloads, preview
+from .control import ControlClient, ControlError
+from .devices import DEVICE_NAME_RE
+from .events import EventBroker
 from .logging_config import configure_logging
 from .recording_manager import RecordingManager
 
-# Set up application-wide logging before creating components that may emit logs.
-configure_logging()
+# With a control socket configured the recorder lives in the separate control
+# process (``python -m webapp.control_process``) and this process is a
+# stateless HTTP worker; otherwise everything runs in-process as before.
+CONTROL_SOCKET = os.getenv('LIVOX_CONTROL_SOCKET')
 
-manager = RecordingManager()
+# Merge decoder processes (see webapp.merge) import the package only for its
+# decoding functions; they must not build a recorder of their own.
+DECODER_PROCESS = multiprocessing.parent_process() is not None
+
+# Set up application-wide logging before creating components that may emit
+# logs.  The log file on the drive belongs to the control process when there
+# is one; HTTP workers log to the console and /logs only.
+configure_logging(file_logging=not CONTROL_SOCKET and not DECODER_PROCESS)
+
+if DECODER_PROCESS:
+    manager = None
+elif CONTROL_SOCKET:
+    manager = ControlClient(CONTROL_SOCKET, timeout=float(os.getenv('LIVOX_CONTROL_TIMEOUT', '30')))
+else:
+    manager = RecordingManager()
+
+# One producer (the status publisher) feeds every /events client.  Each
+# stream occupies a worker thread, so only EVENTS_MAX_CLIENTS streams are
+# served per worker (gthread runs 8 threads per worker).
+events = EventBroker(
+    max_rate=float(os.getenv('EVENTS_MAX_RATE', '4')),
+    max_clients=int(os.getenv('EVENTS_MAX_CLIENTS', '4')),
+)
+EVENTS_RETRY_AFTER = int(os.getenv('EVENTS_RETRY_AFTER', '30'))
+if manager is not None:
+    manager.add_status_listener(events.publish)
 
 app = Flask(__name__)
 
+RECORDINGS_PAGE_SIZE = int(os.getenv('RECORDINGS_PAGE_SIZE', '50'))
+
+# /start and /stop wait this long for their operation before answering 202
+# with the operation to poll at /operations/<id>.
+START_RESPONSE_TIMEOUT = float(os.getenv('START_RESPONSE_TIMEOUT', '10'))
+STOP_RESPONSE_TIMEOUT = float(os.getenv('STOP_RESPONSE_TIMEOUT', '1'))
+
+START_ERRORS = {
+    'no_storage': ('no external storage', 400),
+    'storage_full': ('external storage full', 400),
+    # A recording is already running
+    'already_active': ('already recording', 409),
+    'no_lidar': ('no lidar detected', 400),
+    'initializing': ('still starting up', 503),
+    'no_recorder': ('recorder unavailable', 500),
+    # The external recorder process could not be started
+    'spawn_failed': ('failed to start recorder', 500),
+}
+
+# Downloads are paced while recording so they never starve the capture path,
+# and while the governor holds back background work they are slowed down.
+# New downloads are refused while the governor holds them (see
+# webapp.governor) rather than parking a worker thread until it resumes.
+download_limiter = downloads.RateLimiter(
+    float(os.getenv('DOWNLOAD_RATE_LIMIT_KBPS', '2048')) * 1024
+)
+DOWNLOAD_RETRY_AFTER = int(os.getenv('DOWNLOAD_RETRY_AFTER', '30'))
+
+def _upload_job(snap):
+    return ((snap.get('governor') or {}).get('jobs') or {}).get('upload')
+
+def _downloads_paced():
+    """Whether downloads are paced; follows the governor's upload rate."""
+    snap = manager.status_snapshot().data
+    upload = _upload_job(snap)
+    if upload:
+        download_limiter.rate = upload['rate']
+    state = (snap.get('governor') or {}).get('state', 'normal')
+    return bool(snap.get('recording')) or state != 'normal'
+
+def _downloads_held():
+    upload = _upload_job(manager.status_snapshot().data)
+    return bool(upload) and not upload['allowed']
+@app.errorhandler(ControlError)
+def control_unavailable(e):
+    app.logger.warning('%s', e)
+    return {'status': 'control process unavailable'}, 503
+
 @app.route('/')
 def index():
     from flask import render_template
@@ -23,33 +106,282 @@ def index():
 
 @app.post('/start')
 def start_recording():
-    started, error = manager.start_recording()
-    if started:
-        return {'status': 'recording started'}
-    if error == 'no_storage':
-        return {'status': 'no external storage'}, 400
-    if error == 'already_active':
-        # A recording is already running
-        return {'status': 'already recording'}, 409
-    if error == 'no_lidar':
-        return {'status': 'no lidar detected'}, 400
-    if error == 'no_recorder':
-        return {'status': 'recorder unavailable'}, 500
-    if error == 'spawn_failed':
-        # The external recorder process could not be started
-        return {'status': 'failed to start recorder'}, 500
-    return {'status': 'unknown error'}, 500
+    op = manager.request_start()
+    op = manager.wait_operation(op['id'], START_RESPONSE_TIMEOUT)
+    if not op['finished']:
+        return {'status': 'starting', 'operation': op}, 202
+    if op['state'] == 'done':
+        return {'status': 'recording started', 'operation': op}
+    status, code = START_ERRORS.get(op['error'], ('unknown error', 500))
+    return {'status': status, 'operation': op}, code
 
 @app.post('/stop')
 def stop_recording():
-    if manager.stop_recording():
-        return {'status': 'recording stopped'}
-    return {'status': 'not recording'}, 400
+    """Stop the recording, answering within ``STOP_RESPONSE_TIMEOUT``.
+
+    ``elapsed`` reports how long the request took; a 202 response carries
+    the still running stop operation.
+    """
+    t0 = time.perf_counter()
+    op = manager.request_stop()
+    if op is None:
+        return {'status': 'not recording'}, 400
+    op = manager.wait_operation(op['id'], STOP_RESPONSE_TIMEOUT)
+    elapsed = round(time.perf_counter() - t0, 3)
+    if not op['finished']:
+        return {'status': op['state'], 'operation': op, 'elapsed': elapsed}, 202
+    return {'status': 'recording stopped', 'operation': op, 'elapsed': elapsed}
+
+@app.get('/operations/<op_id>')
+def operation(op_id):
+    """State of a start or stop operation; ``?wait=<s>`` (at most 10) waits
+    for it to finish."""
+    try:
+        wait = min(max(float(request.args.get('wait', 0)), 0), 10)
+    except ValueError:
+        return {'status': 'invalid wait'}, 400
+    op = manager.wait_operation(op_id, wait)
+    if op is None:
+        return {'status': 'unknown operation'}, 404
+    return op
 
 @app.get('/status')
 def status():
-    return manager.status()
+    # Served from the background-published snapshot; the recording lock is
+    # never taken here.
+    snap = manager.status_snapshot()
+    if request.if_none_match.contains(snap.etag):
+        response = Response(status=304)
+    else:
+        response = Response(snap.body, mimetype='application/json')
+    response.set_etag(snap.etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+@app.get('/metrics')
+def metrics():
+    return Response(manager.render_metrics(), mimetype='text/plain; version=0.0.4')
+
+@app.get('/events')
+def status_events():
+    if not events.acquire():
+        # Too many open streams; the dashboard polls /status meanwhile.
+        response = Response(status=503)
+        response.headers['Retry-After'] = str(EVENTS_RETRY_AFTER)
+        return response
+    try:
+        stream = events.stream(manager.status_snapshot())
+    except BaseException:
+        events.release()
+        raise
+    response = Response(stream_with_context(stream), mimetype='text/event-stream')
+    # Runs when the server closes the response, also for clients that
+    # disconnect before the first event.
+    response.call_on_close(events.release)
+    response.headers['Cache-Control'] = 'no-cache'
+    # Disable proxy buffering (nginx) so events are delivered immediately
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
 
 @app.get('/recordings')
 def recordings():
-    return {'recordings': manager.list_recordings()}
+    """Paginated session listing.
+
+    Query parameters: ``limit``, ``cursor`` (``next_cursor`` of the previous
+    page), ``since``/``until`` (ISO timestamps bounding the start time),
+    ``error`` (``true``/``false``) and ``order`` (``asc``/``desc``).
+    """
+    args = request.args
+    try:
+        limit = min(int(args.get('limit', RECORDINGS_PAGE_SIZE)), 500)
+    except ValueError:
+        return {'status': 'invalid limit'}, 400
+    error = args.get('error')
+    if error is not None:
+        error = error.lower() in ('1', 'true', 'yes')
+    order = args.get('order', 'desc')
+    if order not in ('asc', 'desc'):
+        return {'status': 'invalid order'}, 400
+    return manager.query_recordings(
+        limit=limit,
+        cursor=args.get('cursor'),
+        since=args.get('since'),
+        until=args.get('until'),
+        error=error,
+        order=order,
+    )
+
+@app.get('/logs')
+def logs():
+    """Recent log records of the recording process, oldest first.
+
+    Query parameters: ``level`` (minimum level name, default ``INFO``),
+    ``limit`` (at most 1000) and ``since`` (the ``next`` value of a previous
+    response, to fetch only newer records).
+    """
+    args = request.args
+    level = logging.getLevelName(args.get('level', 'INFO').upper())
+    if not isinstance(level, int):
+        return {'status': 'invalid level'}, 400
+    try:
+        limit = min(int(args.get('limit', 200)), 1000)
+        since = int(args['since']) if args.get('since') else None
+    except ValueError:
+        return {'status': 'invalid limit or since'}, 400
+    return manager.recent_logs(level=level, limit=limit, since=since)
+
+@app.post('/verify')
+def verify_all():
+    """Queue every session on the drive for checksum verification."""
+    return {'queued': manager.verify_session()}, 202
+
+@app.post('/recordings/<name>/verify')
+def verify_session(name):
+    """Queue one session for checksum verification; see ``/status``."""
+    session, error = _download_session(name)
+    if error:
+        return error
+    if not manager.verify_session(name):
+        return {'status': 'verification already queued'}, 409
+    return {'status': 'verification queued'}, 202
+
+@app.post('/recordings/<name>/merge')
+def merge_session(name):
+    """Queue a session to be merged into ``merged.laz``; see ``/status``."""
+    session, error = _download_session(name)
+    if error:
+        return error
+    if not manager.merge_session(name):
+        return {'status': 'merge already queued'}, 409
+    return {'status': 'merge queued'}, 202
+
+def _download_session(name):
+    status = manager.status()
+    if name == status.get('current_session'):
+        return None, ({'status': 'session is still recording'}, 409)
+    session = downloads.session_dir(status.get('output_dir'), name)
+    if session is None:
+        return None, ({'status': 'unknown session'}, 404)
+    return session, None
+
+@app.get('/recordings/<name>/files')
+def session_files(name):
+    session, error = _download_session(name)
+    if error:
+        return error
+    members = downloads.session_members(session)
+    return {'files': [{'name': m.name, 'size': m.size} for m in members]}
+
+@app.get('/recordings/<name>/files/<path:filename>')
+def download_file(name, filename):
+    """Serve one file of a session, honouring ``Range``/``If-Range``."""
+    session, error = _download_session(name)
+    if error:
+        return error
+    path = downloads.session_file(session, filename)
+    if path is None:
+        return {'status': 'unknown file'}, 404
+    if _downloads_held():
+        return {'status': 'downloads paused'}, 503, {'Retry-After': str(DOWNLOAD_RETRY_AFTER)}
+    st = path.stat()
+    etag = downloads.file_etag(st)
+    span, satisfiable = downloads.byte_range(request.range, request.if_range, etag, st.st_size)
+    if not satisfiable:
+        response = Response(status=416)
+        response.headers['Content-Range'] = f'bytes */{st.st_size}'
+        return response
+    start, stop = span or (0, st.st_size)
+    length = stop - start
+    if _downloads_paced():
+        body = downloads.throttle(
+            downloads.read_range(path, start, length),
+            download_limiter,
+            _downloads_paced,
+        )
+    elif span is None or request.environ.get('SERVER_SOFTWARE', '').startswith('gunicorn'):
+        # Zero-copy: the server sends from the current offset up to
+        # Content-Length (gunicorn uses sendfile and honours the length)
+        f = open(path, 'rb')
+        f.seek(start)
+        body = wrap_file(request.environ, f)
+    else:
+        body = downloads.read_range(path, start, length)
+    response = Response(
+        body,
+        status=206 if span else 200,
+        mimetype='application/octet-stream',
+        direct_passthrough=True,
+    )
+    response.content_length = length
+    response.headers['Accept-Ranges'] = 'bytes'
+    response.headers['Content-Disposition'] = f'attachment; filename="{path.name}"'
+    if span:
+        response.headers['Content-Range'] = f'bytes {start}-{stop - 1}/{st.st_size}'
+    response.set_etag(etag)
+    response.last_modified = st.st_mtime
+    return response
+
+@app.get('/recordings/<name>/preview')
+def session_preview(name):
+    """Downsampled point cloud of a session (also while it is recording).
+
+    The body is the binary ``.preview.bin`` format described in
+    :mod:`webapp.preview`.  ``?device=<name>`` selects one sensor of a
+    multi-LiDAR session.
+    """
+    session = downloads.session_dir(manager.status().get('output_dir'), name)
+    if session is None:
+        return {'status': 'unknown session'}, 404
+    device = request.args.get('device')
+    if device is not None:
+        if not DEVICE_NAME_RE.match(device):
+            return {'status': 'invalid device'}, 400
+        session = session / device
+    path = session / preview.PREVIEW_NAME
+    try:
+        st = path.stat()
+    except OSError:
+        return {'status': 'no preview'}, 404
+    etag = downloads.file_etag(st)
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = Response(path.read_bytes(), mimetype='application/octet-stream')
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+@app.get('/recordings/<name>/download')
+def download_session(name):
+    """Stream a whole session as ``tar`` (default) or ``zip``.
+
+    ``expand=1`` unpacks a ``session.tsc`` container into individual files.
+    """
+    session, error = _download_session(name)
+    if error:
+        return error
+    fmt = request.args.get('format', 'tar')
+    if fmt not in ('tar', 'zip'):
+        return {'status': 'invalid format'}, 400
+    if _downloads_held():
+        return {'status': 'downloads paused'}, 503, {'Retry-After': str(DOWNLOAD_RETRY_AFTER)}
+    expand = request.args.get('expand', '').lower() in ('1', 'true', 'yes')
+    try:
+        members = downloads.session_members(session, expand=expand)
+    except (OSError, ValueError) as e:
+        app.logger.warning('Cannot list session %s: %s', name, e)
+        return {'status': 'session unreadable'}, 500
+    if fmt == 'tar':
+        chunks = downloads.stream_tar(members, name)
+        length = downloads.tar_size(members, name)
+        mimetype = 'application/x-tar'
+    else:
+        chunks = downloads.stream_zip(members, name)
+        length = None
+        mimetype = 'application/zip'
+    body = downloads.throttle(chunks, download_limiter, _downloads_paced)
+    response = Response(stream_with_context(body), mimetype=mimetype, direct_passthrough=True)
+    if length is not None:
+        response.content_length = length
+    response.headers['Content-Disposition'] = f'attachment; filename="{name}.{fmt}"'
+    return response
@@ -0,0 +1,376 @@
+"""Disk-throughput-aware admission control for recording sessions.
+
+USB sticks differ wildly in sustained write speed and a session can easily
+outgrow the free space left on one.  :class:`AdmissionController` measures,
+per session, how fast the drive accepts data and how fast the session
+consumes space, predicts the time left before the drive is full and decides
+how the recorder should degrade when throughput or space run short:
+
+``normal``
+    everything is written.
+``aux_paused``
+    auxiliary files and CSV exports are skipped so the drive only has to
+    absorb the LAZ frames.
+``decimating``
+    additionally the recorder is asked to keep fewer points per frame.
+``stopping``
+    the session is stopped cleanly with a recorded reason
+    (``storage_full`` or ``disk_too_slow``).
+
+Independently of these levels the controller picks the frame format.  LAZ
+compression costs CPU time on every frame; when ``save_laz`` reports a save
+time above ``las_save_seconds`` or the load average per CPU exceeds
+``las_load``, frames are captured as uncompressed LAS and compressed after
+the session (see :mod:`webapp.recompress`).  After ``las_hold_seconds``
+LAZ capture is tried again.
+
+Like ``benchmarkWriteSpeed`` in ``FileSystemClient`` the drive is
+benchmarked with a short synchronous write.  The benchmark runs in the
+background the first time a session begins on a drive and its result is
+cached per mounted file system, so starting a session never waits for it.
+The estimate is then refined from writes that actually reach the drive: the
+save times of uncompressed LAS frames (LAZ save times are dominated by
+compression) and the batches moved by :mod:`webapp.staging`.
+"""
+
+import logging
+import os
+import shutil
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Deque, Dict, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class AdmissionPolicy:
+    """Thresholds used by :class:`AdmissionController`."""
+
+    # Free space that must remain on the drive; below it the session stops
+    reserve_bytes: int = 200 * 1024 * 1024
+    # Predicted time left below which auxiliary exports are paused
+    pause_aux_seconds: float = 600.0
+    # Predicted time left below which decimation is increased
+    decimate_seconds: float = 300.0
+    # Drive throughput divided by the session data rate; below the first
+    # value auxiliary exports are paused, below the second decimation is
+    # increased
+    pause_aux_headroom: float = 1.5
+    decimate_headroom: float = 1.1
+    # Largest decimation step requested from the recorder; once reached and
+    # the drive still cannot keep up the session is stopped
+    max_decimation: int = 8
+    # Size of the synchronous write benchmark at session start (0 disables)
+    benchmark_bytes: int = 8 * 1024 * 1024
+    # LAZ save time per frame and 1-minute load average per CPU above which
+    # frames are captured as LAS (0 disables either trigger), and how long
+    # LAS capture is kept before LAZ is tried again
+    las_save_seconds: float = 1.0
+    las_load: float = 1.5
+    las_hold_seconds: float = 60.0
+
+    @classmethod
+    def from_env(cls) -> "AdmissionPolicy":
+        return cls(
+            reserve_bytes=int(float(os.getenv("ADMISSION_RESERVE_MB", "200")) * 1024 * 1024),
+            pause_aux_seconds=float(os.getenv("ADMISSION_PAUSE_AUX_SECONDS", "600")),
+            decimate_seconds=float(os.getenv("ADMISSION_DECIMATE_SECONDS", "300")),
+            pause_aux_headroom=float(os.getenv("ADMISSION_PAUSE_AUX_HEADROOM", "1.5")),
+            decimate_headroom=float(os.getenv("ADMISSION_DECIMATE_HEADROOM", "1.1")),
+            max_decimation=int(os.getenv("ADMISSION_MAX_DECIMATION", "8")),
+            benchmark_bytes=int(float(os.getenv("ADMISSION_BENCHMARK_MB", "8")) * 1024 * 1024),
+            las_save_seconds=float(os.getenv("ADMISSION_LAS_SAVE_SECONDS", "1")),
+            las_load=float(os.getenv("ADMISSION_LAS_LOAD", "1.5")),
+            las_hold_seconds=float(os.getenv("ADMISSION_LAS_HOLD_SECONDS", "60")),
+        )
+
+
+@dataclass(frozen=True)
+class Decision:
+    """What the capture loop should do after a frame."""
+
+    level: str
+    aux_paused: bool
+    decimation: int
+    stop_reason: Optional[str] = None
+    # Capture the next frame as LAZ (``False``: uncompressed LAS)
+    compress: bool = True
+
+
+def benchmark_write_speed(directory: Path, size: int, block: int = 1024 * 1024) -> Optional[float]:
+    """Write ``size`` bytes to ``directory`` with ``fsync`` and return bytes/s."""
+    if size <= 0:
+        return None
+    path = directory / ".write_benchmark"
+    data = os.urandom(min(block, size))
+    try:
+        t0 = time.perf_counter()
+        with open(path, "wb", buffering=0) as f:
+            written = 0
+            while written < size:
+                written += f.write(data[: size - written])
+            os.fsync(f.fileno())
+        elapsed = time.perf_counter() - t0
+    except OSError as e:
+        logger.warning("Write benchmark on %s failed: %s", directory, e)
+        return None
+    finally:
+        try:
+            path.unlink()
+        except OSError:
+            pass
+    return size / elapsed if elapsed > 0 else None
+
+
+def mount_key(directory: Path) -> Optional[Tuple[int, int]]:
+    """Identify the file system holding ``directory`` (device and size)."""
+    try:
+        st = os.stat(directory)
+        vfs = os.statvfs(directory)
+    except OSError:
+        return None
+    # The size tells apart two sticks mounted in turn on the same device node
+    return st.st_dev, vfs.f_blocks * vfs.f_frsize
+
+
+def load_per_cpu() -> Optional[float]:
+    """1-minute load average divided by the number of CPUs."""
+    try:
+        return os.getloadavg()[0] / (os.cpu_count() or 1)
+    except OSError:
+        return None
+
+
+class AdmissionController:
+    """Track drive throughput and space for the active session."""
+
+    def __init__(self, policy: Optional[AdmissionPolicy] = None, window: float = 60.0):
+        self.policy = policy or AdmissionPolicy()
+        self.window = window
+        self._lock = threading.Lock()
+        self._directory: Optional[Path] = None
+        # (monotonic time, bytes used on the drive) samples
+        self._usage: Deque[Tuple[float, int]] = deque()
+        self._write_bps: Optional[float] = None
+        self.benchmark_bps: Optional[float] = None
+        # Session consumption rate; kept after a session for predictions
+        self._data_rate: Optional[float] = None
+        self._free: Optional[int] = None
+        self._level = "normal"
+        self._decimation = 1
+        self._stepped_at = 0.0
+        self._reason: Optional[str] = None
+        self._compress = True
+        self._las_since = 0.0
+        self._load: Optional[float] = None
+        # Write benchmark results per mounted file system (see mount_key)
+        self._benchmarks: Dict[Tuple[int, int], Optional[float]] = {}
+        self._benchmarking: Set[Tuple[int, int]] = set()
+
+    # ---- session lifecycle --------------------------------------------------
+    def admit(self, directory: Path) -> Optional[str]:
+        """Return a refusal reason if a session cannot start on ``directory``."""
+        try:
+            free = shutil.disk_usage(directory).free
+        except OSError:
+            return None
+        with self._lock:
+            self._free = free
+        if free <= self.policy.reserve_bytes:
+            return "storage_full"
+        return None
+
+    def begin(self, directory: Path) -> None:
+        """Reset the per-session state; benchmark the drive if not done yet."""
+        key = mount_key(directory)
+        with self._lock:
+            self._directory = directory
+            self._usage.clear()
+            self._write_bps = None
+            self._level = "normal"
+            self._decimation = 1
+            self._reason = None
+            self._compress = True
+            self.benchmark_bps = self._benchmarks.get(key) if key else None
+            start = (
+                key is not None
+                and self.policy.benchmark_bytes > 0
+                and key not in self._benchmarks
+                and key not in self._benchmarking
+            )
+            if start:
+                self._benchmarking.add(key)
+        if start:
+            threading.Thread(
+                target=self._benchmark, args=(directory, key), name="write-benchmark", daemon=True
+            ).start()
+
+    def _benchmark(self, directory: Path, key: Tuple[int, int]) -> None:
+        bps = benchmark_write_speed(directory, self.policy.benchmark_bytes)
+        with self._lock:
+            self._benchmarking.discard(key)
+            if bps:
+                self._benchmarks[key] = bps
+            if self._directory == directory:
+                self.benchmark_bps = bps
+        if bps:
+            logger.info("Drive write benchmark: %.1f MB/s", bps / (1024 * 1024))
+
+    def end(self) -> None:
+        with self._lock:
+            self._directory = None
+            self._level = "normal"
+            self._decimation = 1
+            self._compress = True
+
+    # ---- per frame ------------------------------------------------------------
+    def observe_write(self, size: int, seconds: float) -> None:
+        """Account for ``size`` bytes that took ``seconds`` to reach the drive."""
+        if seconds <= 0 or size <= 0:
+            return
+        bps = size / seconds
+        with self._lock:
+            self._write_bps = bps if self._write_bps is None else 0.8 * self._write_bps + 0.2 * bps
+
+    def observe_frame(
+        self, size: int, save_seconds: Optional[float] = None, compressed: bool = True
+    ) -> Decision:
+        """Account for a saved frame and return the policy to apply.
+
+        ``save_seconds`` is the recorder's save time.  With ``compressed``
+        it is mostly LAZ compression and only drives the frame format;
+        otherwise it is the time the frame took to be written.
+        """
+        now = time.monotonic()
+        load = load_per_cpu() if self.policy.las_load > 0 else None
+        with self._lock:
+            directory = self._directory
+        free = None
+        used = None
+        if directory is not None:
+            try:
+                usage = shutil.disk_usage(directory)
+                free, used = usage.free, usage.used
+            except OSError:
+                pass
+        if not compressed and save_seconds:
+            self.observe_write(size, save_seconds)
+        with self._lock:
+            if free is not None:
+                self._free = free
+                self._usage.append((now, used))
+                while len(self._usage) > 2 and self._usage[0][0] < now - self.window:
+                    self._usage.popleft()
+                t_first, used_first = self._usage[0]
+                if now - t_first >= 1.0:
+                    self._data_rate = max(0.0, (used - used_first) / (now - t_first))
+            self._load = load
+            self._choose_format(now, save_seconds if compressed else None, load)
+            return self._decide(now)
+
+    def _choose_format(self, now: float, laz_seconds: Optional[float], load: Optional[float]) -> None:
+        p = self.policy
+        busy = p.las_load > 0 and load is not None and load > p.las_load
+        if self._compress:
+            slow = p.las_save_seconds > 0 and laz_seconds is not None and laz_seconds > p.las_save_seconds
+            if slow or busy:
+                self._compress = False
+                self._las_since = now
+                logger.warning(
+                    "Capturing uncompressed LAS frames (save %s s, load %s per CPU)",
+                    None if laz_seconds is None else round(laz_seconds, 3),
+                    None if load is None else round(load, 2),
+                )
+        elif not busy and now - self._las_since >= p.las_hold_seconds:
+            self._compress = True
+            logger.info("Capturing LAZ frames again")
+
+    def _throughput(self) -> Optional[float]:
+        rates = [r for r in (self._write_bps, self.benchmark_bps) if r]
+        return min(rates) if rates else None
+
+    def _remaining(self) -> Optional[float]:
+        if self._free is None or not self._data_rate:
+            return None
+        return max(0.0, self._free - self.policy.reserve_bytes) / self._data_rate
+
+    def _decide(self, now: float) -> Decision:
+        p = self.policy
+        if self._level == "stopping":
+            return self._decision()
+        remaining = self._remaining()
+        throughput = self._throughput()
+        headroom = throughput / self._data_rate if throughput and self._data_rate else None
+
+        if self._free is not None and self._free <= p.reserve_bytes:
+            return self._stop("storage_full")
+        level = "normal"
+        if (remaining is not None and remaining < p.pause_aux_seconds) or (
+            headroom is not None and headroom < p.pause_aux_headroom
+        ):
+            level = "aux_paused"
+        if (remaining is not None and remaining < p.decimate_seconds) or (
+            headroom is not None and headroom < p.decimate_headroom
+        ):
+            level = "decimating"
+        if level == "decimating":
+            # Give each step one half usage window to show its effect
+            settled = self._level != "decimating" or now - self._stepped_at >= self.window / 2
+            if self._decimation < p.max_decimation:
+                if settled:
+                    self._decimation = min(p.max_decimation, self._decimation * 2)
+                    self._stepped_at = now
+                    logger.warning(
+                        "Storage running short (remaining %s s, headroom %s); decimation step %d",
+                        None if remaining is None else round(remaining),
+                        None if headroom is None else round(headroom, 2),
+                        self._decimation,
+                    )
+            elif settled and headroom is not None and headroom < 1.0:
+                # Even the coarsest frames arrive faster than the drive writes
+                return self._stop("disk_too_slow")
+        elif self._decimation > 1:
+            # Keep the reduced density for the rest of the session
+            level = "decimating"
+        if level != self._level:
+            logger.info("Admission policy: %s -> %s", self._level, level)
+        self._level = level
+        return self._decision()
+
+    def _stop(self, reason: str) -> Decision:
+        if self._level != "stopping":
+            logger.error("Stopping recording: %s", reason)
+        self._level = "stopping"
+        self._reason = reason
+        return self._decision()
+
+    def _decision(self) -> Decision:
+        return Decision(
+            level=self._level,
+            aux_paused=self._level != "normal",
+            decimation=self._decimation,
+            stop_reason=self._reason if self._level == "stopping" else None,
+            compress=self._compress,
+        )
+
+    # ---- reporting ------------------------------------------------------------
+    def status(self, free: Optional[int] = None) -> dict:
+        """Prediction and policy state for ``/status``."""
+        with self._lock:
+            if free is not None and self._directory is None:
+                self._free = free
+            remaining = self._remaining()
+            return {
+                "policy": self._level,
+                "reason": self._reason,
+                "decimation_step": self._decimation,
+                "write_bps": round(self._write_bps) if self._write_bps else None,
+                "benchmark_bps": round(self.benchmark_bps) if self.benchmark_bps else None,
+                "data_rate_bps": round(self._data_rate) if self._data_rate else None,
+                "remaining_seconds": round(remaining) if remaining is not None else None,
+                "frame_format": "laz" if self._compress else "las",
+                "load_per_cpu": round(self._load, 2) if self._load is not None else None,
+            }
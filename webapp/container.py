@@ -0,0 +1,347 @@
+"""Packed per-session container.
+
+Every captured frame normally produces eight small files (the LAZ frame, its
+CSV export and six auxiliary metadata files).  On FAT32/exFAT sticks the
+directory and allocation-table updates for those files cost more than the
+point data itself.  With ``SESSION_CONTAINER=1`` a session is instead written
+to a single append-only ``session.tsc`` file.
+
+Layout (all integers little endian)::
+
+    file header   "TSCN" u16 version u16 flags
+    record        "TSCR" u8 kind u16 name_len u64 data_len u32 crc32
+                  name (utf-8) data
+    ...
+    index record  kind=INDEX, data = JSON list of entries
+    footer        u64 offset of the index record, "TSCI"
+
+``crc32`` covers the name and the data.  A cleanly closed container is read
+through the trailing index.  If the index is missing (power loss, removed
+drive) the records are scanned from the start and everything up to the
+first torn or corrupt record is recovered.
+
+The module doubles as the export tool.  It only needs the standard library,
+so it can also be copied to a workstation and run on its own::
+
+    python webapp/container.py list session.tsc
+    python webapp/container.py export session.tsc [DEST]
+
+``export`` expands a container back into the mandeye_controller file layout
+(``frame_000000.laz``, ``lidar0000.sn``, ``status0000.json`` …).
+"""
+
+import argparse
+import json
+import logging
+import os
+import shutil
+import struct
+import sys
+import threading
+import zlib
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import BinaryIO, Dict, Iterator, List, Optional, Union
+
+logger = logging.getLogger(__name__)
+
+CONTAINER_NAME = "session.tsc"
+VERSION = 1
+
+KIND_FRAME = 1
+KIND_FILE = 2
+KIND_INDEX = 3
+KIND_NAMES = {KIND_FRAME: "frame", KIND_FILE: "file", KIND_INDEX: "index"}
+
+_FILE_HEAD = struct.Struct("<4sHH")
+_RECORD_HEAD = struct.Struct("<4sBHQI")
+_FOOTER = struct.Struct("<Q4s")
+_FILE_MAGIC = b"TSCN"
+_RECORD_MAGIC = b"TSCR"
+_FOOTER_MAGIC = b"TSCI"
+_COPY_BLOCK = 1024 * 1024
+
+
+class ContainerError(ValueError):
+    """Raised for files that are not session containers."""
+
+
+@dataclass
+class Entry:
+    name: str
+    kind: int
+    offset: int  # of the record data
+    size: int
+    crc: int
+
+
+class ContainerWriter:
+    """Append records to a session container.
+
+    Appends are serialised, so post-processing workers may add files
+    concurrently with the capture thread.  Data is flushed after every
+    record and ``fsync``\\ ed every ``sync_every`` records.
+    """
+
+    def __init__(self, path: Path, sync_every: int = 8):
+        self.path = Path(path)
+        self.sync_every = max(1, sync_every)
+        self._lock = threading.Lock()
+        self._entries: List[Entry] = []
+        self._unsynced = 0
+        exists = self.path.exists() and self.path.stat().st_size > 0
+        if exists:
+            # Continue a container whose writer died: keep what is intact
+            reader = ContainerReader(self.path)
+            self._entries = reader.entries
+            end = reader.data_end
+            self._f = open(self.path, "r+b")
+            self._f.truncate(end)
+            self._f.seek(end)
+        else:
+            self._f = open(self.path, "wb")
+            self._f.write(_FILE_HEAD.pack(_FILE_MAGIC, VERSION, 0))
+            self._f.flush()
+
+    @property
+    def closed(self) -> bool:
+        return self._f is None
+
+    def add_bytes(self, name: str, data: bytes, kind: int = KIND_FILE) -> Entry:
+        name_b = name.encode()
+        crc = zlib.crc32(data, zlib.crc32(name_b))
+        with self._lock:
+            return self._write(name, kind, len(data), crc, lambda f: f.write(data))
+
+    def add_file(self, name: str, src: Path, kind: int = KIND_FILE) -> Entry:
+        """Stream ``src`` into the container as record ``name``."""
+        name_b = name.encode()
+        with open(src, "rb") as s:
+            size = os.fstat(s.fileno()).st_size
+            crc = zlib.crc32(name_b)
+            while True:
+                block = s.read(_COPY_BLOCK)
+                if not block:
+                    break
+                crc = zlib.crc32(block, crc)
+
+            def copy(f: BinaryIO) -> None:
+                s.seek(0)
+                remaining = size
+                while remaining > 0:
+                    block = s.read(min(_COPY_BLOCK, remaining))
+                    if not block:
+                        raise OSError(f"{src} shrank while being packed")
+                    f.write(block)
+                    remaining -= len(block)
+
+            with self._lock:
+                return self._write(name, kind, size, crc, copy)
+
+    def _write(self, name: str, kind: int, size: int, crc: int, write_data) -> Entry:
+        if self._f is None:
+            raise ValueError("container is closed")
+        name_b = name.encode()
+        start = self._f.tell()
+        try:
+            self._f.write(_RECORD_HEAD.pack(_RECORD_MAGIC, kind, len(name_b), size, crc))
+            self._f.write(name_b)
+            offset = self._f.tell()
+            write_data(self._f)
+            self._f.flush()
+        except OSError:
+            # Drop the partial record so later appends stay readable
+            try:
+                self._f.seek(start)
+                self._f.truncate(start)
+            except OSError:
+                pass
+            raise
+        entry = Entry(name, kind, offset, size, crc)
+        self._entries.append(entry)
+        self._unsynced += 1
+        if self._unsynced >= self.sync_every:
+            os.fsync(self._f.fileno())
+            self._unsynced = 0
+        return entry
+
+    def close(self) -> None:
+        """Write the trailing index and close the file."""
+        with self._lock:
+            f = self._f
+            if f is None:
+                return
+            self._f = None
+            try:
+                index = json.dumps([asdict(e) for e in self._entries], separators=(",", ":")).encode()
+                name_b = b"index"
+                crc = zlib.crc32(index, zlib.crc32(name_b))
+                index_at = f.tell()
+                f.write(_RECORD_HEAD.pack(_RECORD_MAGIC, KIND_INDEX, len(name_b), len(index), crc))
+                f.write(name_b)
+                f.write(index)
+                f.write(_FOOTER.pack(index_at, _FOOTER_MAGIC))
+                f.flush()
+                os.fsync(f.fileno())
+            finally:
+                f.close()
+
+
+class ContainerReader:
+    """Random access to the records of a session container."""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.recovered = False
+        self.entries: List[Entry] = []
+        # End of the last intact data record (where a writer may continue)
+        self.data_end = _FILE_HEAD.size
+        with open(self.path, "rb") as f:
+            head = f.read(_FILE_HEAD.size)
+            if len(head) < _FILE_HEAD.size or head[:4] != _FILE_MAGIC:
+                raise ContainerError(f"{self.path} is not a session container")
+            if not self._load_index(f):
+                self.recovered = True
+                self._scan(f)
+        self._by_name: Dict[str, Entry] = {e.name: e for e in self.entries}
+
+    def _load_index(self, f: BinaryIO) -> bool:
+        size = os.fstat(f.fileno()).st_size
+        if size < _FILE_HEAD.size + _FOOTER.size:
+            return False
+        f.seek(size - _FOOTER.size)
+        index_at, magic = _FOOTER.unpack(f.read(_FOOTER.size))
+        if magic != _FOOTER_MAGIC or index_at >= size:
+            return False
+        f.seek(index_at)
+        record = _read_record_head(f)
+        if record is None or record[0] != KIND_INDEX:
+            return False
+        kind, name_b, length, crc = record
+        data = f.read(length)
+        if len(data) < length or zlib.crc32(data, zlib.crc32(name_b)) != crc:
+            return False
+        try:
+            self.entries = [Entry(**e) for e in json.loads(data)]
+        except (ValueError, TypeError):
+            return False
+        self.data_end = index_at
+        return True
+
+    def _scan(self, f: BinaryIO) -> None:
+        pos = _FILE_HEAD.size
+        f.seek(pos)
+        while True:
+            record = _read_record_head(f)
+            if record is None:
+                break
+            kind, name_b, length, crc = record
+            offset = f.tell()
+            check = zlib.crc32(name_b)
+            remaining = length
+            while remaining > 0:
+                block = f.read(min(_COPY_BLOCK, remaining))
+                if not block:
+                    break
+                check = zlib.crc32(block, check)
+                remaining -= len(block)
+            if remaining or check != crc:
+                break
+            if kind == KIND_INDEX:
+                break
+            self.entries.append(Entry(name_b.decode(errors="replace"), kind, offset, length, crc))
+            pos = f.tell()
+        self.data_end = pos
+        logger.warning("Recovered %d records from unfinished container %s", len(self.entries), self.path)
+
+    def get(self, name: str) -> Optional[Entry]:
+        return self._by_name.get(name)
+
+    def frames(self) -> List[Entry]:
+        # Post-processing workers may pack frames out of capture order
+        return sorted((e for e in self.entries if e.kind == KIND_FRAME), key=lambda e: e.name)
+
+    def read(self, entry: Union[Entry, str], length: Optional[int] = None) -> bytes:
+        """Return the data of ``entry`` (or its first ``length`` bytes)."""
+        if isinstance(entry, str):
+            entry = self._by_name[entry]
+        with open(self.path, "rb") as f:
+            f.seek(entry.offset)
+            return f.read(entry.size if length is None else min(length, entry.size))
+
+    def iter_data(self, entry: Entry) -> Iterator[bytes]:
+        with open(self.path, "rb") as f:
+            f.seek(entry.offset)
+            remaining = entry.size
+            while remaining > 0:
+                block = f.read(min(_COPY_BLOCK, remaining))
+                if not block:
+                    raise ContainerError(f"{self.path} is truncated")
+                remaining -= len(block)
+                yield block
+
+    def export(self, dest: Path, overwrite: bool = False) -> int:
+        """Expand every record into ``dest``; returns the number of files."""
+        dest = Path(dest)
+        dest.mkdir(parents=True, exist_ok=True)
+        count = 0
+        for entry in self.entries:
+            target = dest / Path(entry.name).name
+            if target.exists() and not overwrite:
+                continue
+            tmp = target.with_name(target.name + ".tmp")
+            with open(tmp, "wb") as out:
+                for block in self.iter_data(entry):
+                    out.write(block)
+            os.replace(tmp, target)
+            count += 1
+        return count
+
+
+def _read_record_head(f: BinaryIO):
+    raw = f.read(_RECORD_HEAD.size)
+    if len(raw) < _RECORD_HEAD.size:
+        return None
+    magic, kind, name_len, length, crc = _RECORD_HEAD.unpack(raw)
+    if magic != _RECORD_MAGIC:
+        return None
+    name_b = f.read(name_len)
+    if len(name_b) < name_len:
+        return None
+    return kind, name_b, length, crc
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Inspect or expand session containers")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_list = sub.add_parser("list", help="list the records of a container")
+    p_list.add_argument("container", type=Path)
+    p_export = sub.add_parser("export", help="expand a container into individual files")
+    p_export.add_argument("container", type=Path)
+    p_export.add_argument("dest", type=Path, nargs="?", help="defaults to the container's directory")
+    p_export.add_argument("--overwrite", action="store_true")
+    args = parser.parse_args(argv)
+
+    try:
+        reader = ContainerReader(args.container)
+    except (OSError, ContainerError) as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 1
+    if args.command == "list":
+        for e in reader.entries:
+            print(f"{KIND_NAMES.get(e.kind, e.kind):<6} {e.size:>12} {e.name}")
+        return 0
+    dest = args.dest or args.container.parent
+    dest.mkdir(parents=True, exist_ok=True)
+    free = shutil.disk_usage(dest).free
+    needed = sum(e.size for e in reader.entries)
+    if needed > free:
+        print(f"error: export needs {needed} bytes but only {free} are free", file=sys.stderr)
+        return 1
+    count = reader.export(dest, overwrite=args.overwrite)
+    print(f"exported {count} files to {dest}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
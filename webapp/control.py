@@ -0,0 +1,370 @@
+"""Single control process serving recorder state to HTTP workers.
+
+Only one process may own the :class:`~webapp.recording_manager.RecordingManager`
+(it drives the recorder, the LiDAR detector and the USB storage).  The
+control process runs it together with a :class:`ControlServer` listening on
+a Unix socket; any number of HTTP workers then talk to it through a
+:class:`ControlClient`, which mirrors the parts of the manager API the web
+application uses.
+
+The protocol is line-delimited JSON.  A request is
+``{"op": <name>, "args": {...}}`` and is answered with
+``{"ok": true, "result": ...}`` or ``{"ok": false, "error": <text>}``.  The
+``subscribe`` operation instead keeps the connection open and pushes every
+published status snapshot, so workers answer ``/status`` and ``/events``
+from a local copy without a round trip per request.
+
+Run the control process with::
+
+    LIVOX_CONTROL_SOCKET=/run/tecscanner/control.sock python -m webapp.control_process
+"""
+
+import json
+import logging
+import os
+import queue
+import socket
+import socketserver
+import threading
+import time
+import types
+from typing import Callable, List, Optional
+
+from .status import StatusSnapshot
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SOCKET = "/tmp/tecscanner-control.sock"
+
+
+class ControlError(RuntimeError):
+    """Raised by :class:`ControlClient` when the control process is unreachable."""
+
+
+def _snapshot_message(snapshot: StatusSnapshot) -> dict:
+    return {"body": snapshot.body.decode(), "etag": snapshot.etag, "published": snapshot.published}
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    server: "_UnixServer"
+
+    def handle(self) -> None:
+        for line in self.rfile:
+            try:
+                request = json.loads(line)
+                op = request["op"]
+                args = request.get("args") or {}
+            except (ValueError, KeyError, TypeError):
+                self._reply({"ok": False, "error": "bad request"})
+                return
+            if op == "subscribe":
+                self._subscribe()
+                return
+            try:
+                result = self.server.control.dispatch(op, args)
+            except KeyError:
+                reply = {"ok": False, "error": f"unknown operation {op!r}"}
+            except Exception as e:
+                logger.exception("Control operation %s failed", op)
+                reply = {"ok": False, "error": str(e)}
+            else:
+                reply = {"ok": True, "result": result}
+            if not self._reply(reply):
+                return
+
+    def _reply(self, message: dict) -> bool:
+        try:
+            self.wfile.write(json.dumps(message, default=str).encode() + b"\n")
+            self.wfile.flush()
+        except OSError:
+            return False
+        return True
+
+    def _subscribe(self) -> None:
+        # Only the latest snapshot matters, so a slow worker never makes the
+        # publisher wait and never accumulates a backlog.
+        pending: "queue.Queue[StatusSnapshot]" = queue.Queue(maxsize=1)
+
+        def offer(snapshot: StatusSnapshot) -> None:
+            try:
+                pending.get_nowait()
+            except queue.Empty:
+                pass
+            try:
+                pending.put_nowait(snapshot)
+            except queue.Full:
+                pass
+
+        control = self.server.control
+        control.add_subscriber(offer)
+        try:
+            offer(control.manager.status_snapshot())
+            while not control.stopping:
+                try:
+                    snapshot = pending.get(timeout=1.0)
+                except queue.Empty:
+                    continue
+                if not self._reply(_snapshot_message(snapshot)):
+                    break
+        finally:
+            control.remove_subscriber(offer)
+
+
+class _UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+    control: "ControlServer"
+
+
+class ControlServer:
+    """Expose a :class:`RecordingManager` on a Unix socket."""
+
+    def __init__(self, manager, path: str = DEFAULT_SOCKET):
+        self.manager = manager
+        self.path = path
+        self.stopping = False
+        self._subscribers: List[Callable[[StatusSnapshot], None]] = []
+        self._sub_lock = threading.Lock()
+        self._server: Optional[_UnixServer] = None
+        self._thread: Optional[threading.Thread] = None
+        manager.add_status_listener(self._publish)
+
+    # ---- subscribers --------------------------------------------------------
+    def add_subscriber(self, callback: Callable[[StatusSnapshot], None]) -> None:
+        with self._sub_lock:
+            self._subscribers.append(callback)
+
+    def remove_subscriber(self, callback: Callable[[StatusSnapshot], None]) -> None:
+        with self._sub_lock:
+            if callback in self._subscribers:
+                self._subscribers.remove(callback)
+
+    def _publish(self, snapshot: StatusSnapshot) -> None:
+        with self._sub_lock:
+            subscribers = list(self._subscribers)
+        for callback in subscribers:
+            callback(snapshot)
+
+    # ---- requests -------------------------------------------------------------
+    def dispatch(self, op: str, args: dict):
+        m = self.manager
+        if op == "start":
+            started, error = m.start_recording()
+            return {"started": started, "error": error}
+        if op == "stop":
+            return m.stop_recording()
+        if op == "request_start":
+            return m.request_start()
+        if op == "request_stop":
+            return m.request_stop()
+        if op == "operation":
+            return m.wait_operation(**args)
+        if op == "status":
+            return _snapshot_message(m.status_snapshot())
+        if op == "metrics":
+            return m.render_metrics()
+        if op == "list_recordings":
+            return m.list_recordings()
+        if op == "query_recordings":
+            return m.query_recordings(**args)
+        if op == "logs":
+            return m.recent_logs(**args)
+        if op == "verify":
+            return m.verify_session(**args)
+        if op == "merge":
+            return m.merge_session(**args)
+        raise KeyError(op)
+
+    # ---- lifecycle ------------------------------------------------------------
+    def start(self) -> None:
+        if self._server is not None:
+            return
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._server = _UnixServer(self.path, _Handler)
+        self._server.control = self
+        os.chmod(self.path, 0o660)
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, name="control-server", daemon=True
+        )
+        self._thread.start()
+        logger.info("Control server listening on %s", self.path)
+
+    def stop(self) -> None:
+        self.stopping = True
+        server = self._server
+        self._server = None
+        if server is None:
+            return
+        server.shutdown()
+        server.server_close()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+
+
+class ControlClient:
+    """Worker-side proxy for the manager owned by the control process.
+
+    Provides ``start_recording``, ``stop_recording``, ``request_start``,
+    ``request_stop``, ``wait_operation``, ``status``,
+    ``status_snapshot``, ``render_metrics``, ``list_recordings``,
+    ``query_recordings``, ``recent_logs`` and ``add_status_listener`` with the same
+    signatures as :class:`~webapp.recording_manager.RecordingManager`.
+    Requests use a fresh connection each, so a slow operation in one thread
+    never holds up another.  Methods raise :class:`ControlError` when the
+    control process cannot be reached.
+    """
+
+    def __init__(self, path: str = DEFAULT_SOCKET, timeout: float = 30.0):
+        self.path = path
+        self.timeout = timeout
+        self._snapshot: Optional[StatusSnapshot] = None
+        self._version = 0
+        self._cond = threading.Condition()
+        self._listeners: List[Callable[[StatusSnapshot], None]] = []
+        self._thread: Optional[threading.Thread] = None
+        self._closed = False
+
+    # ---- requests -------------------------------------------------------------
+    def _connect(self, timeout: Optional[float]) -> socket.socket:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(timeout)
+        try:
+            sock.connect(self.path)
+        except OSError as e:
+            sock.close()
+            raise ControlError(f"control process unavailable: {e}") from e
+        return sock
+
+    def _call(self, op: str, **args):
+        sock = self._connect(self.timeout)
+        try:
+            with sock, sock.makefile("rwb") as f:
+                f.write(json.dumps({"op": op, "args": args}).encode() + b"\n")
+                f.flush()
+                line = f.readline()
+        except OSError as e:
+            raise ControlError(f"control request {op} failed: {e}") from e
+        if not line:
+            raise ControlError(f"control process closed the connection during {op}")
+        reply = json.loads(line)
+        if not reply.get("ok"):
+            raise ControlError(reply.get("error") or f"control request {op} failed")
+        return reply["result"]
+
+    def start_recording(self) -> tuple[bool, Optional[str]]:
+        result = self._call("start")
+        return result["started"], result["error"]
+
+    def stop_recording(self) -> bool:
+        return self._call("stop")
+
+    def request_start(self) -> dict:
+        return self._call("request_start")
+
+    def request_stop(self) -> Optional[dict]:
+        return self._call("request_stop")
+
+    def wait_operation(self, op_id: str, timeout: Optional[float] = None) -> Optional[dict]:
+        # The wait must end well before the request itself times out
+        limit = self.timeout / 2
+        timeout = limit if timeout is None else min(timeout, limit)
+        return self._call("operation", op_id=op_id, timeout=timeout)
+
+    def render_metrics(self) -> str:
+        return self._call("metrics")
+
+    def list_recordings(self):
+        return self._call("list_recordings")
+
+    def query_recordings(self, **kwargs) -> dict:
+        return self._call("query_recordings", **kwargs)
+
+    def recent_logs(self, level: int = 0, limit: int = 200, since: Optional[int] = None) -> dict:
+        return self._call("logs", level=level, limit=limit, since=since)
+
+    def verify_session(self, name: Optional[str] = None) -> int:
+        return self._call("verify", name=name)
+
+    def merge_session(self, name: str) -> bool:
+        return self._call("merge", name=name)
+
+    # ---- status ---------------------------------------------------------------
+    def _accept(self, message: dict) -> StatusSnapshot:
+        body = message["body"].encode()
+        with self._cond:
+            # Versions are local so they stay monotonic across control restarts
+            self._version += 1
+            snapshot = StatusSnapshot(
+                data=types.MappingProxyType(json.loads(body)),
+                body=body,
+                etag=message["etag"],
+                version=self._version,
+                published=message["published"],
+            )
+            self._snapshot = snapshot
+            self._cond.notify_all()
+            listeners = list(self._listeners)
+        for callback in listeners:
+            try:
+                callback(snapshot)
+            except Exception:
+                logger.exception("Status listener failed")
+        return snapshot
+
+    def _subscribe_loop(self) -> None:
+        delay = 0.5
+        while not self._closed:
+            try:
+                sock = self._connect(None)
+                with sock, sock.makefile("rwb") as f:
+                    f.write(b'{"op": "subscribe"}\n')
+                    f.flush()
+                    delay = 0.5
+                    for line in f:
+                        self._accept(json.loads(line))
+            except (ControlError, OSError, ValueError) as e:
+                logger.debug("Status subscription interrupted: %s", e)
+            with self._cond:
+                # Do not keep serving state from a control process that is gone
+                self._snapshot = None
+            time.sleep(delay)
+            delay = min(delay * 2, 5.0)
+
+    def _ensure_subscribed(self) -> None:
+        if self._thread is None:
+            with self._cond:
+                if self._thread is None:
+                    self._thread = threading.Thread(
+                        target=self._subscribe_loop, name="control-subscriber", daemon=True
+                    )
+                    self._thread.start()
+
+    def status_snapshot(self) -> StatusSnapshot:
+        """Return the latest status pushed by the control process."""
+        self._ensure_subscribed()
+        with self._cond:
+            snapshot = self._snapshot
+        if snapshot is not None:
+            return snapshot
+        # Not subscribed (yet); ask directly so the caller gets an answer
+        return self._accept(self._call("status"))
+
+    def status(self) -> dict:
+        return dict(self.status_snapshot().data)
+
+    def add_status_listener(self, callback: Callable[[StatusSnapshot], None]) -> None:
+        with self._cond:
+            self._listeners.append(callback)
+
+    def close(self) -> None:
+        self._closed = True
@@ -0,0 +1,49 @@
+"""Entry point of the control process (see :mod:`webapp.control`).
+
+Usage::
+
+    LIVOX_CONTROL_SOCKET=/run/tecscanner/control.sock python -m webapp.control_process
+"""
+
+import logging
+import os
+import signal
+import threading
+
+from .control import DEFAULT_SOCKET, ControlServer
+
+logger = logging.getLogger(__name__)
+
+
+def main() -> int:
+    # Importing the package has already configured logging and, unless a
+    # control socket is configured, built a local manager we can reuse.
+    from . import manager as package_manager
+    from .logging_config import enable_file_logging
+    from .recording_manager import RecordingManager
+
+    # The HTTP workers leave the log file on the drive to this process
+    enable_file_logging()
+
+    if isinstance(package_manager, RecordingManager):
+        manager = package_manager
+    else:
+        manager = RecordingManager()
+    server = ControlServer(manager, os.getenv("LIVOX_CONTROL_SOCKET", DEFAULT_SOCKET))
+    done = threading.Event()
+
+    def request_stop(signum, frame):
+        done.set()
+
+    signal.signal(signal.SIGTERM, request_stop)
+    signal.signal(signal.SIGINT, request_stop)
+    server.start()
+    done.wait()
+    logger.info("Shutting down control process")
+    server.stop()
+    manager.close()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,102 @@
+"""LiDAR devices recorded by a session.
+
+``LIDAR_DEVICES`` lists sensors to record in parallel as comma separated
+``name:serial`` pairs, e.g. ``lidar0:47MDL9A,lidar1:47MDL9B``.  Every device
+gets its own recorder process (started with ``--device <serial>``), its own
+capture worker and the subdirectory ``<session>/<name>``, which is laid out
+like a single-sensor session (frames, exports, container, preview).  All
+devices of a session share its ID, stop event and admission policy, but a
+device whose recorder fails is dropped without holding up the others.
+
+Without ``LIDAR_DEVICES`` a single device is recorded straight into the
+session directory, exactly as before.
+"""
+
+import os
+import re
+import threading
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import List, Optional
+
+from .container import ContainerWriter
+from .metrics import RateMeter
+from .preview import SessionPreview
+from .recorder import PersistentRecorder
+
+DEVICE_NAME_RE = re.compile(r"^[A-Za-z0-9_-]+$")
+
+
+@dataclass(frozen=True)
+class DeviceConfig:
+    name: str
+    serial: Optional[str] = None
+
+    @property
+    def recorder_args(self) -> List[str]:
+        return ["--device", self.serial] if self.serial else []
+
+
+def devices_from_env() -> List[DeviceConfig]:
+    """Parse ``LIDAR_DEVICES``; an empty list means one unnamed device."""
+    devices: List[DeviceConfig] = []
+    for item in os.getenv("LIDAR_DEVICES", "").split(","):
+        item = item.strip()
+        if not item:
+            continue
+        name, _, serial = item.partition(":")
+        name = name.strip()
+        if not DEVICE_NAME_RE.match(name) or any(d.name == name for d in devices):
+            raise ValueError(f"invalid or duplicate device name {name!r} in LIDAR_DEVICES")
+        devices.append(DeviceConfig(name, serial.strip() or None))
+    return devices
+
+
+class DeviceCapture:
+    """Capture state of one device in the active session.
+
+    Counters are written by the device's worker thread while holding the
+    manager lock and read under the same lock for ``/status``.
+    """
+
+    def __init__(self, config: DeviceConfig, directory: Path):
+        self.config = config
+        # Where the device's files end up on the drive
+        self.dir = directory
+        # Where frames are captured (scratch, staging or ``dir``)
+        self.frame_dir: Optional[Path] = directory
+        self.container: Optional[ContainerWriter] = None
+        self.preview: Optional[SessionPreview] = None
+        self.recorder: Optional[PersistentRecorder] = None
+        self.thread: Optional[threading.Thread] = None
+        self.state = "starting"
+        self.error: Optional[str] = None
+        self.frames = 0
+        self.failures = 0
+        self.bytes = 0
+        self.last_size = 0
+        self.last_time: Optional[datetime] = None
+        self.current_file: Optional[Path] = None
+        self.last_stats: Optional[dict] = None
+        self.throughput = RateMeter()
+        # Frame decimation step last sent to the recorder
+        self.decimation = 1
+
+    @property
+    def name(self) -> str:
+        return self.config.name
+
+    def status(self) -> dict:
+        return {
+            "name": self.config.name,
+            "serial": self.config.serial,
+            "state": self.state,
+            "error": self.error,
+            "frames": self.frames,
+            "failures": self.failures,
+            "bytes": self.bytes,
+            "throughput_bps": round(self.throughput.rate()),
+            "current_file": self.current_file.name if self.current_file else None,
+            "recorder_mode": "persistent" if self.recorder else "spawn",
+        }
@@ -0,0 +1,252 @@
+"""Download recorded sessions over HTTP.
+
+Single files are served with ``wsgi.file_wrapper`` so servers such as
+gunicorn hand them to ``sendfile`` without copying through Python, and
+``Range`` requests are honoured for resumable transfers.  Whole sessions are
+streamed as a tar or zip archive generated on the fly: members are read in
+small blocks straight from the drive, nothing is staged and nothing is
+buffered in memory beyond one block.  Packed sessions (``session.tsc``) can
+be expanded into the usual per-frame layout while streaming.
+
+While a recording is running, transfers are throttled to
+``DOWNLOAD_RATE_LIMIT_KBPS`` so they cannot starve the capture path; the
+limit is shared by all downloads of a process.  Zero-copy transfers are only
+used while idle because they cannot be paced.
+"""
+
+import os
+import re
+import stat
+import tarfile
+import threading
+import time
+import zipfile
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple
+
+from . import container
+
+SESSION_RE = re.compile(r"^session_[0-9A-Za-z_-]+$")
+CHUNK_SIZE = 64 * 1024
+
+
+class RateLimiter:
+    """Token bucket shared by concurrent transfers."""
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        self.rate = rate
+        self.burst = burst if burst is not None else max(rate / 4, CHUNK_SIZE)
+        self._tokens = self.burst
+        self._stamp = time.monotonic()
+        self._lock = threading.Lock()
+
+    def consume(self, amount: int) -> None:
+        if self.rate <= 0:
+            return
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._stamp) * self.rate)
+            self._stamp = now
+            self._tokens -= amount
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+        if wait > 0:
+            time.sleep(wait)
+
+
+@dataclass
+class Member:
+    """One file of a session archive."""
+
+    name: str
+    size: int
+    mtime: float
+    open_data: Callable[[], Iterator[bytes]]
+
+
+def session_dir(output_dir: Optional[str], name: str) -> Optional[Path]:
+    """Return the directory of session ``name`` if it exists."""
+    if not output_dir or not SESSION_RE.match(name):
+        return None
+    path = Path(output_dir) / name
+    return path if path.is_dir() else None
+
+
+def session_file(session: Path, name: str) -> Optional[Path]:
+    """Return the regular file ``name`` inside ``session``, rejecting traversal.
+
+    ``name`` may be ``<device>/<file>`` for a device of a multi-LiDAR session.
+    """
+    parts = name.split("/") if name else []
+    if not 1 <= len(parts) <= 2 or any(
+        not p or p != os.path.basename(p) or p.startswith(".") for p in parts
+    ):
+        return None
+    path = session.joinpath(*parts)
+    try:
+        if stat.S_ISREG(path.stat().st_mode):
+            return path
+    except OSError:
+        pass
+    return None
+
+
+def _read_file(path: Path) -> Iterator[bytes]:
+    with open(path, "rb") as f:
+        while True:
+            block = f.read(CHUNK_SIZE)
+            if not block:
+                return
+            yield block
+
+
+def session_members(session: Path, expand: bool = False, _prefix: str = "") -> List[Member]:
+    """List the files of ``session``; with ``expand`` a container's records.
+
+    Device subdirectories of a multi-LiDAR session are listed as
+    ``<device>/<file>``.
+    """
+    members: List[Member] = []
+    for path in sorted(session.iterdir()):
+        if path.name.startswith("."):
+            continue
+        try:
+            st = path.stat()
+        except OSError:
+            continue
+        if stat.S_ISDIR(st.st_mode) and not _prefix:
+            members.extend(session_members(path, expand, f"{path.name}/"))
+            continue
+        if not stat.S_ISREG(st.st_mode):
+            continue
+        if expand and path.name == container.CONTAINER_NAME:
+            reader = container.ContainerReader(path)
+            for entry in reader.entries:
+                members.append(
+                    Member(
+                        _prefix + entry.name,
+                        entry.size,
+                        st.st_mtime,
+                        lambda e=entry, r=reader: r.iter_data(e),
+                    )
+                )
+            continue
+        members.append(Member(_prefix + path.name, st.st_size, st.st_mtime, lambda p=path: _read_file(p)))
+    return members
+
+
+def tar_size(members: Iterable[Member], prefix: str) -> int:
+    """Exact size of the stream produced by :func:`stream_tar`."""
+    total = 0
+    for m in members:
+        total += len(_tar_header(m, prefix)) + m.size + (-m.size % tarfile.BLOCKSIZE)
+    return total + 2 * tarfile.BLOCKSIZE
+
+
+def _tar_header(member: Member, prefix: str) -> bytes:
+    info = tarfile.TarInfo(f"{prefix}/{member.name}")
+    info.size = member.size
+    info.mtime = int(member.mtime)
+    info.mode = 0o644
+    return info.tobuf(format=tarfile.GNU_FORMAT)
+
+
+def stream_tar(members: Iterable[Member], prefix: str) -> Iterator[bytes]:
+    """Yield an uncompressed tar archive of ``members`` below ``prefix/``."""
+    for m in members:
+        yield _tar_header(m, prefix)
+        sent = 0
+        for block in m.open_data():
+            block = block[: m.size - sent]
+            sent += len(block)
+            yield block
+            if sent >= m.size:
+                break
+        if sent < m.size:
+            # The file shrank underneath us; keep the archive well formed
+            yield bytes(m.size - sent)
+        pad = -m.size % tarfile.BLOCKSIZE
+        if pad:
+            yield bytes(pad)
+    yield bytes(2 * tarfile.BLOCKSIZE)
+
+
+class _Sink:
+    """Write-only, non-seekable file collecting what ``zipfile`` produces."""
+
+    def __init__(self):
+        self.chunks: List[bytes] = []
+        self._pos = 0
+
+    def write(self, data) -> int:
+        self.chunks.append(bytes(data))
+        self._pos += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._pos
+
+    def flush(self) -> None:
+        pass
+
+    def drain(self) -> Iterator[bytes]:
+        chunks, self.chunks = self.chunks, []
+        yield from chunks
+
+
+def stream_zip(members: Iterable[Member], prefix: str) -> Iterator[bytes]:
+    """Yield a stored (uncompressed) zip archive of ``members``."""
+    sink = _Sink()
+    with zipfile.ZipFile(sink, "w", zipfile.ZIP_STORED, allowZip64=True) as zf:
+        for m in members:
+            info = zipfile.ZipInfo(f"{prefix}/{m.name}", time.localtime(m.mtime)[:6])
+            info.compress_type = zipfile.ZIP_STORED
+            info.file_size = m.size
+            with zf.open(info, "w", force_zip64=m.size >= 0x7FFFFFFF) as out:
+                for block in m.open_data():
+                    out.write(block)
+                    yield from sink.drain()
+            yield from sink.drain()
+    yield from sink.drain()
+
+
+def throttle(chunks: Iterable[bytes], limiter: RateLimiter, active: Callable[[], bool]) -> Iterator[bytes]:
+    """Pace ``chunks`` with ``limiter`` whenever ``active()`` is true."""
+    for chunk in chunks:
+        if active():
+            limiter.consume(len(chunk))
+        yield chunk
+
+
+def read_range(path: Path, start: int, length: int) -> Iterator[bytes]:
+    with open(path, "rb") as f:
+        f.seek(start)
+        remaining = length
+        while remaining > 0:
+            block = f.read(min(CHUNK_SIZE, remaining))
+            if not block:
+                return
+            remaining -= len(block)
+            yield block
+
+
+def file_etag(st: os.stat_result) -> str:
+    return f"{int(st.st_mtime_ns):x}-{st.st_size:x}"
+
+
+def byte_range(range_header, if_range, etag: str, size: int) -> Tuple[Optional[Tuple[int, int]], bool]:
+    """Resolve a parsed ``Range`` header against a file of ``size`` bytes.
+
+    Returns ``((start, stop), satisfiable)``; the range is ``None`` when the
+    whole file should be sent.
+    """
+    if range_header is None:
+        return None, True
+    if if_range is not None and (if_range.etag is not None or if_range.date is not None):
+        if if_range.etag != etag:
+            # The file changed since the client's partial copy; start over
+            return None, True
+    span = range_header.range_for_length(size)
+    if span is None:
+        return None, False
+    return span, True
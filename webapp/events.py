@@ -0,0 +1,113 @@
+"""Server-sent status events for the dashboard.
+
+The :class:`EventBroker` receives every snapshot published by
+:class:`~webapp.status.StatusPublisher` and fans it out to any number of
+``/events`` clients.  Nothing is computed per client except the delta
+against the last state that client saw, and clients are rate limited
+individually: updates that arrive faster than ``max_rate`` are coalesced
+into the next event instead of being queued.
+
+Every open stream holds a server thread for as long as the client stays
+connected, so the broker admits at most ``max_clients`` streams per
+process; :meth:`EventBroker.acquire` fails above that and the route answers
+503, leaving the threads for ``/status``, ``/start`` and ``/stop``.  The
+dashboard polls ``/status`` instead until it gets a stream.
+"""
+
+import json
+import threading
+import time
+from typing import Iterator, Optional
+
+from .status import StatusSnapshot
+
+
+class EventBroker:
+    """Fan out the latest status snapshot to streaming clients."""
+
+    def __init__(self, max_rate: float = 4.0, keepalive: float = 15.0, max_clients: int = 4):
+        self.min_interval = 1.0 / max_rate if max_rate > 0 else 0.0
+        self.keepalive = keepalive
+        # 0 admits any number of streams
+        self.max_clients = max_clients
+        self._cond = threading.Condition()
+        self._snapshot: Optional[StatusSnapshot] = None
+        self._closed = False
+        self.clients = 0
+
+    def publish(self, snapshot: StatusSnapshot) -> None:
+        with self._cond:
+            self._snapshot = snapshot
+            self._cond.notify_all()
+
+    def acquire(self) -> bool:
+        """Reserve a stream slot; ``False`` when ``max_clients`` are connected.
+
+        Every successful call must be paired with :meth:`release` once the
+        response is closed.
+        """
+        with self._cond:
+            if self.max_clients and self.clients >= self.max_clients:
+                return False
+            self.clients += 1
+            return True
+
+    def release(self) -> None:
+        with self._cond:
+            self.clients = max(0, self.clients - 1)
+
+    def close(self) -> None:
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def _wait_newer(self, version: int, timeout: float) -> Optional[StatusSnapshot]:
+        with self._cond:
+            self._cond.wait_for(
+                lambda: self._closed
+                or (self._snapshot is not None and self._snapshot.version > version),
+                timeout,
+            )
+            snap = self._snapshot
+        if snap is None or snap.version <= version:
+            return None
+        return snap
+
+    def stream(self, initial: StatusSnapshot) -> Iterator[str]:
+        """Yield SSE-formatted events, starting with a full ``status`` event.
+
+        The caller holds a slot from :meth:`acquire` for the stream's life.
+        """
+        with self._cond:
+            if self._snapshot is None or self._snapshot.version < initial.version:
+                self._snapshot = initial
+        sent = dict(initial.data)
+        version = initial.version
+        yield _format("status", version, sent)
+        last_sent = time.monotonic()
+        while not self._closed:
+            snap = self._wait_newer(version, self.keepalive)
+            if snap is None:
+                if self._closed:
+                    break
+                yield ": keepalive\n\n"
+                continue
+            # Coalesce bursts: wait out the rate limit, then send whatever
+            # is newest at that point.
+            delay = last_sent + self.min_interval - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+                snap = self._snapshot or snap
+            data = dict(snap.data)
+            delta = {k: v for k, v in data.items() if sent.get(k) != v}
+            delta.update({k: None for k in sent.keys() - data.keys()})
+            version = snap.version
+            sent = data
+            if delta:
+                yield _format("delta", version, delta)
+                last_sent = time.monotonic()
+
+
+def _format(event: str, version: int, data: dict) -> str:
+    payload = json.dumps(data, default=str, separators=(",", ":"))
+    return f"event: {event}\nid: {version}\ndata: {payload}\n\n"
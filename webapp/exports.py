@@ -0,0 +1,323 @@
+"""Deferred CSV export of frames captured while the governor held it back.
+
+The CSV export of a frame costs more CPU than anything else done next to
+capture, so it is the ``convert`` job of :mod:`webapp.governor`.  When the
+governor does not allow it the frame is not converted on the spot; instead
+its name is appended to ``.exports_pending`` in the session directory
+(``<device>/frame_NNNNNN.laz`` in multi-LiDAR sessions, as in the manifest)
+and :class:`DeferredExports` converts it once the session is finished, no
+recording is running and the governor lets the job run again.
+
+The pending file is the record of what is left, so exports cut short by a
+power loss or a pulled drive are found again by :meth:`DeferredExports.recover`.
+Frames compressed in the meantime (see :mod:`webapp.recompress`) are found
+under their new suffix.  In a packed session the frame is extracted from
+``session.tsc`` to a scratch file and its CSV is appended to the container.
+"""
+
+import collections
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Deque, Dict, List, Optional
+
+from .container import CONTAINER_NAME, ContainerError, ContainerReader, ContainerWriter
+from .downloads import RateLimiter
+
+logger = logging.getLogger(__name__)
+
+PENDING_NAME = ".exports_pending"
+# Suffixes a frame may have; the recompressor turns ``.las`` into ``.laz``
+_FRAME_SUFFIXES = (".laz", ".las")
+
+_pending_lock = threading.Lock()
+
+
+def defer(session: Path, name: str) -> None:
+    """Record that frame ``name`` of ``session`` still needs its CSV."""
+    with _pending_lock:
+        with open(session / PENDING_NAME, "a", encoding="utf-8") as f:
+            f.write(name + "\n")
+
+
+def pending_frames(session: Path) -> List[str]:
+    """Names of the frames of ``session`` still waiting for their CSV."""
+    try:
+        with _pending_lock:
+            text = (session / PENDING_NAME).read_text(encoding="utf-8")
+    except OSError:
+        return []
+    # A torn last line (power loss) is simply a frame name that is not found
+    return list(dict.fromkeys(line.strip() for line in text.splitlines() if line.strip()))
+
+
+def _remove_pending(session: Path, done: List[str]) -> None:
+    """Drop ``done`` from the pending file, keeping names deferred meanwhile."""
+    path = session / PENDING_NAME
+    with _pending_lock:
+        try:
+            text = path.read_text(encoding="utf-8")
+        except FileNotFoundError:
+            return
+        finished = set(done)
+        names = dict.fromkeys(
+            line.strip() for line in text.splitlines() if line.strip() and line.strip() not in finished
+        )
+        if not names:
+            path.unlink(missing_ok=True)
+            return
+        tmp = path.with_name(path.name + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write("".join(name + "\n" for name in names))
+        os.replace(tmp, path)
+
+
+def _find_frame(directory: Path, name: str) -> Optional[Path]:
+    for suffix in _FRAME_SUFFIXES:
+        frame = directory / Path(name).with_suffix(suffix).name
+        if frame.exists():
+            return frame
+    return None
+
+
+class DeferredExports:
+    """Background job writing the CSV exports the governor deferred.
+
+    ``convert(frame, csv)`` writes one export and returns ``False`` on
+    failure.  ``paused`` is polled between frames; the job waits while it
+    returns ``True``.  ``limiter`` paces the frame bytes converted per
+    second.  ``on_progress(session_name, state)`` is called when a job
+    starts, every ``report_frames`` frames and when it ends; ``state`` lists
+    the frames still pending.
+    """
+
+    def __init__(
+        self,
+        convert: Callable[[Path, Path], bool],
+        paused: Callable[[], bool] = lambda: False,
+        on_progress: Optional[Callable[[str, dict], None]] = None,
+        report_frames: int = 25,
+        limiter: Optional[RateLimiter] = None,
+        scratch: Optional[str] = None,
+    ):
+        self.convert = convert
+        self.paused = paused
+        self.on_progress = on_progress
+        self.report_frames = max(1, report_frames)
+        self.limiter = limiter
+        self.scratch = scratch
+        self._cond = threading.Condition()
+        self._queue: Deque[Path] = collections.deque()
+        self._closed = False
+        self._current: Optional[Path] = None
+        self._progress = {"frames_done": 0, "frames_total": 0}
+        self._last: Optional[dict] = None
+        self._thread = threading.Thread(target=self._run, name="exports", daemon=True)
+        self._thread.start()
+
+    def submit(self, session: Path) -> bool:
+        """Queue ``session``; returns ``False`` if it is already pending."""
+        with self._cond:
+            if self._closed or session in self._queue or self._current == session:
+                return False
+            self._queue.append(session)
+            self._cond.notify_all()
+            return True
+
+    def recover(self, output_dir: Path) -> int:
+        """Queue the sessions that still have deferred exports."""
+        try:
+            sessions = sorted(p for p in output_dir.glob("session_*") if p.is_dir())
+        except OSError:
+            return 0
+        queued = sum(self.submit(s) for s in sessions if (s / PENDING_NAME).exists())
+        if queued:
+            logger.info("Resuming deferred CSV exports of %d sessions", queued)
+        return queued
+
+    def busy(self) -> bool:
+        """Whether a job is running or waiting."""
+        with self._cond:
+            return self._current is not None or bool(self._queue)
+
+    def status(self) -> dict:
+        with self._cond:
+            return {
+                "active": self._current.name if self._current else None,
+                "queued": [p.name for p in self._queue],
+                **self._progress,
+                "last": self._last,
+            }
+
+    def close(self) -> None:
+        with self._cond:
+            self._closed = True
+            self._queue.clear()
+            self._cond.notify_all()
+        self._thread.join(timeout=30)
+
+    # ---- worker ---------------------------------------------------------------------
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._queue and not self._closed:
+                    self._cond.wait()
+                if self._closed:
+                    return
+                session = self._queue.popleft()
+                self._current = session
+                self._progress = dict.fromkeys(self._progress, 0)
+            try:
+                state = self._export_session(session)
+            except Exception as e:
+                # Whatever went wrong, the queue must keep going
+                logger.exception("Deferred exports of %s failed", session.name)
+                state = {"state": "failed", "error": str(e), "pending": pending_frames(session)}
+            with self._cond:
+                self._current = None
+                self._last = dict(state, session=session.name)
+                self._last.pop("pending", None)
+            self._report(session, state)
+
+    def _wait_unpaused(self) -> bool:
+        while self.paused():
+            with self._cond:
+                if self._closed:
+                    return False
+                self._cond.wait(1.0)
+        return not self._closed
+
+    def _report(self, session: Path, state: dict) -> None:
+        if self.on_progress:
+            self.on_progress(session.name, state)
+
+    def _export_session(self, session: Path) -> dict:
+        names = pending_frames(session)
+        with self._cond:
+            self._progress["frames_total"] = len(names)
+        t0 = time.monotonic()
+        scratch = Path(tempfile.mkdtemp(prefix=f"{session.name}-exports-", dir=self.scratch))
+        readers: Dict[Path, ContainerReader] = {}
+        writers: Dict[Path, ContainerWriter] = {}
+        failed: List[str] = []
+        error = None
+        position = 0
+        try:
+            for position, name in enumerate(names):
+                if position % self.report_frames == 0:
+                    self._report(
+                        session,
+                        {
+                            "state": "running",
+                            "frames_done": position - len(failed),
+                            "pending": failed + names[position:],
+                        },
+                    )
+                if not self._wait_unpaused():
+                    break
+                directory = (session / name).parent
+                try:
+                    if (directory / CONTAINER_NAME).exists():
+                        done = self._export_packed(directory, name, scratch, readers, writers)
+                    else:
+                        done = self._export_file(directory, name)
+                except (OSError, ValueError) as e:
+                    logger.warning("Cannot export %s of %s: %s", name, session.name, e)
+                    done = False
+                    error = str(e)
+                if not done:
+                    failed.append(name)
+                    error = error or "convert_failed"
+                    continue
+                with self._cond:
+                    self._progress["frames_done"] += 1
+            else:
+                position = len(names)
+        finally:
+            for writer in writers.values():
+                try:
+                    writer.close()
+                except OSError as e:
+                    logger.error("Failed to finish session container %s: %s", writer.path, e)
+            shutil.rmtree(scratch, ignore_errors=True)
+        remaining = names[position:]
+        pending = failed + remaining
+        try:
+            skipped = set(failed)
+            _remove_pending(session, [n for n in names[:position] if n not in skipped])
+        except OSError as e:
+            logger.warning("Cannot update the deferred exports of %s: %s", session.name, e)
+        state = {
+            "state": "failed" if failed else ("done" if not remaining else "interrupted"),
+            "frames_done": len(names) - len(pending),
+            "pending": pending,
+            "seconds": round(time.monotonic() - t0, 3),
+            "finished": datetime.utcnow().isoformat(),
+        }
+        if error:
+            state["error"] = error
+        logger.info(
+            "Exported %d of %d deferred frames of %s in %.1f s",
+            state["frames_done"],
+            len(names),
+            session.name,
+            state["seconds"],
+        )
+        return state
+
+    def _consume(self, size: int) -> None:
+        if self.limiter:
+            self.limiter.consume(size)
+
+    def _export_file(self, directory: Path, name: str) -> bool:
+        frame = _find_frame(directory, name)
+        if frame is None:
+            raise FileNotFoundError(f"frame not found in {directory}")
+        csv = frame.with_suffix(".csv")
+        if csv.exists():
+            return True
+        self._consume(frame.stat().st_size)
+        return self.convert(frame, csv)
+
+    def _export_packed(
+        self,
+        directory: Path,
+        name: str,
+        scratch: Path,
+        readers: Dict[Path, ContainerReader],
+        writers: Dict[Path, ContainerWriter],
+    ) -> bool:
+        path = directory / CONTAINER_NAME
+        reader = readers.get(path)
+        if reader is None:
+            # Read before this job appends anything; frame records never move
+            reader = readers[path] = ContainerReader(path)
+        base = Path(name).name
+        csv_name = str(Path(base).with_suffix(".csv"))
+        if reader.get(csv_name) is not None:
+            return True
+        entry = reader.get(base)
+        if entry is None:
+            raise ContainerError(f"{base} is not in {path}")
+        frame = scratch / base
+        csv = scratch / csv_name
+        self._consume(entry.size)
+        try:
+            with open(frame, "wb") as f:
+                for block in reader.iter_data(entry):
+                    f.write(block)
+            if not self.convert(frame, csv):
+                return False
+            writer = writers.get(path)
+            if writer is None:
+                writer = writers[path] = ContainerWriter(path)
+            writer.add_file(csv_name, csv)
+            return True
+        finally:
+            frame.unlink(missing_ok=True)
+            csv.unlink(missing_ok=True)
@@ -0,0 +1,379 @@
+"""CPU and thermal governor for background work.
+
+On a fanless Raspberry Pi the work done next to capture (auxiliary files,
+CSV conversion, downloads, indexing, verification, compression, merging)
+heats the SoC
+until the firmware throttles the clock, and then the frames themselves slow
+down.  :class:`Governor` samples the 1-minute load average
+(``/proc/loadavg``), pressure stall information (``/proc/pressure/*``), the
+hottest thermal zone (``/sys/class/thermal``) and the capture latency
+reported by the recorder every ``interval`` seconds and sets a level:
+
+``normal``
+    every job runs at its configured rate.
+``throttled``
+    a throttle limit is exceeded; job rates are cut to ``throttle_factor``
+    and the low-priority batch jobs (priority ``BATCH_PRIORITY`` and above)
+    wait.
+``paused``
+    the temperature or the capture latency crossed its pause limit; no job
+    starts until both have dropped ``resume_margin`` below it, and transfers
+    already under way keep the throttled rate.
+
+Every job class in :data:`JOBS` has a priority and a token bucket
+(:class:`~webapp.downloads.RateLimiter`) whose rate follows the level; a
+rate of 0 means unlimited.  Jobs wait with :meth:`Governor.acquire` or poll
+:meth:`Governor.allowed` between units of work.  Capture itself, the staging
+mover and logging are never governed.
+
+:meth:`Governor.status` names the exceeded limits and the time the level was
+entered, so it only changes along with the level; the sampled values are read
+with :meth:`Governor.sample` for ``/metrics``.
+"""
+
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional
+
+from .downloads import RateLimiter
+
+logger = logging.getLogger(__name__)
+
+LEVELS = ("normal", "throttled", "paused")
+# Jobs with this priority or a larger one wait while throttled
+BATCH_PRIORITY = 2
+PRESSURE_RESOURCES = ("cpu", "io", "memory")
+
+
+class Job(NamedTuple):
+    priority: int
+    # What the job's tokens count
+    unit: str
+    description: str
+
+
+JOBS: Dict[str, Job] = {
+    "convert": Job(0, "bytes", "CSV export of captured frames"),
+    "aux": Job(0, "files", "Auxiliary metadata files of captured frames"),
+    "upload": Job(1, "bytes", "Session downloads"),
+    "index": Job(1, "sessions", "Indexing sessions found on the drive"),
+    "verify": Job(2, "bytes", "Background checksum verification"),
+    "recompress": Job(2, "bytes", "Deferred LAZ compression"),
+    "merge": Job(3, "bytes", "Merging sessions into one point cloud"),
+}
+
+
+@dataclass
+class GovernorPolicy:
+    """Limits used by :class:`Governor`; 0 disables a limit."""
+
+    # Hottest thermal zone in degrees Celsius
+    throttle_temp: float = 70.0
+    pause_temp: float = 78.0
+    resume_margin: float = 5.0
+    # Smoothed time to capture one frame, in seconds
+    throttle_capture_seconds: float = 0.0
+    pause_capture_seconds: float = 0.0
+    # 1-minute load average per CPU
+    throttle_load: float = 1.5
+    # Share of time (percent, 10 s average) some task stalled on the resource
+    throttle_cpu_pressure: float = 40.0
+    throttle_io_pressure: float = 40.0
+    throttle_memory_pressure: float = 20.0
+    # Rate multiplier while throttled
+    throttle_factor: float = 0.25
+    interval: float = 2.0
+
+    @classmethod
+    def from_env(cls) -> "GovernorPolicy":
+        return cls(
+            throttle_temp=float(os.getenv("GOVERNOR_THROTTLE_TEMP", "70")),
+            pause_temp=float(os.getenv("GOVERNOR_PAUSE_TEMP", "78")),
+            resume_margin=float(os.getenv("GOVERNOR_RESUME_MARGIN", "5")),
+            throttle_capture_seconds=float(os.getenv("GOVERNOR_THROTTLE_CAPTURE_SECONDS", "0")),
+            pause_capture_seconds=float(os.getenv("GOVERNOR_PAUSE_CAPTURE_SECONDS", "0")),
+            throttle_load=float(os.getenv("GOVERNOR_THROTTLE_LOAD", "1.5")),
+            throttle_cpu_pressure=float(os.getenv("GOVERNOR_THROTTLE_CPU_PRESSURE", "40")),
+            throttle_io_pressure=float(os.getenv("GOVERNOR_THROTTLE_IO_PRESSURE", "40")),
+            throttle_memory_pressure=float(os.getenv("GOVERNOR_THROTTLE_MEMORY_PRESSURE", "20")),
+            throttle_factor=float(os.getenv("GOVERNOR_THROTTLE_FACTOR", "0.25")),
+            interval=float(os.getenv("GOVERNOR_INTERVAL", "2")),
+        )
+
+
+def rates_from_env() -> Dict[str, float]:
+    """Base rate of every job from ``GOVERNOR_RATE_<JOB>`` (KB/s or sessions/s)."""
+    rates = {}
+    for name, job in JOBS.items():
+        default = "0"
+        if name == "verify":
+            default = os.getenv("VERIFY_RATE_KBPS", "4096")
+        elif name == "upload":
+            default = os.getenv("DOWNLOAD_RATE_LIMIT_KBPS", "2048")
+        value = float(os.getenv(f"GOVERNOR_RATE_{name.upper()}", default))
+        rates[name] = value * 1024 if job.unit == "bytes" else value
+    return rates
+
+
+def read_loadavg(proc: Path) -> Optional[float]:
+    try:
+        return float((proc / "loadavg").read_text().split()[0])
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def read_pressure(proc: Path, resource: str) -> Optional[float]:
+    """The ``some avg10`` stall percentage of ``resource``, if PSI is enabled."""
+    try:
+        text = (proc / "pressure" / resource).read_text()
+    except OSError:
+        return None
+    for line in text.splitlines():
+        fields = line.split()
+        if fields and fields[0] == "some":
+            for field in fields[1:]:
+                key, _, value = field.partition("=")
+                if key == "avg10":
+                    try:
+                        return float(value)
+                    except ValueError:
+                        return None
+    return None
+
+
+def read_temperature(sys_root: Path) -> Optional[float]:
+    """Temperature of the hottest thermal zone in degrees Celsius."""
+    temps = []
+    try:
+        zones = list((sys_root / "class" / "thermal").glob("thermal_zone*"))
+    except OSError:
+        return None
+    for zone in zones:
+        try:
+            temps.append(int((zone / "temp").read_text().strip()) / 1000.0)
+        except (OSError, ValueError):
+            continue
+    return max(temps) if temps else None
+
+
+def _describe(sample: dict, cpus: int) -> str:
+    parts = []
+    if sample.get("temperature") is not None:
+        parts.append(f"temperature {sample['temperature']:.1f} C")
+    if sample.get("capture_seconds") is not None:
+        parts.append(f"capture {sample['capture_seconds']:.2f} s")
+    if sample.get("load") is not None:
+        parts.append(f"load {sample['load'] / cpus:.2f} per CPU")
+    for resource, value in (sample.get("pressure") or {}).items():
+        if value is not None:
+            parts.append(f"{resource} pressure {value:.0f}%")
+    return ", ".join(parts)
+
+
+class Governor:
+    """Sample system load and gate the non-capture jobs accordingly."""
+
+    def __init__(
+        self,
+        policy: Optional[GovernorPolicy] = None,
+        rates: Optional[Dict[str, float]] = None,
+        proc: Path = Path("/proc"),
+        sys_root: Path = Path("/sys"),
+    ):
+        self.policy = policy or GovernorPolicy()
+        self.rates = {name: 0.0 for name in JOBS}
+        self.rates.update(rates or {})
+        self.proc = Path(proc)
+        self.sys_root = Path(sys_root)
+        self.cpus = os.cpu_count() or 1
+        self._limiters = {
+            name: RateLimiter(rate, None if JOBS[name].unit == "bytes" else max(1.0, rate))
+            for name, rate in self.rates.items()
+        }
+        self._cond = threading.Condition()
+        self._closed = threading.Event()
+        self._level = "normal"
+        self._reasons: List[str] = []
+        self._since = datetime.now(timezone.utc)
+        self._sample: dict = {}
+        # Smoothed capture time and when it was last updated
+        self._capture: Optional[float] = None
+        self._capture_at = 0.0
+        self._waiting: Dict[str, int] = dict.fromkeys(JOBS, 0)
+        self.update()
+        self._thread = threading.Thread(target=self._run, name="governor", daemon=True)
+        self._thread.start()
+
+    # ---- inputs -----------------------------------------------------------------------
+    def observe_capture(self, seconds: float) -> None:
+        """Account for the time the recorder took for one frame."""
+        with self._cond:
+            now = time.monotonic()
+            if self._capture is None or now - self._capture_at > 10 * self.policy.interval:
+                self._capture = seconds
+            else:
+                self._capture = 0.7 * self._capture + 0.3 * seconds
+            self._capture_at = now
+
+    def _capture_latency(self, now: float) -> Optional[float]:
+        # Only meaningful while frames keep coming
+        if self._capture is None or now - self._capture_at > 10 * self.policy.interval:
+            return None
+        return self._capture
+
+    def update(self) -> str:
+        """Take a sample and recompute the level; returns the level."""
+        sample = {
+            "temperature": read_temperature(self.sys_root),
+            "load": read_loadavg(self.proc),
+            "pressure": {r: read_pressure(self.proc, r) for r in PRESSURE_RESOURCES},
+        }
+        with self._cond:
+            sample["capture_seconds"] = self._capture_latency(time.monotonic())
+            level, reasons = self._decide(sample)
+            self._sample = sample
+            if level != self._level:
+                if level == "normal":
+                    logger.info("Background work resumed")
+                else:
+                    logger.warning(
+                        "Background work %s: %s (%s)", level, ", ".join(reasons), _describe(sample, self.cpus)
+                    )
+                self._level = level
+                self._since = datetime.now(timezone.utc)
+                factor = 1.0 if level == "normal" else self.policy.throttle_factor
+                for name, limiter in self._limiters.items():
+                    limiter.rate = self.rates[name] * factor
+                self._cond.notify_all()
+            self._reasons = reasons
+            return level
+
+    def _decide(self, sample: dict):
+        # Reasons name the exceeded limits only, so they stay the same for as
+        # long as the level does; the values go to the log and /metrics
+        p = self.policy
+        temp = sample["temperature"]
+        capture = sample["capture_seconds"]
+        load = sample["load"]
+        pressure = sample["pressure"]
+        # Leaving a level requires dropping below its limits by a margin
+        paused = self._level == "paused"
+        throttled = self._level != "normal"
+        temp_margin = p.resume_margin if paused else 0.0
+        reasons = []
+        if temp is not None and p.pause_temp > 0 and temp >= p.pause_temp - temp_margin:
+            reasons.append("temperature")
+        if capture is not None and p.pause_capture_seconds > 0 and capture >= p.pause_capture_seconds * (
+            0.8 if paused else 1.0
+        ):
+            reasons.append("capture")
+        if reasons:
+            return "paused", reasons
+        temp_margin = p.resume_margin if throttled else 0.0
+        if temp is not None and p.throttle_temp > 0 and temp >= p.throttle_temp - temp_margin:
+            reasons.append("temperature")
+        if capture is not None and p.throttle_capture_seconds > 0 and capture >= p.throttle_capture_seconds:
+            reasons.append("capture")
+        if load is not None and p.throttle_load > 0 and load / self.cpus >= p.throttle_load:
+            reasons.append("load")
+        limits = {
+            "cpu": p.throttle_cpu_pressure,
+            "io": p.throttle_io_pressure,
+            "memory": p.throttle_memory_pressure,
+        }
+        for resource, limit in limits.items():
+            value = pressure.get(resource)
+            if value is not None and limit > 0 and value >= limit:
+                reasons.append(f"{resource}_pressure")
+        return ("throttled" if reasons else "normal"), reasons
+
+    # ---- jobs ---------------------------------------------------------------------------
+    @property
+    def level(self) -> str:
+        with self._cond:
+            return self._level
+
+    def allowed(self, job: str) -> bool:
+        """Whether ``job`` may run at the current level."""
+        with self._cond:
+            return self._allowed(job)
+
+    def _allowed(self, job: str) -> bool:
+        if self._level == "paused":
+            return False
+        return self._level == "normal" or JOBS[job].priority < BATCH_PRIORITY
+
+    def limiter(self, job: str) -> RateLimiter:
+        """The token bucket of ``job``; its rate follows the level."""
+        return self._limiters[job]
+
+    def acquire(self, job: str, amount: float = 1, timeout: Optional[float] = None) -> bool:
+        """Wait until ``job`` may run, then take ``amount`` tokens.
+
+        Returns ``False`` if ``timeout`` expires first or the governor is
+        closed.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            self._waiting[job] += 1
+            try:
+                while not self._allowed(job) and not self._closed.is_set():
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        return False
+                    self._cond.wait(remaining)
+            finally:
+                self._waiting[job] -= 1
+        if self._closed.is_set():
+            return False
+        self._limiters[job].consume(amount)
+        return True
+
+    # ---- reporting ------------------------------------------------------------------------
+    def status(self) -> dict:
+        """Level, reasons and job gates; changes only when one of them does."""
+        with self._cond:
+            return {
+                "state": self._level,
+                "reasons": list(self._reasons),
+                "since": self._since.isoformat(),
+                "jobs": {
+                    name: {
+                        "priority": job.priority,
+                        "allowed": self._allowed(name),
+                        "rate": round(self._limiters[name].rate),
+                        "waiting": self._waiting[name],
+                    }
+                    for name, job in JOBS.items()
+                },
+            }
+
+    def sample(self) -> dict:
+        """The latest raw sample, for the gauges in ``/metrics``."""
+        with self._cond:
+            sample = self._sample
+            load = sample.get("load")
+            return {
+                "temperature": sample.get("temperature"),
+                "load_per_cpu": load / self.cpus if load is not None else None,
+                "pressure": dict(sample.get("pressure") or {}),
+                "capture_seconds": sample.get("capture_seconds"),
+            }
+
+    def close(self) -> None:
+        self._closed.set()
+        with self._cond:
+            self._cond.notify_all()
+        self._thread.join(timeout=5)
+
+    def _run(self) -> None:
+        while not self._closed.wait(self.policy.interval):
+            try:
+                self.update()
+            except Exception:
+                logger.exception("Governor sample failed")
@@ -0,0 +1,259 @@
+"""Frame checksums and session verification.
+
+Worn USB sticks corrupt data silently, so every frame gets a CRC-32 (the
+checksum the session container already uses) while the session is being
+recorded and the result is appended to ``manifest.jsonl`` in the session
+directory, one ``{"name", "size", "crc32"}`` object per frame.  The
+post-processing worker computes the checksum from the freshly written,
+still cached file; a recorder that reports ``crc32`` in its stats saves it
+that read, but ``save_laz`` does not.  Packed sessions need no
+manifest: every record of ``session.tsc`` carries its own CRC.
+
+:class:`SessionVerifier` re-reads sessions in a background thread, at most
+``rate`` bytes per second and not at all while a recording is running, and
+reports frames whose size or checksum no longer match.
+"""
+
+import collections
+import json
+import logging
+import threading
+import time
+import zlib
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Deque, Dict, Iterable, Optional, Tuple
+
+from . import container
+from .downloads import CHUNK_SIZE, RateLimiter
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = "manifest.jsonl"
+
+
+def file_crc32(path: Path, limiter: Optional[RateLimiter] = None) -> Tuple[int, int]:
+    """Return ``(crc32, size)`` of the file at ``path``."""
+    crc = 0
+    size = 0
+    with open(path, "rb") as f:
+        while True:
+            block = f.read(CHUNK_SIZE)
+            if not block:
+                return crc, size
+            if limiter:
+                limiter.consume(len(block))
+            crc = zlib.crc32(block, crc)
+            size += len(block)
+
+
+class ManifestWriter:
+    """Append frame checksums to a session's manifest."""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._f = self.path.open("a", buffering=1)
+
+    def add(self, name: str, size: int, crc: int, replaces: Optional[str] = None) -> None:
+        entry = {"name": name, "size": size, "crc32": f"{crc:08x}"}
+        if replaces:
+            entry["replaces"] = replaces
+        line = json.dumps(entry) + "\n"
+        with self._lock:
+            if self._f is None:
+                return
+            try:
+                self._f.write(line)
+            except OSError as e:
+                logger.warning("Failed to write manifest entry for %s: %s", name, e)
+
+    def close(self) -> None:
+        with self._lock:
+            f, self._f = self._f, None
+        if f:
+            try:
+                f.close()
+            except OSError:
+                pass
+
+
+def read_manifest(path: Path) -> Dict[str, dict]:
+    """Load a manifest; later entries for the same name win and drop the
+    entry of the file they replace."""
+    entries: Dict[str, dict] = {}
+    with open(path) as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+                entries[entry["name"]] = {"size": int(entry["size"]), "crc32": int(entry["crc32"], 16)}
+            except (ValueError, KeyError, TypeError):
+                # A line torn by power loss
+                continue
+            if entry.get("replaces"):
+                entries.pop(entry["replaces"], None)
+    return entries
+
+
+class SessionVerifier:
+    """Background job re-checking sessions against their checksums.
+
+    ``paused`` is polled between files; verification waits while it
+    returns ``True``.  Reads are paced by ``limiter`` if given, otherwise
+    at ``rate`` bytes per second.  ``on_result(session_name, result)`` is
+    called with the outcome of every session.  With an ``interval`` the sessions
+    returned by ``sweep()`` are queued again every ``interval`` seconds.
+    """
+
+    def __init__(
+        self,
+        rate: float,
+        paused: Callable[[], bool] = lambda: False,
+        on_result: Optional[Callable[[str, dict], None]] = None,
+        sweep: Optional[Callable[[], Iterable[Path]]] = None,
+        interval: float = 0.0,
+        limiter: Optional[RateLimiter] = None,
+    ):
+        self.limiter = limiter or RateLimiter(rate)
+        self.paused = paused
+        self.on_result = on_result
+        self.sweep = sweep
+        self.interval = interval
+        self._next_sweep = time.monotonic() + interval
+        self._cond = threading.Condition()
+        self._queue: Deque[Path] = collections.deque()
+        self._closed = False
+        self._current: Optional[str] = None
+        self._progress = {"files_done": 0, "files_total": 0, "bytes_done": 0, "bytes_total": 0}
+        self._last: Optional[dict] = None
+        self._thread = threading.Thread(target=self._run, name="session-verifier", daemon=True)
+        self._thread.start()
+
+    def submit(self, session: Path) -> bool:
+        """Queue ``session``; returns ``False`` if it is already pending."""
+        with self._cond:
+            if self._closed or session in self._queue or self._current == session.name:
+                return False
+            self._queue.append(session)
+            self._cond.notify_all()
+            return True
+
+    def status(self) -> dict:
+        with self._cond:
+            return {
+                "active": self._current,
+                "queued": [p.name for p in self._queue],
+                **self._progress,
+                "last": self._last,
+            }
+
+    def close(self) -> None:
+        with self._cond:
+            self._closed = True
+            self._queue.clear()
+            self._cond.notify_all()
+        self._thread.join(timeout=5)
+
+    # ---- worker ---------------------------------------------------------------------
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._queue and not self._closed:
+                    wait = None
+                    if self.sweep and self.interval > 0:
+                        wait = self._next_sweep - time.monotonic()
+                        if wait <= 0:
+                            break
+                    self._cond.wait(wait)
+                if self._closed:
+                    return
+                session = self._queue.popleft() if self._queue else None
+                self._current = session.name if session else None
+            if session is None:
+                # Periodic re-check of every session
+                self._next_sweep = time.monotonic() + self.interval
+                for path in self.sweep():
+                    self.submit(path)
+                continue
+            try:
+                result = self.verify(session)
+            except (OSError, ValueError) as e:
+                logger.warning("Cannot verify %s: %s", session.name, e)
+                result = {"error": str(e)}
+            result["session"] = session.name
+            result["verified"] = datetime.utcnow().isoformat()
+            with self._cond:
+                self._current = None
+                self._last = result
+                self._progress = dict.fromkeys(self._progress, 0)
+            if result.get("bad") or result.get("missing"):
+                logger.error(
+                    "Session %s failed verification: %d bad, %d missing frames",
+                    session.name,
+                    len(result.get("bad", [])),
+                    len(result.get("missing", [])),
+                )
+            if self.on_result:
+                self.on_result(session.name, result)
+
+    def _wait_unpaused(self) -> bool:
+        while self.paused():
+            with self._cond:
+                if self._closed:
+                    return False
+                self._cond.wait(1.0)
+        return not self._closed
+
+    def _advance(self, size: int) -> None:
+        with self._cond:
+            self._progress["files_done"] += 1
+            self._progress["bytes_done"] += size
+
+    def verify(self, session: Path) -> dict:
+        """Check every file listed for ``session``; blocks the caller."""
+        manifest = session / MANIFEST_NAME
+        entries = read_manifest(manifest) if manifest.exists() else {}
+        packed = [session / container.CONTAINER_NAME, *session.glob(f"*/{container.CONTAINER_NAME}")]
+        readers = [(p, container.ContainerReader(p)) for p in packed if p.exists()]
+        if not entries and not readers:
+            return {"checked": 0, "bad": [], "missing": [], "error": "no_manifest"}
+        with self._cond:
+            self._progress["files_total"] = len(entries) + sum(len(r.entries) for _, r in readers)
+            self._progress["bytes_total"] = sum(e["size"] for e in entries.values()) + sum(
+                e.size for _, r in readers for e in r.entries
+            )
+        bad = []
+        missing = []
+        checked = 0
+        for name, expected in entries.items():
+            if not self._wait_unpaused():
+                break
+            try:
+                crc, size = file_crc32(session / name, self.limiter)
+            except FileNotFoundError:
+                missing.append(name)
+                self._advance(0)
+                continue
+            checked += 1
+            if crc != expected["crc32"] or size != expected["size"]:
+                bad.append(name)
+            self._advance(size)
+        for path, reader in readers:
+            prefix = "" if path.parent == session else f"{path.parent.name}/"
+            for entry in reader.entries:
+                if not self._wait_unpaused():
+                    break
+                crc = zlib.crc32(entry.name.encode())
+                size = 0
+                try:
+                    for block in reader.iter_data(entry):
+                        self.limiter.consume(len(block))
+                        crc = zlib.crc32(block, crc)
+                        size += len(block)
+                except container.ContainerError:
+                    pass
+                checked += 1
+                if crc != entry.crc or size != entry.size:
+                    bad.append(prefix + entry.name)
+                self._advance(size)
+        return {"checked": checked, "bad": bad, "missing": missing}
@@ -0,0 +1,342 @@
+"""Chunked LAS/LAZ point access backed by NumPy.
+
+Frames written by ``save_laz`` are LAS 1.2 files using point data format 1.
+This module reads point records in large chunks straight into NumPy
+structured arrays so that callers can process multi-million point frames
+with flat memory use.  Uncompressed ``.las`` files are decoded directly;
+compressed ``.laz`` files require the optional ``laspy`` package with a LAZ
+backend (``lazrs`` or ``laszip``).  :class:`LasWriter` streams records back
+out to an uncompressed LAS file.
+
+NumPy and laspy add well over 100 ms to the application's start-up, so they
+are imported on first use through :func:`numpy` and :func:`laspy` (which
+return ``None`` when the package is not installed).
+"""
+
+import functools
+import importlib
+import importlib.util
+import logging
+import struct
+from dataclasses import dataclass
+from pathlib import Path
+from typing import TYPE_CHECKING, BinaryIO, Iterator, List, Optional, Tuple
+
+if TYPE_CHECKING:
+    import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_POINTS = 262144
+
+_HEADER_FMT = "<4sHH16sBB32s32sHHHIIBHI5I3d3d6d"
+_HEADER_SIZE_12 = struct.calcsize(_HEADER_FMT)  # 227 bytes for LAS 1.2
+
+# Fields shared by point data formats 0-5
+_LEGACY_FIELDS = [
+    ("X", "<i4"),
+    ("Y", "<i4"),
+    ("Z", "<i4"),
+    ("intensity", "<u2"),
+    ("bit_fields", "u1"),
+    ("raw_classification", "u1"),
+    ("scan_angle_rank", "i1"),
+    ("user_data", "u1"),
+    ("point_source_id", "<u2"),
+]
+# Fields shared by point data formats 6-10
+_EXTENDED_FIELDS = [
+    ("X", "<i4"),
+    ("Y", "<i4"),
+    ("Z", "<i4"),
+    ("intensity", "<u2"),
+    ("bit_fields", "u1"),
+    ("classification_flags", "u1"),
+    ("classification", "u1"),
+    ("user_data", "u1"),
+    ("scan_angle", "<i2"),
+    ("point_source_id", "<u2"),
+    ("gps_time", "<f8"),
+]
+_GPS = [("gps_time", "<f8")]
+_RGB = [("red", "<u2"), ("green", "<u2"), ("blue", "<u2")]
+_NIR = [("nir", "<u2")]
+
+_FORMAT_FIELDS = {
+    0: _LEGACY_FIELDS,
+    1: _LEGACY_FIELDS + _GPS,
+    2: _LEGACY_FIELDS + _RGB,
+    3: _LEGACY_FIELDS + _GPS + _RGB,
+    6: _EXTENDED_FIELDS,
+    7: _EXTENDED_FIELDS + _RGB,
+    8: _EXTENDED_FIELDS + _RGB + _NIR,
+}
+
+
+class LasError(ValueError):
+    """Raised when a file cannot be decoded as LAS/LAZ."""
+
+
+@functools.lru_cache(maxsize=None)
+def _optional(name: str):
+    try:
+        return importlib.import_module(name)
+    except ModuleNotFoundError:  # pragma: no cover - exercised on minimal installs
+        return None
+
+
+def numpy():
+    """The ``numpy`` module, imported on first use; ``None`` if missing."""
+    return _optional("numpy")
+
+
+def laspy():
+    """The ``laspy`` module, imported on first use; ``None`` if missing."""
+    return _optional("laspy")
+
+
+@functools.lru_cache(maxsize=None)
+def numpy_available() -> bool:
+    """Whether NumPy is installed, without importing it."""
+    return importlib.util.find_spec("numpy") is not None
+
+
+@functools.lru_cache(maxsize=None)
+def laz_errors() -> tuple:
+    """What laspy and its LAZ backend raise for unreadable files.
+
+    lazrs reports a truncated or corrupt chunk as ``LazrsError``, a
+    ``RuntimeError``.
+    """
+    laspy_module, lazrs = laspy(), _optional("lazrs")
+    return ((laspy_module.errors.LaspyException,) if laspy_module else ()) + (
+        (lazrs.LazrsError,) if lazrs else ()
+    )
+
+
+@dataclass
+class LasHeader:
+    version: Tuple[int, int]
+    point_format: int
+    record_length: int
+    point_count: int
+    offset_to_points: int
+    scale: Tuple[float, float, float]
+    offset: Tuple[float, float, float]
+    maxs: Tuple[float, float, float]
+    mins: Tuple[float, float, float]
+    compressed: bool = False
+
+
+def point_dtype(point_format: int, record_length: Optional[int] = None):
+    """Return the NumPy dtype for ``point_format`` padded to ``record_length``."""
+    np = numpy()
+    if np is None:
+        raise LasError("NumPy is required for LAS decoding")
+    try:
+        fields = list(_FORMAT_FIELDS[point_format])
+    except KeyError:
+        raise LasError(f"Unsupported point data format {point_format}") from None
+    base = np.dtype(fields)
+    if record_length and record_length > base.itemsize:
+        fields.append(("extra_bytes", f"V{record_length - base.itemsize}"))
+    elif record_length and record_length < base.itemsize:
+        raise LasError(
+            f"Record length {record_length} too short for point format {point_format}"
+        )
+    return np.dtype(fields)
+
+
+def read_header(f: BinaryIO) -> LasHeader:
+    """Parse the public header block from the start of ``f``."""
+    raw = f.read(_HEADER_SIZE_12)
+    if len(raw) < _HEADER_SIZE_12 or raw[:4] != b"LASF":
+        raise LasError("Not a LAS file")
+    v = struct.unpack(_HEADER_FMT, raw)
+    version = (v[4], v[5])
+    offset_to_points = v[11]
+    raw_format = v[13]
+    record_length = v[14]
+    point_count = v[15]
+    scale = v[21:24]
+    offset = v[24:27]
+    max_x, min_x, max_y, min_y, max_z, min_z = v[27:33]
+    if version >= (1, 4):
+        ext = f.read(8 + 8 + 4 + 8)
+        if len(ext) == 28:
+            count64 = struct.unpack("<QQIQ", ext)[3]
+            if count64:
+                point_count = count64
+    return LasHeader(
+        version=version,
+        # LASzip flags compressed files by setting bits 6/7 of the format id
+        point_format=raw_format & 0x3F,
+        record_length=record_length,
+        point_count=point_count,
+        offset_to_points=offset_to_points,
+        scale=tuple(scale),
+        offset=tuple(offset),
+        maxs=(max_x, max_y, max_z),
+        mins=(min_x, min_y, min_z),
+        compressed=bool(raw_format & 0xC0),
+    )
+
+
+def open_header(path: Path) -> LasHeader:
+    with open(path, "rb") as f:
+        return read_header(f)
+
+
+def iter_chunks(path: Path, chunk_points: int = DEFAULT_CHUNK_POINTS) -> Iterator[Tuple[LasHeader, "np.ndarray"]]:
+    """Yield ``(header, records)`` for successive chunks of ``path``.
+
+    ``records`` is a structured array holding the raw (unscaled) point
+    records; at most ``chunk_points`` records are held in memory at once.
+    """
+    np = numpy()
+    if np is None:
+        raise LasError("NumPy is required for LAS decoding")
+    with open(path, "rb") as f:
+        header = read_header(f)
+        if header.compressed:
+            yield from _iter_laz_chunks(path, header, chunk_points)
+            return
+        dtype = point_dtype(header.point_format, header.record_length)
+        f.seek(header.offset_to_points)
+        remaining = header.point_count
+        while remaining > 0:
+            n = min(chunk_points, remaining)
+            buf = f.read(n * dtype.itemsize)
+            got = len(buf) // dtype.itemsize
+            if got == 0:
+                break
+            yield header, np.frombuffer(buf, dtype=dtype, count=got)
+            remaining -= got
+            if got < n:
+                logger.warning("Truncated point data in %s", path)
+                break
+
+
+def _iter_laz_chunks(path: Path, header: LasHeader, chunk_points: int):
+    laspy_module = laspy()
+    if laspy_module is None:
+        raise LasError("Reading compressed LAZ requires the 'laspy' package")
+    try:
+        with laspy_module.open(str(path)) as reader:
+            for points in reader.chunk_iterator(chunk_points):
+                yield header, points.array
+    except laz_errors() as e:
+        raise LasError(f"{path}: {e}") from e
+
+
+def scaled_xyz(header: LasHeader, records) -> "np.ndarray":
+    """Return an ``(n, 3)`` float64 array of real-world coordinates."""
+    np = numpy()
+    xyz = np.empty((len(records), 3), dtype=np.float64)
+    for axis, name in enumerate(("X", "Y", "Z")):
+        np.multiply(records[name], header.scale[axis], out=xyz[:, axis])
+        xyz[:, axis] += header.offset[axis]
+    return xyz
+
+
+def classification(records) -> "np.ndarray":
+    names = records.dtype.names
+    if "raw_classification" in names:
+        return records["raw_classification"] & 0x1F
+    return records["classification"]
+
+
+class LasWriter:
+    """Stream raw point records into an uncompressed LAS 1.2 file.
+
+    The header is written with placeholder counts and bounds and patched when
+    the writer is closed, so records can be appended chunk by chunk.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        point_format: int = 1,
+        scale: Tuple[float, float, float] = (0.0001, 0.0001, 0.0001),
+        offset: Tuple[float, float, float] = (0.0, 0.0, 0.0),
+    ):
+        if numpy() is None:
+            raise LasError("NumPy is required for LAS encoding")
+        if point_format not in (0, 1, 2, 3):
+            raise LasError("LasWriter only supports point formats 0-3")
+        self.path = Path(path)
+        self.point_format = point_format
+        self.dtype = point_dtype(point_format)
+        self.scale = tuple(scale)
+        self.offset = tuple(offset)
+        self.count = 0
+        self._by_return: List[int] = [0] * 5
+        self._mins = [float("inf")] * 3
+        self._maxs = [float("-inf")] * 3
+        self._f = open(self.path, "wb")
+        self._f.write(b"\0" * _HEADER_SIZE_12)
+
+    def write(self, records) -> None:
+        """Append ``records`` (a structured array with at least ``X/Y/Z``)."""
+        if len(records) == 0:
+            return
+        if records.dtype != self.dtype:
+            out = numpy().zeros(len(records), dtype=self.dtype)
+            for name in self.dtype.names:
+                if name in records.dtype.names:
+                    out[name] = records[name]
+            records = out
+        for axis, name in enumerate(("X", "Y", "Z")):
+            col = records[name]
+            lo = col.min() * self.scale[axis] + self.offset[axis]
+            hi = col.max() * self.scale[axis] + self.offset[axis]
+            self._mins[axis] = min(self._mins[axis], lo)
+            self._maxs[axis] = max(self._maxs[axis], hi)
+        self._f.write(records.tobytes())
+        self.count += len(records)
+        self._by_return[0] += len(records)
+
+    def close(self) -> None:
+        if self._f.closed:
+            return
+        if self.count == 0:
+            self._mins = [0.0] * 3
+            self._maxs = [0.0] * 3
+        header = struct.pack(
+            _HEADER_FMT,
+            b"LASF",
+            4711,
+            1,
+            b"\0" * 16,
+            1,
+            2,
+            b"tecscanner".ljust(32, b"\0"),
+            b"tecscanner las_io".ljust(32, b"\0"),
+            0,
+            0,
+            _HEADER_SIZE_12,
+            _HEADER_SIZE_12,
+            0,
+            self.point_format,
+            self.dtype.itemsize,
+            self.count,
+            *self._by_return,
+            *self.scale,
+            *self.offset,
+            self._maxs[0],
+            self._mins[0],
+            self._maxs[1],
+            self._mins[1],
+            self._maxs[2],
+            self._mins[2],
+        )
+        self._f.seek(0)
+        self._f.write(header)
+        self._f.flush()
+        self._f.close()
+
+    def __enter__(self) -> "LasWriter":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
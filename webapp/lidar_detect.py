@@ -0,0 +1,242 @@
+"""Passive LiDAR presence detection.
+
+Probing with ``save_laz --check`` forks a process every few seconds and
+cannot notice a plug/unplug faster than the probe interval.  A MID360 that
+is powered and cabled continuously sends UDP traffic (status pushes and
+point data) to the host ports configured in ``mid360_config.json``, so
+:class:`HeartbeatDetector` simply listens on those ports and treats any
+datagram as a heartbeat.  While nothing is heard the detector blocks in
+``select`` and reacts to the first packet; while the LiDAR is present it
+only drains its (small) socket buffers a few times per timeout instead of
+reading every packet.
+
+The Livox SDK binds the same ports while recording, so the detector releases
+them with :meth:`HeartbeatDetector.suspend`.  The recorder's frames then act
+as heartbeats (:meth:`HeartbeatDetector.heartbeat`).
+
+The ports can be overridden with ``LIDAR_HEARTBEAT_PORTS`` (comma separated),
+which also lets tests point the detector at a local UDP stand-in such as
+:mod:`benchmarks.fake_lidar`.
+"""
+
+import json
+import logging
+import os
+import select
+import socket
+import threading
+import time
+from pathlib import Path
+from typing import Callable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CONFIG = Path(__file__).resolve().parent.parent / "mid360_config.json"
+# Host ports of the MID360 status push and point data streams
+DEFAULT_PORTS = (56201, 56301)
+_RCVBUF = 16 * 1024
+_DRAIN_LIMIT = 64
+
+
+def ports_from_config(path: Path) -> List[int]:
+    """Return the host push/point ports listed in a Livox SDK config."""
+    with open(path) as f:
+        config = json.load(f)
+    ports = []
+    for device in config.values():
+        host = device.get("host_net_info", {}) if isinstance(device, dict) else {}
+        for key in ("push_msg_port", "point_data_port"):
+            port = host.get(key)
+            if isinstance(port, int) and port not in ports:
+                ports.append(port)
+    return ports
+
+
+def ports_from_env() -> List[int]:
+    """Ports to listen on, from ``LIDAR_HEARTBEAT_PORTS`` or ``LIVOX_CONFIG``."""
+    override = os.getenv("LIDAR_HEARTBEAT_PORTS")
+    if override:
+        return [int(p) for p in override.split(",") if p.strip()]
+    path = Path(os.getenv("LIVOX_CONFIG") or DEFAULT_CONFIG)
+    try:
+        ports = ports_from_config(path)
+    except (OSError, ValueError) as e:
+        logger.warning("Cannot read LiDAR ports from %s (%s); using defaults", path, e)
+        ports = []
+    return ports or list(DEFAULT_PORTS)
+
+
+class HeartbeatDetector:
+    """Infer LiDAR presence from UDP traffic on the host ports."""
+
+    def __init__(
+        self,
+        ports: List[int],
+        host: str = "",
+        timeout: float = 0.75,
+        suspended_timeout: float = 30.0,
+        on_change: Optional[Callable[[bool], None]] = None,
+    ):
+        self.ports = list(ports)
+        self.host = host
+        # Silence after which the LiDAR is considered gone
+        self.timeout = timeout
+        # The same while suspended, where heartbeats come from frames
+        self.suspended_timeout = suspended_timeout
+        self.on_change = on_change
+        self._cond = threading.Condition()
+        self._sockets: List[socket.socket] = []
+        self._suspended = False
+        self._closed = False
+        self._last_seen: Optional[float] = None
+        self._detected = False
+        self._thread: Optional[threading.Thread] = None
+
+    # ---- lifecycle --------------------------------------------------------------
+    def start(self) -> None:
+        """Bind the ports and start listening; raises ``OSError`` if none bind."""
+        self._bind()
+        self._thread = threading.Thread(target=self._run, name="lidar-heartbeat", daemon=True)
+        self._thread.start()
+
+    def _bind(self) -> None:
+        sockets = []
+        errors = []
+        for port in self.ports:
+            s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            try:
+                s.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, _RCVBUF)
+                s.bind((self.host, port))
+                s.setblocking(False)
+            except OSError as e:
+                s.close()
+                errors.append(f"{port}: {e.strerror or e}")
+                continue
+            sockets.append(s)
+        if not sockets:
+            raise OSError(f"cannot listen for LiDAR traffic ({'; '.join(errors)})")
+        if errors:
+            logger.warning("Not listening on some LiDAR ports: %s", "; ".join(errors))
+        with self._cond:
+            self._sockets = sockets
+            self._cond.notify_all()
+
+    def _release(self) -> None:
+        with self._cond:
+            sockets, self._sockets = self._sockets, []
+            self._cond.notify_all()
+        for s in sockets:
+            s.close()
+
+    def suspend(self) -> None:
+        """Release the ports, e.g. for the Livox SDK during a recording."""
+        with self._cond:
+            if self._suspended or self._closed:
+                return
+            self._suspended = True
+        self._release()
+
+    def resume(self) -> None:
+        """Listen on the ports again after :meth:`suspend`."""
+        with self._cond:
+            if not self._suspended or self._closed:
+                return
+            self._suspended = False
+        try:
+            self._bind()
+        except OSError as e:
+            logger.warning("LiDAR heartbeat detection unavailable: %s", e)
+
+    def close(self) -> None:
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._release()
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join(timeout=2)
+
+    # ---- state --------------------------------------------------------------------
+    @property
+    def detected(self) -> bool:
+        with self._cond:
+            return self._detected
+
+    def heartbeat(self) -> None:
+        """Record evidence of the LiDAR from elsewhere (a captured frame)."""
+        with self._cond:
+            self._last_seen = time.monotonic()
+            self._cond.notify_all()
+
+    def wait(self, timeout: float) -> bool:
+        """Wait up to ``timeout`` seconds for the LiDAR to be detected."""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while not self._detected and not self._closed:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            return self._detected
+
+    # ---- listener -------------------------------------------------------------------
+    def _drain(self, sockets: List[socket.socket]) -> int:
+        received = 0
+        for s in sockets:
+            for _ in range(_DRAIN_LIMIT):
+                try:
+                    s.recv(2048)
+                except (BlockingIOError, InterruptedError):
+                    break
+                except OSError:
+                    # Closed by suspend()
+                    break
+                received += 1
+        return received
+
+    def _run(self) -> None:
+        while True:
+            self._update()
+            with self._cond:
+                if self._closed:
+                    return
+                sockets = list(self._sockets)
+                limit = self.suspended_timeout if self._suspended else self.timeout
+                last = self._last_seen
+            now = time.monotonic()
+            present = last is not None and now - last < limit
+            if not sockets:
+                # Suspended (or unbound): only heartbeats and expiry matter
+                with self._cond:
+                    if not self._closed and self._sockets == [] and self._last_seen == last:
+                        self._cond.wait(last + limit - now if present else None)
+            elif present:
+                # Present: checking a few times per timeout is enough
+                with self._cond:
+                    self._cond.wait(min(self.timeout / 4, last + limit - now))
+                if self._drain(sockets):
+                    self._seen()
+            else:
+                try:
+                    readable, _, _ = select.select(sockets, [], [], 1.0)
+                except (OSError, ValueError):
+                    # A socket was closed by suspend()
+                    readable = []
+                if readable and self._drain(readable):
+                    self._seen()
+
+    def _seen(self) -> None:
+        with self._cond:
+            self._last_seen = time.monotonic()
+
+    def _update(self) -> None:
+        with self._cond:
+            limit = self.suspended_timeout if self._suspended else self.timeout
+            detected = self._last_seen is not None and time.monotonic() - self._last_seen < limit
+            changed = detected != self._detected
+            self._detected = detected
+            if changed:
+                self._cond.notify_all()
+        if changed:
+            logger.info("LiDAR %s", "detected" if detected else "lost")
+            if self.on_change:
+                self.on_change(detected)
@@ -1,78 +1,360 @@
+"""Application logging.
+
+Log calls never wait for the console or the USB drive: the root logger only
+puts records on a bounded queue (dropping, and counting, records if it ever
+fills up) and appends them to an in-memory ring buffer.  A background
+:class:`LogWriter` takes records off the queue in batches, writes them to the
+console and to ``<drive>/logs/tecscanner.log`` and flushes the file every
+``LOG_FLUSH_INTERVAL`` seconds; file rotation happens on that thread too.
+``LOG_FORMAT=json`` switches both outputs to one JSON object per line.
+
+The ring buffer keeps the last ``LOG_BUFFER_RECORDS`` records so recent logs
+can be read over HTTP (``/logs``) without touching the drive.
+
+Only one process may own the log file, since each writer rotates by its own
+count of bytes written.  With a control process (``LIVOX_CONTROL_SOCKET``)
+that is the control process; the HTTP workers log to the console and their
+ring buffer only.
+"""
+
+import atexit
+import collections
+import copy
+import json
 import logging
 import logging.handlers
 import os
-import re
-import subprocess
+import queue
+import sys
+import threading
+import time
+from datetime import datetime, timezone
 from pathlib import Path
-from typing import List, Optional
+from typing import Deque, List, Optional, TextIO
 
+from .mounts import get_monitor, mount_roots_from_env
 
-def _find_usb_mount(mount_roots: List[str]) -> Optional[Path]:
-    """Return the first writable ``<root>/usbN`` mount under ``mount_roots``.
+_FORMAT = "%(asctime)s %(levelname)s [%(name)s] %(message)s"
+_LOG_NAME = "tecscanner.log"
+_BATCH_RECORDS = 512
 
-    The helper probes the system using ``mount`` and ``lsblk`` and falls back
-    to scanning the filesystem directly.  Any detected mount point must be
-    writable before it is returned.
-    """
+_writer: Optional["LogWriter"] = None
+_ring: Optional["RingBufferHandler"] = None
+_queue_handler: Optional["_QueueHandler"] = None
+_file_logging = False
 
-    prefixes = [f"{r.rstrip('/')}/usb" for r in mount_roots if r]
 
-    # Probe using the ``mount`` command
-    try:
-        result = subprocess.run(["mount"], capture_output=True, text=True, check=False)
-        for line in result.stdout.splitlines():
-            parts = line.split()
-            if len(parts) >= 3:
-                mp = parts[2]
-                if any(mp.startswith(p) for p in prefixes) and os.access(mp, os.W_OK):
-                    return Path(mp)
-    except OSError:
-        pass
+class JsonFormatter(logging.Formatter):
+    """Format records as single-line JSON objects."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "thread": record.threadName,
+        }
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class RingBufferHandler(logging.Handler):
+    """Keep the most recent records in memory."""
+
+    def __init__(self, capacity: int = 1000):
+        super().__init__()
+        self._records: Deque[dict] = collections.deque(maxlen=capacity)
+        self._seq = 0
+
+    def emit(self, record: logging.LogRecord) -> None:
+        try:
+            message = record.getMessage()
+        except Exception:
+            message = str(record.msg)
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "levelno": record.levelno,
+            "logger": record.name,
+            "message": message,
+        }
+        if record.exc_info:
+            entry["exc"] = logging.Formatter().formatException(record.exc_info)
+        with self.lock:
+            self._seq += 1
+            entry["seq"] = self._seq
+            self._records.append(entry)
+
+    def records(self, level: int = logging.NOTSET, limit: int = 200, since: Optional[int] = None) -> List[dict]:
+        """Return up to ``limit`` of the newest records at ``level`` or above.
+
+        ``since`` only returns records with a larger ``seq``, so a client can
+        poll for what is new.
+        """
+        with self.lock:
+            entries = list(self._records)
+        selected = [
+            e for e in entries if e["levelno"] >= level and (since is None or e["seq"] > since)
+        ]
+        return selected[-limit:] if limit > 0 else []
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """Queue records without ever blocking; count what has to be dropped."""
+
+    def __init__(self, q: "queue.Queue"):
+        super().__init__(q)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Merge the arguments and render the traceback now; the writer thread
+        # must not depend on objects the caller may still mutate.
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
 
-    # Fallback to ``lsblk`` which lists mount points per block device
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class LogWriter:
+    """Write queued records to the console and a rotating file in batches."""
+
+    def __init__(
+        self,
+        q: "queue.Queue",
+        formatter: logging.Formatter,
+        stream: Optional[TextIO] = None,
+        flush_interval: float = 1.0,
+        max_bytes: int = 5 * 1024 * 1024,
+        backup_count: int = 3,
+    ):
+        self.queue = q
+        self.formatter = formatter
+        self.stream = stream
+        self.flush_interval = flush_interval
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self._lock = threading.Lock()
+        self._path: Optional[Path] = None
+        self._file: Optional[TextIO] = None
+        self._size = 0
+        self._pending: List[str] = []
+        self._last_flush = time.monotonic()
+        self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+        self._thread.start()
+
+    @property
+    def path(self) -> Optional[Path]:
+        with self._lock:
+            return self._path
+
+    def set_file(self, path: Optional[Path]) -> None:
+        """Write to ``path`` from now on (``None`` stops file logging)."""
+        with self._lock:
+            self._path = path
+        # Wake the writer so it switches files promptly (a full queue wakes
+        # it anyway)
+        try:
+            self.queue.put_nowait(None)
+        except queue.Full:
+            pass
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """Write out everything queued and close the file."""
+        try:
+            self.queue.put(StopIteration, timeout=timeout)
+        except queue.Full:
+            return
+        self._thread.join(timeout)
+
+    # ---- writer thread ------------------------------------------------------------
+    def _run(self) -> None:
+        running = True
+        while running:
+            wait = max(0.0, self._last_flush + self.flush_interval - time.monotonic())
+            batch = []
+            try:
+                batch.append(self.queue.get(timeout=wait if self._pending else None))
+                while len(batch) < _BATCH_RECORDS:
+                    batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                pass
+            if StopIteration in batch:
+                running = False
+            lines = []
+            for record in batch:
+                if isinstance(record, logging.LogRecord):
+                    try:
+                        lines.append(self.formatter.format(record) + "\n")
+                    except Exception:
+                        lines.append(f"{record.levelname} [{record.name}] {record.msg}\n")
+            if lines:
+                self._write_stream("".join(lines))
+                self._pending.extend(lines)
+            self._sync_file()
+            if self._pending and (
+                not running or time.monotonic() - self._last_flush >= self.flush_interval
+            ):
+                self._flush()
+        self._close_file()
+
+    def _write_stream(self, text: str) -> None:
+        if self.stream is None:
+            return
+        try:
+            self.stream.write(text)
+            self.stream.flush()
+        except (OSError, ValueError):
+            pass
+
+    def _sync_file(self) -> None:
+        """Open or close the file after :meth:`set_file`."""
+        with self._lock:
+            path = self._path
+        current = Path(self._file.name) if self._file else None
+        if path == current:
+            return
+        if self._file:
+            self._flush()
+            self._close_file()
+        if path is None:
+            self._pending.clear()
+            return
+        try:
+            self._file = open(path, "a", encoding="utf-8")
+            self._size = self._file.tell()
+        except OSError as e:
+            self._file = None
+            self._report(f"cannot open log file {path}: {e}")
+            with self._lock:
+                if self._path == path:
+                    self._path = None
+
+    def _flush(self) -> None:
+        text = "".join(self._pending)
+        self._pending.clear()
+        self._last_flush = time.monotonic()
+        if self._file is None or not text:
+            return
+        name = self._file.name
+        if self.max_bytes and self._size + len(text) > self.max_bytes and self._size:
+            if not self._rotate():
+                return
+        try:
+            self._file.write(text)
+            self._file.flush()
+            self._size += len(text)
+        except OSError as e:
+            self._report(f"log file {name} failed: {e}; file logging disabled")
+            self._disable_file(name)
+
+    def _rotate(self) -> bool:
+        """Start a new file; on failure fall back to console-only logging."""
+        name = self._file.name
+        self._close_file()
+        try:
+            for i in range(self.backup_count - 1, 0, -1):
+                src = f"{name}.{i}"
+                if os.path.exists(src):
+                    os.replace(src, f"{name}.{i + 1}")
+            if self.backup_count > 0:
+                os.replace(name, f"{name}.1")
+            self._file = open(name, "w", encoding="utf-8")
+        except OSError as e:
+            self._report(f"cannot rotate log file {name}: {e}; file logging disabled")
+            self._disable_file(name)
+            return False
+        self._size = 0
+        return True
+
+    def _disable_file(self, name: str) -> None:
+        self._close_file()
+        with self._lock:
+            # Unless set_file() already switched to another file
+            if self._path == Path(name):
+                self._path = None
+
+    def _close_file(self) -> None:
+        f, self._file = self._file, None
+        if f:
+            try:
+                f.close()
+            except OSError:
+                pass
+
+    def _report(self, message: str) -> None:
+        # Not through logging: this thread is the one draining the queue
+        self._write_stream(f"{message}\n")
+
+
+def _attach_file_handler(mount: Path) -> Optional[Path]:
+    """Send file logging to ``<mount>/logs``."""
+    root = logging.getLogger()
+    log_dir = mount / "logs"
     try:
-        result = subprocess.run(
-            ["lsblk", "-nr", "-o", "MOUNTPOINT"],
-            capture_output=True,
-            text=True,
-            check=False,
-        )
-        for mp in result.stdout.splitlines():
-            if any(mp.startswith(p) for p in prefixes) and os.access(mp, os.W_OK):
-                return Path(mp)
+        log_dir.mkdir(parents=True, exist_ok=True)
     except OSError:
-        pass
+        root.warning("Unable to create log directory %s", log_dir)
+        return None
 
-    # Final fallback: scan the mount roots directly
-    for root in mount_roots:
-        base = Path(root.rstrip("/"))
-        try:
-            candidates = [
-                p
-                for p in base.glob("usb*")
-                if os.path.ismount(p) and os.access(p, os.W_OK)
-            ]
-        except OSError:
-            continue
-        if candidates:
-            candidates.sort(
-                key=lambda p: int(re.search(r"usb(\d+)$", p.name).group(1))
-                if re.search(r"usb(\d+)$", p.name)
-                else float("inf"),
-            )
-            return candidates[0]
+    log_file = log_dir / _LOG_NAME
+    _writer.set_file(log_file)
+    root.info("Logging initialised; writing to %s", log_file)
+    return log_file
+
+
+def _detach_file_handlers() -> None:
+    if _writer:
+        _writer.set_file(None)
+
+
+def _on_mount_change(old: Optional[Path], new: Optional[Path]) -> None:
+    """Move file logging along with the USB drive."""
+    _detach_file_handlers()
+    if new:
+        _attach_file_handler(new)
+    else:
+        logging.getLogger().warning("USB storage removed; file logging disabled")
 
-    return None
 
+def recent_logs(level: int = logging.NOTSET, limit: int = 200, since: Optional[int] = None) -> dict:
+    """Records from the in-memory ring buffer, oldest first."""
+    records = _ring.records(level, limit, since) if _ring else []
+    return {
+        "records": records,
+        "next": records[-1]["seq"] if records else since,
+        "dropped": _queue_handler.dropped if _queue_handler else 0,
+    }
 
-def configure_logging() -> Optional[Path]:
+
+def configure_logging(file_logging: bool = True) -> Optional[Path]:
     """Configure logging to console and a file on the USB drive if available.
 
-    Returns the path to the log file if one was created, otherwise ``None``.
+    The file follows the drive: logging switches to it when a drive is
+    mounted and stops when the drive disappears.  The drive is looked up in
+    the background so start-up never waits for it.  With ``file_logging``
+    false only the console and the ring buffer are used until
+    :func:`enable_file_logging` is called.  Returns the path to the log file
+    if one is already configured, otherwise ``None``.
     """
+    global _writer, _ring, _queue_handler
     root = logging.getLogger()
     if root.handlers:
         # Logging already configured
+        if _writer:
+            return _writer.path
         for h in root.handlers:
             if isinstance(h, logging.FileHandler):
                 try:
@@ -84,30 +366,47 @@ def configure_logging() -> Optional[Path]:
     level = os.getenv("LOG_LEVEL", "INFO").upper()
     root.setLevel(level)
 
-    fmt = logging.Formatter("%(asctime)s %(levelname)s [%(name)s] %(message)s")
+    if os.getenv("LOG_FORMAT", "text").lower() == "json":
+        formatter: logging.Formatter = JsonFormatter()
+    else:
+        formatter = logging.Formatter(_FORMAT)
+    q: "queue.Queue" = queue.Queue(maxsize=int(os.getenv("LOG_QUEUE_SIZE", "10000")))
+    _writer = LogWriter(
+        q,
+        formatter,
+        stream=sys.stderr,
+        flush_interval=float(os.getenv("LOG_FLUSH_INTERVAL", "1")),
+        max_bytes=int(float(os.getenv("LOG_FILE_MAX_MB", "5")) * 1024 * 1024),
+        backup_count=int(os.getenv("LOG_FILE_BACKUPS", "3")),
+    )
+    atexit.register(_writer.stop)
+    _queue_handler = _QueueHandler(q)
+    _ring = RingBufferHandler(int(os.getenv("LOG_BUFFER_RECORDS", "1000")))
+    root.addHandler(_queue_handler)
+    root.addHandler(_ring)
 
-    stream = logging.StreamHandler()
-    stream.setFormatter(fmt)
-    root.addHandler(stream)
+    if file_logging:
+        enable_file_logging()
+    return None
 
-    roots = os.getenv("LIVOX_MOUNT_ROOTS", "/media:/run/media").split(os.pathsep)
-    mount = _find_usb_mount(roots)
-    if not mount:
-        root.warning("No writable USB storage found; file logging disabled")
-        return None
 
-    log_dir = mount / "logs"
-    try:
-        log_dir.mkdir(parents=True, exist_ok=True)
-    except OSError:
-        root.warning("Unable to create log directory %s", log_dir)
-        return None
+def enable_file_logging() -> None:
+    """Write the log file on the USB drive from this process.
 
-    log_file = log_dir / "tecscanner.log"
-    file_handler = logging.handlers.RotatingFileHandler(
-        log_file, maxBytes=5 * 1024 * 1024, backupCount=3
-    )
-    file_handler.setFormatter(fmt)
-    root.addHandler(file_handler)
-    root.info("Logging initialised; writing to %s", log_file)
-    return log_file
+    Call it in exactly one process; it also starts watching the mounts.
+    """
+    global _file_logging
+    if _writer is None or _file_logging:
+        return
+    _file_logging = True
+    threading.Thread(target=_attach_initial, name="log-init", daemon=True).start()
+
+
+def _attach_initial() -> None:
+    monitor = get_monitor(mount_roots_from_env())
+    mount = monitor.current()
+    monitor.subscribe(_on_mount_change)
+    if not mount:
+        logging.getLogger().warning("No writable USB storage found; file logging disabled")
+        return
+    _attach_file_handler(mount)
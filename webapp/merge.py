@@ -0,0 +1,521 @@
+"""Post-session merge of frame files into one point cloud.
+
+Downstream processing wants one cloud per session rather than hundreds of
+``frame_NNNNNN.laz`` files.  :class:`MergeQueue` merges finished sessions in
+a background thread, only while no recording is running.  Frames are decoded
+in that thread, or by a pool of ``workers`` spawned processes, and streamed
+chunk by chunk into ``merged.laz`` in the session directory, so
+memory use depends on the number of frames in flight, not on the session
+length.  The points of a multi-LiDAR session are tagged with the device's
+number in ``point_source_id`` (see ``sources`` in the job state).
+
+Jobs survive power loss.  Their state is kept in ``merged.json`` next to the
+output.  Every ``checkpoint_frames`` frames the output (``merged.laz.part``
+until it is complete) is closed and synced and the number of merged frames
+and the file size are recorded.  A resumed job truncates the output to the
+last checkpoint and appends from the next frame.  A recording starting
+during a merge ends the job at a checkpoint; it is resumed afterwards.
+
+With ``tile_size`` (metres) the merged cloud is also split into a grid of
+``tiles/tile_<x>_<y>.laz`` files, listed with their point counts in
+``tiles/tiles.json``, so a spatial query reads only the tiles it overlaps.
+
+Writing LAZ requires ``laspy`` with the ``lazrs`` backend.
+"""
+
+import collections
+import concurrent.futures
+import itertools
+import json
+import logging
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import TYPE_CHECKING, Callable, Deque, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from . import container, las_io
+from .downloads import RateLimiter
+
+if TYPE_CHECKING:
+    import numpy as np
+
+logger = logging.getLogger(__name__)
+
+MERGED_NAME = "merged.laz"
+STATE_NAME = "merged.json"
+TILES_DIR = "tiles"
+# Tile writers open at the same time; each buffers a compressed chunk
+MAX_TILES = 64
+
+
+class MergeError(RuntimeError):
+    """Raised when a session cannot be merged."""
+
+
+def _job_errors() -> tuple:
+    """What a failed job may raise; anything else is logged with its traceback."""
+    return (OSError, ValueError, MergeError) + las_io.laz_errors()
+
+
+class _Interrupted(Exception):
+    """A recording started (or the queue closed); the job stopped at a checkpoint."""
+
+
+class FrameSource(NamedTuple):
+    path: str
+    # Frames packed into a session container: record offset and size
+    offset: Optional[int] = None
+    size: Optional[int] = None
+    # ``point_source_id`` given to the frame's points (multi-LiDAR sessions)
+    source_id: Optional[int] = None
+
+
+def session_frames(session: Path) -> Tuple[List[FrameSource], Dict[str, int]]:
+    """Frames of ``session`` in merge order and the source IDs of its devices."""
+    frames: List[FrameSource] = []
+    sources: Dict[str, int] = {}
+    subdirs = sorted(p for p in session.iterdir() if p.is_dir() and p.name != TILES_DIR)
+    for directory in [session, *subdirs]:
+        found = _frames_in(directory)
+        if not found:
+            continue
+        source_id = None
+        if directory != session:
+            source_id = len(sources) + 1
+            sources[directory.name] = source_id
+        frames.extend(f._replace(source_id=source_id) for f in found)
+    return frames, sources
+
+
+def _frames_in(directory: Path) -> List[FrameSource]:
+    packed = directory / container.CONTAINER_NAME
+    if packed.exists():
+        reader = container.ContainerReader(packed)
+        return [FrameSource(str(packed), e.offset, e.size) for e in reader.frames()]
+    return [FrameSource(str(p)) for p in sorted(directory.glob("frame_*.la[sz]"))]
+
+
+def _read_frame_header(frame: FrameSource) -> las_io.LasHeader:
+    with open(frame.path, "rb") as f:
+        if frame.offset is not None:
+            f.seek(frame.offset)
+        return las_io.read_header(f)
+
+
+def _decode_frame(
+    frame: FrameSource,
+    point_format: int,
+    scale: Tuple[float, float, float],
+    offset: Tuple[float, float, float],
+    chunk_points: int,
+) -> List["np.ndarray"]:
+    """Decode one frame into point records of the merged file.
+
+    Runs in a worker process.  Points are rescaled if the frame's scale or
+    offset differ from the merged file's.
+    """
+    dtype = las_io.point_dtype(point_format)
+    if frame.offset is None:
+        return [
+            _convert(header, records, dtype, scale, offset, frame.source_id)
+            for header, records in las_io.iter_chunks(Path(frame.path), chunk_points)
+        ]
+    # A packed frame is copied out of the container for the decoder
+    with open(frame.path, "rb") as f:
+        f.seek(frame.offset)
+        data = f.read(frame.size)
+    with tempfile.NamedTemporaryFile(suffix=".laz") as tmp:
+        tmp.write(data)
+        tmp.flush()
+        return [
+            _convert(header, records, dtype, scale, offset, frame.source_id)
+            for header, records in las_io.iter_chunks(Path(tmp.name), chunk_points)
+        ]
+
+
+def _convert(header: las_io.LasHeader, records, dtype, scale, offset, source_id: Optional[int]):
+    np = las_io.numpy()
+    out = np.zeros(len(records), dtype=dtype)
+    for name in dtype.names:
+        if name in records.dtype.names:
+            out[name] = records[name]
+    if tuple(header.scale) != tuple(scale) or tuple(header.offset) != tuple(offset):
+        for axis, name in enumerate(("X", "Y", "Z")):
+            real = records[name] * header.scale[axis] + header.offset[axis]
+            out[name] = np.round((real - offset[axis]) / scale[axis])
+    if source_id is not None:
+        out["point_source_id"] = source_id
+    return out
+
+
+def read_state(session: Path) -> Optional[dict]:
+    try:
+        with open(session / STATE_NAME) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_state(session: Path, state: dict) -> None:
+    path = session / STATE_NAME
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "w") as f:
+        json.dump(state, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def _fsync(path: Path) -> None:
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class MergeQueue:
+    """Background job merging the frames of finished sessions.
+
+    ``paused`` is polled between frames; while it returns ``True`` no job
+    runs.  ``limiter`` paces the decoded point data written per second.
+    ``on_progress(session_name, state)`` is called with the job state at
+    every checkpoint and when a job ends.
+    """
+
+    def __init__(
+        self,
+        workers: int = 1,
+        tile_size: float = 0.0,
+        checkpoint_frames: int = 50,
+        chunk_points: int = las_io.DEFAULT_CHUNK_POINTS,
+        paused: Callable[[], bool] = lambda: False,
+        on_progress: Optional[Callable[[str, dict], None]] = None,
+        limiter: Optional[RateLimiter] = None,
+    ):
+        self.workers = max(1, workers)
+        self.tile_size = tile_size
+        self.checkpoint_frames = max(1, checkpoint_frames)
+        self.chunk_points = chunk_points
+        self.paused = paused
+        self.on_progress = on_progress
+        self.limiter = limiter
+        self._cond = threading.Condition()
+        self._queue: Deque[Path] = collections.deque()
+        self._closed = False
+        self._current: Optional[Path] = None
+        self._progress = {"frames_done": 0, "frames_total": 0}
+        self._last: Optional[dict] = None
+        self._thread = threading.Thread(target=self._run, name="session-merge", daemon=True)
+        self._thread.start()
+
+    def submit(self, session: Path) -> bool:
+        """Queue ``session``; returns ``False`` if it is already pending."""
+        with self._cond:
+            if self._closed or session in self._queue or self._current == session:
+                return False
+            state = read_state(session) or {}
+            if state.get("state") not in ("queued", "running"):
+                # Persist the job so it is picked up again after a power cut
+                try:
+                    _write_state(session, {"state": "queued"})
+                except OSError as e:
+                    logger.warning("Cannot queue merge of %s: %s", session.name, e)
+                    return False
+            self._queue.append(session)
+            self._cond.notify_all()
+            return True
+
+    def recover(self, output_dir: Path) -> int:
+        """Queue the sessions whose merge was interrupted."""
+        try:
+            sessions = sorted(p for p in output_dir.glob("session_*") if (p / STATE_NAME).exists())
+        except OSError:
+            return 0
+        resumed = 0
+        for session in sessions:
+            if (read_state(session) or {}).get("state") in ("queued", "running"):
+                resumed += self.submit(session)
+        if resumed:
+            logger.info("Resuming %d interrupted session merges", resumed)
+        return resumed
+
+    def status(self) -> dict:
+        with self._cond:
+            return {
+                "active": self._current.name if self._current else None,
+                "queued": [p.name for p in self._queue],
+                **self._progress,
+                "last": self._last,
+            }
+
+    def close(self) -> None:
+        with self._cond:
+            self._closed = True
+            self._queue.clear()
+            self._cond.notify_all()
+        self._thread.join(timeout=30)
+
+    # ---- worker ---------------------------------------------------------------------
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._closed and (not self._queue or self.paused()):
+                    # Re-check the pause flag while jobs are waiting
+                    self._cond.wait(1.0 if self._queue else None)
+                if self._closed:
+                    return
+                session = self._queue.popleft()
+                self._current = session
+                self._progress = dict.fromkeys(self._progress, 0)
+            try:
+                state = self._merge(session)
+            except _Interrupted:
+                with self._cond:
+                    self._current = None
+                    if not self._closed:
+                        self._queue.appendleft(session)
+                logger.info("Merge of %s interrupted; it resumes later", session.name)
+                continue
+            except _job_errors() as e:
+                logger.warning("Cannot merge %s: %s", session.name, e)
+                state = self._failed(session, e)
+            except Exception as e:
+                # Keep the queue alive (a crashed decoder process raises
+                # BrokenProcessPool, for one) and do not retry the job on
+                # every start
+                logger.exception("Merge of %s failed", session.name)
+                state = self._failed(session, e)
+            with self._cond:
+                self._current = None
+                self._last = dict(state, session=session.name)
+            self._report(session, state)
+
+    @staticmethod
+    def _failed(session: Path, error: Exception) -> dict:
+        state = {"state": "failed", "error": str(error) or type(error).__name__}
+        try:
+            _write_state(session, state)
+        except OSError:
+            pass
+        return state
+
+    def _interrupted(self) -> bool:
+        return self._closed or self.paused()
+
+    def _report(self, session: Path, state: dict) -> None:
+        with self._cond:
+            self._progress = {
+                "frames_done": state.get("frames_done", 0),
+                "frames_total": state.get("frames_total", 0),
+            }
+        if self.on_progress:
+            self.on_progress(session.name, state)
+
+    def _merge(self, session: Path) -> dict:
+        if las_io.laspy() is None or las_io.numpy() is None:
+            raise MergeError("merging requires numpy and laspy")
+        t0 = time.monotonic()
+        state = read_state(session) or {}
+        merged = session / MERGED_NAME
+        if not (state.get("phase") == "tiling" and merged.exists()):
+            state = self._merge_frames(session, state)
+        if self.tile_size > 0:
+            state["tiles"] = self._write_tiles(session, merged)
+        state.update(
+            state="done",
+            file=MERGED_NAME,
+            size=merged.stat().st_size,
+            finished=datetime.utcnow().isoformat(),
+        )
+        state.pop("phase", None)
+        state["seconds"] = round(state.get("seconds", 0) + time.monotonic() - t0, 3)
+        _write_state(session, state)
+        logger.info("Merged %s: %d points in %.1f s", session.name, state["points"], state["seconds"])
+        return state
+
+    def _merge_frames(self, session: Path, state: dict) -> dict:
+        laspy = las_io.laspy()
+        frames, sources = session_frames(session)
+        if not frames:
+            raise MergeError("no frames to merge")
+        part = session / (MERGED_NAME + ".part")
+        resumable = (
+            state.get("state") == "running"
+            and state.get("frames_total") == len(frames)
+            and state.get("frames_done", 0) > 0
+            and part.exists()
+            and part.stat().st_size >= state.get("size", 0) > 0
+        )
+        if resumable:
+            # Drop whatever was written after the last checkpoint
+            os.truncate(part, state["size"])
+            logger.info("Resuming merge of %s at frame %d", session.name, state["frames_done"])
+        else:
+            header = _read_frame_header(frames[0])
+            part.unlink(missing_ok=True)
+            state = {
+                "state": "running",
+                "frames_total": len(frames),
+                "frames_done": 0,
+                "points": 0,
+                "size": 0,
+                "sources": sources,
+                "point_format": header.point_format,
+                "scale": list(header.scale),
+                "offset": list(header.offset),
+                "started": datetime.utcnow().isoformat(),
+            }
+        point_format = state["point_format"]
+        scale = tuple(state["scale"])
+        offset = tuple(state["offset"])
+        done = state["frames_done"]
+        self._report(session, state)
+        writer = self._open_writer(part, point_format, scale, offset, append=done > 0)
+        decoded = self._decoded(frames[done:], (point_format, scale, offset, self.chunk_points))
+        try:
+            for chunks in decoded:
+                for records in chunks:
+                    points = laspy.ScaleAwarePointRecord(
+                        records, laspy.PointFormat(point_format), scale, offset
+                    )
+                    if hasattr(writer, "append_points"):
+                        writer.append_points(points)
+                    else:
+                        writer.write_points(points)
+                    state["points"] += len(records)
+                    if self.limiter:
+                        self.limiter.consume(records.nbytes)
+                done += 1
+                interrupted = self._interrupted()
+                if done % self.checkpoint_frames and done < len(frames) and not interrupted:
+                    continue
+                writer.close()
+                writer = None
+                _fsync(part)
+                state.update(frames_done=done, size=part.stat().st_size)
+                _write_state(session, state)
+                self._report(session, state)
+                if interrupted and done < len(frames):
+                    raise _Interrupted()
+                if done < len(frames):
+                    writer = self._open_writer(part, point_format, scale, offset, append=True)
+        finally:
+            # Stops the worker pool
+            decoded.close()
+            if writer is not None:
+                writer.close()
+        os.replace(part, session / MERGED_NAME)
+        state["phase"] = "tiling"
+        _write_state(session, state)
+        return state
+
+    def _open_writer(self, path: Path, point_format: int, scale, offset, append: bool):
+        laspy, np = las_io.laspy(), las_io.numpy()
+        if append:
+            return laspy.open(str(path), mode="a")
+        header = laspy.LasHeader(point_format=point_format, version="1.4" if point_format >= 6 else "1.2")
+        header.scales = np.array(scale)
+        header.offsets = np.array(offset)
+        return laspy.open(str(path), mode="w", header=header, do_compress=True)
+
+    def _decoded(self, frames: List[FrameSource], params: tuple) -> Iterator[List["np.ndarray"]]:
+        """Decoded frames in order, at most two per worker in flight."""
+        if self.workers == 1:
+            for frame in frames:
+                yield _decode_frame(frame, *params)
+            return
+        # Spawned, not forked: a child forked from this heavily threaded
+        # process inherits whatever locks other threads held (the log
+        # queue's, lazrs' own) and can hang on them.  The webapp package
+        # builds no recorder when imported in a child process.
+        context = multiprocessing.get_context("spawn")
+        with concurrent.futures.ProcessPoolExecutor(self.workers, mp_context=context) as pool:
+            remaining = iter(frames)
+            pending: Deque[concurrent.futures.Future] = collections.deque(
+                pool.submit(_decode_frame, f, *params)
+                for f in itertools.islice(remaining, self.workers * 2)
+            )
+            try:
+                while pending:
+                    chunks = pending.popleft().result()
+                    frame = next(remaining, None)
+                    if frame is not None:
+                        pending.append(pool.submit(_decode_frame, frame, *params))
+                    yield chunks
+            finally:
+                for future in pending:
+                    future.cancel()
+
+    def _write_tiles(self, session: Path, merged: Path) -> int:
+        """Split ``merged`` into a grid of tiles; returns the number of tiles."""
+        laspy, np = las_io.laspy(), las_io.numpy()
+        tmp = session / (TILES_DIR + ".part")
+        shutil.rmtree(tmp, ignore_errors=True)
+        tmp.mkdir()
+        writers: Dict[Tuple[int, int], object] = {}
+        counts: Dict[Tuple[int, int], int] = {}
+        try:
+            with laspy.open(str(merged)) as reader:
+                header = reader.header
+                for points in reader.chunk_iterator(self.chunk_points):
+                    if self._interrupted():
+                        raise _Interrupted()
+                    ix = np.floor(np.asarray(points.x) / self.tile_size).astype(np.int64)
+                    iy = np.floor(np.asarray(points.y) / self.tile_size).astype(np.int64)
+                    order = np.lexsort((iy, ix))
+                    ix, iy = ix[order], iy[order]
+                    bounds = np.flatnonzero((np.diff(ix) != 0) | (np.diff(iy) != 0)) + 1
+                    starts = np.concatenate(([0], bounds))
+                    for start, group in zip(starts, np.split(order, bounds)):
+                        key = (int(ix[start]), int(iy[start]))
+                        writer = writers.get(key)
+                        if writer is None:
+                            if len(writers) >= MAX_TILES:
+                                raise MergeError(
+                                    f"more than {MAX_TILES} tiles; use a larger tile size"
+                                )
+                            tile_header = laspy.LasHeader(
+                                point_format=header.point_format, version=header.version
+                            )
+                            tile_header.scales = header.scales
+                            tile_header.offsets = header.offsets
+                            writer = laspy.open(
+                                str(tmp / f"tile_{key[0]}_{key[1]}.laz"),
+                                mode="w",
+                                header=tile_header,
+                                do_compress=True,
+                            )
+                            writers[key] = writer
+                            counts[key] = 0
+                        writer.write_points(points[group])
+                        counts[key] += len(group)
+        finally:
+            for writer in writers.values():
+                writer.close()
+        index = {
+            "tile_size": self.tile_size,
+            "tiles": [
+                {
+                    "file": f"tile_{x}_{y}.laz",
+                    "x": x,
+                    "y": y,
+                    "mins": [x * self.tile_size, y * self.tile_size],
+                    "maxs": [(x + 1) * self.tile_size, (y + 1) * self.tile_size],
+                    "points": n,
+                }
+                for (x, y), n in sorted(counts.items())
+            ],
+        }
+        with open(tmp / "tiles.json", "w") as f:
+            json.dump(index, f)
+        for path in tmp.iterdir():
+            _fsync(path)
+        shutil.rmtree(session / TILES_DIR, ignore_errors=True)
+        os.replace(tmp, session / TILES_DIR)
+        return len(counts)
@@ -0,0 +1,181 @@
+"""Per-stage frame timing and throughput metrics.
+
+:class:`FrameMetrics` collects how long each stage of each frame takes
+(recorder capture, LAZ write, auxiliary files, CSV conversion, preview,
+waiting in the post-processing queue) in rolling windows and keeps cumulative counters
+for frames, bytes, failures and retries.  The data is exported in the
+Prometheus text format for ``/metrics`` and as a compact summary for
+``status()``.
+"""
+
+import math
+import threading
+import time
+from collections import deque
+from typing import Deque, Dict, Iterable, List, Optional, Tuple
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+STAGES = {
+    "capture": "Time for the recorder to capture and write one frame",
+    "laz_write": "LAZ write time reported by save_laz",
+    "recorder_start": "Time to start the persistent recorder",
+    "queue_wait": "Time a frame waited for a post-processing worker",
+    "aux": "Time to write auxiliary metadata files",
+    "convert": "Time to export a frame to CSV",
+    "preview": "Time to fold a frame into the session preview",
+    "checksum": "Time to checksum a frame for the session manifest",
+    "stop": "Time from a stop request until the session is finalized",
+}
+
+
+class RollingHistogram:
+    """Keep the most recent ``window`` samples plus cumulative count/sum."""
+
+    def __init__(self, window: int = 1024):
+        self._samples: Deque[float] = deque(maxlen=window)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, value: float) -> None:
+        self._samples.append(value)
+        self.count += 1
+        self.total += value
+
+    def quantiles(self, qs: Iterable[float] = QUANTILES) -> Dict[float, Optional[float]]:
+        samples = sorted(self._samples)
+        if not samples:
+            return {q: None for q in qs}
+        n = len(samples)
+        # nearest-rank percentile
+        return {q: samples[min(n - 1, max(0, math.ceil(q * n) - 1))] for q in qs}
+
+
+class RateMeter:
+    """Events and amounts per second over a sliding time window."""
+
+    def __init__(self, window: float = 30.0):
+        self.window = window
+        self._events: Deque[Tuple[float, float]] = deque()
+
+    def add(self, amount: float = 1.0, now: Optional[float] = None) -> None:
+        now = time.monotonic() if now is None else now
+        self._events.append((now, amount))
+        self._trim(now)
+
+    def _trim(self, now: float) -> None:
+        cutoff = now - self.window
+        while self._events and self._events[0][0] < cutoff:
+            self._events.popleft()
+
+    def rate(self, now: Optional[float] = None) -> float:
+        now = time.monotonic() if now is None else now
+        self._trim(now)
+        if not self._events:
+            return 0.0
+        span = max(now - self._events[0][0], 1.0)
+        return sum(a for _, a in self._events) / span
+
+
+class FrameMetrics:
+    """Thread-safe registry of frame stage timings and counters."""
+
+    def __init__(self, window: int = 1024, rate_window: float = 30.0):
+        self._lock = threading.Lock()
+        self.stages: Dict[str, RollingHistogram] = {
+            name: RollingHistogram(window) for name in STAGES
+        }
+        self.counters: Dict[str, float] = {
+            "frames_total": 0,
+            "bytes_total": 0,
+            "failures_total": 0,
+            "retries_total": 0,
+            "postprocess_failures_total": 0,
+            # Frames whose CSV export the governor deferred
+            "exports_deferred_total": 0,
+            # Frames captured without auxiliary files while the governor paused them
+            "aux_skipped_total": 0,
+        }
+        self._frames = RateMeter(rate_window)
+        self._bytes = RateMeter(rate_window)
+
+    def observe(self, stage: str, seconds: float) -> None:
+        with self._lock:
+            self.stages[stage].observe(seconds)
+
+    def frame(self, size: int) -> None:
+        now = time.monotonic()
+        with self._lock:
+            self.counters["frames_total"] += 1
+            self.counters["bytes_total"] += size
+            self._frames.add(1, now)
+            self._bytes.add(size, now)
+
+    def inc(self, counter: str, amount: float = 1) -> None:
+        with self._lock:
+            self.counters[counter] = self.counters.get(counter, 0) + amount
+
+    def summary(self) -> dict:
+        """Compact view for ``status()``: rates, counters and stage p50/p95/p99."""
+        with self._lock:
+            stages = {}
+            for name, hist in self.stages.items():
+                if not hist.count:
+                    continue
+                qs = hist.quantiles()
+                stages[name] = {f"p{int(q * 100)}": round(v, 4) for q, v in qs.items()}
+            return {
+                "frames_per_sec": round(self._frames.rate(), 3),
+                "bytes_per_sec": round(self._bytes.rate()),
+                "failures": int(self.counters["failures_total"]),
+                "retries": int(self.counters["retries_total"]),
+                "stages": stages,
+            }
+
+    def render_prometheus(self, extra: Optional[Dict[str, float]] = None) -> str:
+        """Return all metrics in the Prometheus text exposition format."""
+        lines: List[str] = []
+        with self._lock:
+            lines += [
+                "# HELP tecscanner_frame_stage_seconds Per-frame stage durations",
+                "# TYPE tecscanner_frame_stage_seconds summary",
+            ]
+            for name, hist in self.stages.items():
+                for q, v in hist.quantiles().items():
+                    if v is not None:
+                        lines.append(
+                            f'tecscanner_frame_stage_seconds{{stage="{name}",quantile="{q}"}} {v:.6f}'
+                        )
+                lines.append(f'tecscanner_frame_stage_seconds_sum{{stage="{name}"}} {hist.total:.6f}')
+                lines.append(f'tecscanner_frame_stage_seconds_count{{stage="{name}"}} {hist.count}')
+            for name, value in self.counters.items():
+                metric = f"tecscanner_{name}"
+                lines.append(f"# TYPE {metric} counter")
+                lines.append(f"{metric} {_format_value(value)}")
+            lines.append("# TYPE tecscanner_frames_per_second gauge")
+            lines.append(f"tecscanner_frames_per_second {self._frames.rate():.6f}")
+            lines.append("# TYPE tecscanner_bytes_per_second gauge")
+            lines.append(f"tecscanner_bytes_per_second {self._bytes.rate():.3f}")
+        for name, value in (extra or {}).items():
+            if value is None:
+                continue
+            metric = f"tecscanner_{name}"
+            lines.append(f"# TYPE {metric} gauge")
+            lines.append(f"{metric} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+def _format_value(value: float) -> str:
+    """Format a sample without losing precision.
+
+    Integral values (byte counters, free space) are written as integers;
+    ``:g`` would round them to six significant digits.
+    """
+    value = float(value)
+    if math.isnan(value):
+        return "NaN"
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if value.is_integer():
+        return str(int(value))
+    return repr(value)
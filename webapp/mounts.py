@@ -0,0 +1,215 @@
+"""Shared discovery of the removable USB drive.
+
+``usb-automount.sh`` mounts removable drives under ``<root>/usbN`` where
+``root`` defaults to ``/media``.  :class:`MountMonitor` reads
+``/proc/self/mountinfo`` directly instead of forking ``mount``/``lsblk`` and
+caches the result.  A background thread polls the mountinfo file, which the
+kernel flags with ``POLLPRI`` whenever the mount table changes, so the cache
+is only rebuilt on real mount/unmount events.  Interested components (the
+recording manager, the file log handler) subscribe to be told when a drive
+appears or disappears.
+"""
+
+import logging
+import os
+import re
+import select
+import threading
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Overridable for containers and for the hardware-free benchmarks
+MOUNTINFO = os.getenv("LIVOX_MOUNTINFO", "/proc/self/mountinfo")
+
+MountCallback = Callable[[Optional[Path], Optional[Path]], None]
+
+
+def mount_roots_from_env() -> List[str]:
+    """Return the configured mount roots.
+
+    ``LIVOX_MOUNT_ROOTS`` (``os.pathsep`` separated) takes precedence over
+    ``MOUNT_ROOT`` from the install script; both default to ``/media`` and
+    ``/run/media``.
+    """
+    env_roots = os.getenv("LIVOX_MOUNT_ROOTS")
+    if env_roots:
+        return [r.rstrip("/") for r in env_roots.split(os.pathsep) if r]
+    mr = os.getenv("MOUNT_ROOT")
+    if mr:
+        return [mr.rstrip("/")]
+    return ["/media", "/run/media"]
+
+
+def _unescape(field: str) -> str:
+    # mountinfo escapes space, tab, newline and backslash as octal sequences
+    return re.sub(r"\\([0-7]{3})", lambda m: chr(int(m.group(1), 8)), field)
+
+
+def _usb_index(path: Path) -> float:
+    m = re.search(r"usb(\d+)$", path.name)
+    return int(m.group(1)) if m else float("inf")
+
+
+def parse_mountinfo(text: str) -> List[str]:
+    """Return the mount points listed in a ``mountinfo`` table."""
+    points = []
+    for line in text.splitlines():
+        parts = line.split()
+        if len(parts) >= 5:
+            points.append(_unescape(parts[4]))
+    return points
+
+
+class MountMonitor:
+    """Cache the current USB mount and notify subscribers when it changes."""
+
+    def __init__(self, mount_roots: Sequence[str], mountinfo: str = MOUNTINFO):
+        self.mount_roots = [r.rstrip("/") for r in mount_roots if r]
+        self.mountinfo = mountinfo
+        self.poll_interval = float(os.getenv("MOUNT_POLL_INTERVAL", "5"))
+        self._lock = threading.Lock()
+        self._mount: Optional[Path] = None
+        self._table: Optional[str] = None
+        self._loaded = False
+        self._subscribers: List[MountCallback] = []
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    # ---- discovery --------------------------------------------------------
+    def _read_table(self) -> Optional[str]:
+        try:
+            with open(self.mountinfo) as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def _select(self, table: Optional[str]) -> Optional[Path]:
+        prefixes = [f"{root}/usb" for root in self.mount_roots]
+        if table is not None:
+            candidates = [
+                Path(mp)
+                for mp in parse_mountinfo(table)
+                if any(mp.startswith(p) for p in prefixes) and os.access(mp, os.W_OK)
+            ]
+        else:
+            # No mountinfo (non-Linux): scan the mount roots directly
+            candidates = []
+            for root in self.mount_roots:
+                try:
+                    candidates.extend(
+                        p
+                        for p in Path(root).glob("usb*")
+                        if os.path.ismount(p) and os.access(p, os.W_OK)
+                    )
+                except OSError:
+                    continue
+        if not candidates:
+            return None
+        candidates.sort(key=_usb_index)
+        return candidates[0]
+
+    def refresh(self, force: bool = False) -> Optional[Path]:
+        """Re-read the mount table and notify subscribers of any change."""
+        table = self._read_table()
+        with self._lock:
+            if self._loaded and not force and table is not None and table == self._table:
+                return self._mount
+            old = self._mount
+            new = self._select(table)
+            self._table = table
+            self._mount = new
+            self._loaded = True
+            subscribers = list(self._subscribers)
+        if new != old:
+            logger.info("USB storage changed: %s -> %s", old, new)
+            for callback in subscribers:
+                try:
+                    callback(old, new)
+                except Exception:
+                    logger.exception("Mount subscriber failed")
+        return new
+
+    def current(self) -> Optional[Path]:
+        """Return the cached USB mount without touching the system."""
+        with self._lock:
+            loaded = self._loaded
+            mount = self._mount
+            watching = self._thread is not None
+        if not loaded or not watching:
+            # Without the watcher there is nothing to invalidate the cache.
+            return self.refresh()
+        return mount
+
+    # ---- notifications ----------------------------------------------------
+    def subscribe(self, callback: MountCallback) -> None:
+        with self._lock:
+            self._subscribers.append(callback)
+
+    def unsubscribe(self, callback: MountCallback) -> None:
+        with self._lock:
+            try:
+                self._subscribers.remove(callback)
+            except ValueError:
+                pass
+
+    def start(self) -> None:
+        """Start watching the mount table in a background thread."""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(
+                target=self._watch, name="mount-monitor", daemon=True
+            )
+            self._thread.start()
+
+    def stop(self) -> None:
+        with self._lock:
+            thread = self._thread
+            self._thread = None
+        if thread:
+            self._stop.set()
+            thread.join()
+
+    def _watch(self) -> None:
+        self.refresh(force=True)
+        try:
+            f = open(self.mountinfo)
+        except OSError:
+            f = None
+        try:
+            if f is not None and hasattr(select, "poll"):
+                poller = select.poll()
+                poller.register(f.fileno(), select.POLLPRI | select.POLLERR)
+                while not self._stop.is_set():
+                    # Wake up periodically to honour stop() and to catch
+                    # writability changes that do not alter the table.
+                    events = poller.poll(self.poll_interval * 1000)
+                    if events:
+                        f.seek(0)
+                        f.read()
+                    self.refresh(force=not events)
+            else:
+                while not self._stop.wait(self.poll_interval):
+                    self.refresh()
+        finally:
+            if f is not None:
+                f.close()
+
+
+_monitors: Dict[Tuple[str, ...], MountMonitor] = {}
+_monitors_lock = threading.Lock()
+
+
+def get_monitor(mount_roots: Optional[Sequence[str]] = None) -> MountMonitor:
+    """Return the shared, started monitor for ``mount_roots``."""
+    roots = tuple(r.rstrip("/") for r in (mount_roots or mount_roots_from_env()) if r)
+    with _monitors_lock:
+        monitor = _monitors.get(roots)
+        if monitor is None:
+            monitor = MountMonitor(roots)
+            _monitors[roots] = monitor
+    monitor.start()
+    return monitor
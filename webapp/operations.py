@@ -0,0 +1,104 @@
+"""Asynchronous start and stop operations.
+
+Starting a recording waits for the LiDAR and the drive, and stopping one
+waits for the frame in flight, the post-processing queue and the staging
+mover, so neither is done inside an HTTP request.  Each request creates an
+:class:`Operation` with an ID; the caller waits for it as long as it is
+willing to and can poll it afterwards (``GET /operations/<id>``).
+
+A start operation goes ``starting`` → ``done`` or ``failed``; a stop
+operation goes ``stopping`` (capture is being interrupted) → ``finalizing``
+(the capture workers have exited and the session is being closed) →
+``done``.  ``error`` holds the start failure code or the error the session
+was logged with.
+"""
+
+import collections
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Optional
+
+FINISHED = ("done", "failed")
+
+
+@dataclass
+class Operation:
+    id: str
+    kind: str
+    state: str
+    session: Optional[str] = None
+    error: Optional[str] = None
+    created: datetime = field(default_factory=datetime.utcnow)
+    started: float = field(default_factory=time.monotonic)
+    ended: Optional[float] = None
+
+    @property
+    def finished(self) -> bool:
+        return self.state in FINISHED
+
+    def to_dict(self) -> dict:
+        end = self.ended if self.ended is not None else time.monotonic()
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "state": self.state,
+            "finished": self.finished,
+            "session": self.session,
+            "error": self.error,
+            "created": self.created.isoformat(),
+            "elapsed": round(end - self.started, 3),
+        }
+
+
+class OperationLog:
+    """The most recent ``keep`` operations, looked up by ID."""
+
+    def __init__(self, keep: int = 50):
+        self.keep = keep
+        self._cond = threading.Condition()
+        self._ops: "collections.OrderedDict[str, Operation]" = collections.OrderedDict()
+
+    def create(self, kind: str, state: str, session: Optional[str] = None) -> dict:
+        op = Operation(uuid.uuid4().hex[:12], kind, state, session)
+        with self._cond:
+            self._ops[op.id] = op
+            while len(self._ops) > self.keep:
+                self._ops.popitem(last=False)
+            return op.to_dict()
+
+    def update(self, op_id: str, state: str, **fields) -> None:
+        """Move an operation to ``state``; finished operations stay finished."""
+        with self._cond:
+            op = self._ops.get(op_id)
+            if op is None or op.finished:
+                return
+            op.state = state
+            for key, value in fields.items():
+                setattr(op, key, value)
+            if op.finished:
+                op.ended = time.monotonic()
+            self._cond.notify_all()
+
+    def finish(self, op_id: str, error: Optional[str] = None, failed: bool = False, **fields) -> None:
+        self.update(op_id, "failed" if failed else "done", error=error, **fields)
+
+    def wait(self, op_id: str, timeout: Optional[float] = None) -> Optional[dict]:
+        """Wait up to ``timeout`` seconds for an operation to finish.
+
+        Returns its current state either way, or ``None`` for an unknown ID.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while True:
+                op = self._ops.get(op_id)
+                if op is None:
+                    return None
+                if op.finished:
+                    return op.to_dict()
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return op.to_dict()
+                self._cond.wait(remaining)
@@ -0,0 +1,85 @@
+"""Bounded worker pool for per-frame post-processing.
+
+The capture thread should only record frames.  Everything that happens to a
+frame afterwards (auxiliary metadata files, CSV conversion) is submitted to a
+:class:`FramePipeline` and executed by a small pool of worker threads.  The
+queue is bounded: when the workers fall behind, :meth:`FramePipeline.submit`
+blocks the producer, which keeps memory use and the backlog on disk in check
+instead of letting it grow without limit.
+"""
+
+import logging
+import queue
+import threading
+from typing import Callable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class FramePipeline:
+    """Run submitted callables on a fixed pool of daemon worker threads."""
+
+    def __init__(self, workers: int = 2, depth: int = 8, name: str = "frame-pipeline"):
+        self.workers = max(1, workers)
+        self.depth = max(1, depth)
+        self.name = name
+        self._queue: "queue.Queue[Optional[Callable[[], None]]]" = queue.Queue(maxsize=self.depth)
+        self._threads: List[threading.Thread] = []
+        self._lock = threading.Lock()
+        self.completed = 0
+        self.failed = 0
+
+    def start(self) -> None:
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                t = threading.Thread(target=self._worker, name=f"{self.name}-{i}", daemon=True)
+                t.start()
+                self._threads.append(t)
+
+    def submit(self, task: Callable[[], None], timeout: Optional[float] = None) -> bool:
+        """Queue ``task``, blocking while the queue is full.
+
+        Returns ``False`` if ``timeout`` expires before a slot frees up.
+        """
+        self.start()
+        try:
+            self._queue.put(task, timeout=timeout)
+        except queue.Full:
+            return False
+        return True
+
+    def pending(self) -> int:
+        """Number of queued tasks that have not finished yet."""
+        return self._queue.unfinished_tasks
+
+    def flush(self) -> None:
+        """Block until every submitted task has completed."""
+        self._queue.join()
+
+    def close(self) -> None:
+        """Finish outstanding work and stop the worker threads."""
+        with self._lock:
+            threads = self._threads
+            self._threads = []
+        for _ in threads:
+            self._queue.put(None)
+        for t in threads:
+            t.join()
+
+    def _worker(self) -> None:
+        while True:
+            task = self._queue.get()
+            try:
+                if task is None:
+                    return
+                task()
+                with self._lock:
+                    self.completed += 1
+            except Exception:
+                with self._lock:
+                    self.failed += 1
+                logger.exception("Frame post-processing task failed")
+            finally:
+                self._queue.task_done()
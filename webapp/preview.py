@@ -0,0 +1,247 @@
+"""Incremental downsampled point-cloud preview of a session.
+
+Every captured frame is folded into a per-session voxel grid: the frame is
+decoded in chunks by :mod:`webapp.las_io`, at most ``frame_points`` of its
+points are sampled and their voxel keys are aggregated with NumPy.  Each
+occupied voxel keeps the centroid and mean intensity of the points that fell
+into it.  When the grid grows beyond ``max_points`` voxels the voxel size is
+doubled and the grid re-aggregated, so the cost of a frame depends on the
+frame and the point budget only, never on how long the session already is.
+
+The grid is persisted next to the frames as ``.preview.bin`` every few
+frames and when the session ends.  The file doubles as the format served to
+the browser and as the state a restarted writer resumes from.  Layout (little
+endian)::
+
+    header      "TSPV" u16 version u16 flags u32 count u32 frames f32 voxel_size
+    positions   count * 3 float32   centroid x, y, z in metres
+    weights     count uint32        points folded into each voxel
+    intensity   count uint8         mean intensity
+
+The header is 20 bytes, so the float32 and uint32 arrays are aligned and a
+browser can view them directly with typed arrays.
+"""
+
+import logging
+import os
+import struct
+import threading
+from pathlib import Path
+from typing import TYPE_CHECKING, Optional
+
+from . import las_io
+
+if TYPE_CHECKING:
+    import numpy as np
+
+logger = logging.getLogger(__name__)
+
+PREVIEW_NAME = ".preview.bin"
+VERSION = 1
+
+_HEADER = struct.Struct("<4sHHIIf")
+_MAGIC = b"TSPV"
+# Voxel indices are packed into one int64 key, 21 bits per axis
+_AXIS_BITS = 21
+_AXIS_MASK = (1 << _AXIS_BITS) - 1
+_AXIS_BIAS = 1 << (_AXIS_BITS - 1)
+
+
+def available() -> bool:
+    """Return ``True`` if previews can be built on this system."""
+    return las_io.numpy_available()
+
+
+def _voxel_keys(xyz: "np.ndarray", voxel_size: float) -> "np.ndarray":
+    np = las_io.numpy()
+    idx = np.floor(xyz / voxel_size).astype(np.int64)
+    idx += _AXIS_BIAS
+    np.clip(idx, 0, _AXIS_MASK, out=idx)
+    return (idx[:, 0] << (2 * _AXIS_BITS)) | (idx[:, 1] << _AXIS_BITS) | idx[:, 2]
+
+
+def _aggregate(keys, sums, counts, intensity):
+    """Sum the rows of ``sums``/``counts``/``intensity`` sharing a key."""
+    np = las_io.numpy()
+    uniq, inverse = np.unique(keys, return_inverse=True)
+    n = len(uniq)
+    out = np.empty((n, 3), dtype=np.float64)
+    for axis in range(3):
+        out[:, axis] = np.bincount(inverse, weights=sums[:, axis], minlength=n)
+    return (
+        uniq,
+        out,
+        np.bincount(inverse, weights=counts, minlength=n),
+        np.bincount(inverse, weights=intensity, minlength=n),
+    )
+
+
+class SessionPreview:
+    """Voxel-grid preview of one session, persisted to ``path``."""
+
+    def __init__(
+        self,
+        path: Path,
+        voxel_size: float = 0.1,
+        max_points: int = 50000,
+        frame_points: int = 20000,
+        save_every: int = 10,
+    ):
+        np = las_io.numpy()
+        if np is None:
+            raise RuntimeError("NumPy is required for previews")
+        self.path = Path(path)
+        self.voxel_size = voxel_size
+        self.max_points = max(1, max_points)
+        self.frame_points = max(1, frame_points)
+        self.save_every = max(1, save_every)
+        self.frames = 0
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._unsaved = 0
+        self._keys = np.empty(0, dtype=np.int64)
+        self._sums = np.empty((0, 3), dtype=np.float64)
+        self._counts = np.empty(0, dtype=np.float64)
+        self._intensity = np.empty(0, dtype=np.float64)
+        if self.path.exists():
+            try:
+                self._load()
+            except (OSError, ValueError) as e:
+                logger.warning("Ignoring unreadable preview %s: %s", self.path, e)
+
+    @property
+    def points(self) -> int:
+        return len(self._keys)
+
+    # ---- folding ----------------------------------------------------------------
+    def add_frame(self, frame: Path) -> bool:
+        """Fold the points of ``frame`` into the grid.
+
+        Returns ``False`` if the frame could not be decoded.
+        """
+        np = las_io.numpy()
+        try:
+            xyz_parts = []
+            intensity_parts = []
+            for header, records in las_io.iter_chunks(frame):
+                # Sample evenly so at most ``frame_points`` points are kept
+                step = max(1, -(-header.point_count // self.frame_points))
+                records = records[::step]
+                xyz_parts.append(las_io.scaled_xyz(header, records))
+                intensity_parts.append(records["intensity"].astype(np.float64))
+        except (OSError, ValueError) as e:
+            # LasError (truncated or corrupt frames) is a ValueError, as are
+            # NumPy's complaints about malformed records
+            logger.debug("Cannot add %s to the preview: %s", frame, e)
+            return False
+        if xyz_parts:
+            xyz = np.concatenate(xyz_parts)
+            intensity = np.minimum(np.concatenate(intensity_parts), 255.0)
+            voxel_size = self.voxel_size
+            keys, sums, counts, isum = _aggregate(
+                _voxel_keys(xyz, voxel_size), xyz, np.ones(len(xyz)), intensity
+            )
+            with self._lock:
+                if voxel_size != self.voxel_size:
+                    # The grid was coarsened meanwhile
+                    keys = _voxel_keys(sums / counts[:, None], self.voxel_size)
+                self._merge(keys, sums, counts, isum)
+        with self._lock:
+            self.frames += 1
+            self._unsaved += 1
+            due = self._unsaved >= self.save_every
+        if due:
+            self.save()
+        return True
+
+    def _merge(self, keys, sums, counts, intensity) -> None:
+        np = las_io.numpy()
+        self._keys, self._sums, self._counts, self._intensity = _aggregate(
+            np.concatenate((self._keys, keys)),
+            np.concatenate((self._sums, sums)),
+            np.concatenate((self._counts, counts)),
+            np.concatenate((self._intensity, intensity)),
+        )
+        while len(self._keys) > self.max_points:
+            self.voxel_size *= 2
+            self._keys, self._sums, self._counts, self._intensity = _aggregate(
+                _voxel_keys(self._sums / self._counts[:, None], self.voxel_size),
+                self._sums,
+                self._counts,
+                self._intensity,
+            )
+            logger.debug("Preview coarsened to %.2f m voxels", self.voxel_size)
+
+    # ---- persistence ------------------------------------------------------------
+    def encode(self) -> bytes:
+        """Return the grid in the ``.preview.bin`` format."""
+        np = las_io.numpy()
+        with self._lock:
+            n = len(self._keys)
+            counts = self._counts
+            centroids = (self._sums / counts[:, None]).astype("<f4")
+            intensity = np.rint(self._intensity / counts).astype(np.uint8)
+            header = _HEADER.pack(_MAGIC, VERSION, 0, n, self.frames, self.voxel_size)
+            weights = np.minimum(counts, 0xFFFFFFFF).astype("<u4")
+        return header + centroids.tobytes() + weights.tobytes() + intensity.tobytes()
+
+    def save(self) -> None:
+        """Write the preview atomically; errors are logged, not raised."""
+        with self._save_lock:
+            with self._lock:
+                self._unsaved = 0
+            data = self.encode()
+            tmp = self.path.with_name(self.path.name + ".tmp")
+            try:
+                with open(tmp, "wb") as f:
+                    f.write(data)
+                os.replace(tmp, self.path)
+            except OSError as e:
+                logger.warning("Failed to save preview %s: %s", self.path, e)
+
+    def _load(self) -> None:
+        np = las_io.numpy()
+        data = self.path.read_bytes()
+        if len(data) < _HEADER.size:
+            raise ValueError("truncated header")
+        magic, version, _flags, n, frames, voxel_size = _HEADER.unpack_from(data)
+        if magic != _MAGIC or version != VERSION:
+            raise ValueError("not a preview file")
+        if len(data) < _HEADER.size + n * 17:
+            raise ValueError("truncated data")
+        offset = _HEADER.size
+        centroids = np.frombuffer(data, "<f4", n * 3, offset).reshape(n, 3).astype(np.float64)
+        offset += n * 12
+        counts = np.frombuffer(data, "<u4", n, offset).astype(np.float64)
+        offset += n * 4
+        intensity = np.frombuffer(data, np.uint8, n, offset).astype(np.float64)
+        counts = np.maximum(counts, 1.0)
+        self.voxel_size = max(float(voxel_size), self.voxel_size)
+        self.frames = frames
+        self._keys = np.empty(0, dtype=np.int64)
+        self._sums = np.empty((0, 3), dtype=np.float64)
+        self._counts = np.empty(0, dtype=np.float64)
+        self._intensity = np.empty(0, dtype=np.float64)
+        self._merge(
+            _voxel_keys(centroids, self.voxel_size),
+            centroids * counts[:, None],
+            counts,
+            intensity * counts,
+        )
+
+
+def from_env(path: Path) -> Optional[SessionPreview]:
+    """Create the preview for a new session as configured by ``PREVIEW_*``."""
+    if os.getenv("PREVIEW_ENABLED", "1").lower() in ("0", "false", "no") or not available():
+        return None
+    try:
+        return SessionPreview(
+            path,
+            voxel_size=float(os.getenv("PREVIEW_VOXEL_SIZE", "0.1")),
+            max_points=int(os.getenv("PREVIEW_MAX_POINTS", "50000")),
+            frame_points=int(os.getenv("PREVIEW_FRAME_POINTS", "20000")),
+            save_every=int(os.getenv("PREVIEW_SAVE_EVERY", "10")),
+        )
+    except (OSError, ValueError) as e:
+        logger.warning("Session preview disabled: %s", e)
+        return None
@@ -0,0 +1,304 @@
+"""Deferred LAZ compression of frames captured as uncompressed LAS.
+
+``save_laz`` compresses a frame when its file name ends in ``.laz``.  When
+compression holds up capture (see the ``compression`` tier of
+:class:`~webapp.admission.AdmissionController`) frames are written as
+``frame_NNNNNN.las`` instead, and :class:`Recompressor` converts them once
+the session is finished and no recording is running.
+
+Each frame is compressed to ``frame_NNNNNN.laz.part``, synced and read back;
+only when the point count and a CRC-32 over every decoded point record
+match the source is the output renamed to ``frame_NNNNNN.laz`` and the LAS
+file deleted.  The session manifest gets an entry for the new file that
+replaces the old one.  The ``.las`` files themselves are the record of
+what is still pending, so a job cut short by a power loss simply finds the
+remaining ones again (:meth:`Recompressor.recover`).  Frames packed into a
+session container are always captured as LAZ.
+
+Writing LAZ requires ``laspy`` with the ``lazrs`` backend.
+"""
+
+import collections
+import logging
+import os
+import threading
+import time
+import zlib
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Deque, List, Optional, Tuple
+
+from . import container, integrity, las_io
+from .downloads import RateLimiter
+from .las_io import DEFAULT_CHUNK_POINTS
+
+logger = logging.getLogger(__name__)
+
+PENDING_PATTERN = "frame_*.las"
+
+class RecompressError(RuntimeError):
+    """Raised when the compressed copy of a frame does not match its source."""
+
+
+def _frame_errors() -> tuple:
+    """What compressing a frame may raise."""
+    return (OSError, ValueError, RecompressError) + las_io.laz_errors()
+
+
+def pending_frames(session: Path) -> List[Path]:
+    """Uncompressed frames of ``session``, including device subdirectories."""
+    try:
+        frames = [*session.glob(PENDING_PATTERN), *session.glob(f"*/{PENDING_PATTERN}")]
+    except OSError:
+        return []
+    return sorted(
+        f for f in frames if not (f.parent / container.CONTAINER_NAME).exists()
+    )
+
+
+def _points_crc(reader, chunk_points: int) -> Tuple[int, int]:
+    """Return ``(crc32, count)`` over the point records read by ``reader``."""
+    crc = 0
+    count = 0
+    for points in reader.chunk_iterator(chunk_points):
+        crc = zlib.crc32(points.array.tobytes(), crc)
+        count += len(points)
+    return crc, count
+
+
+def compress_frame(source: Path, chunk_points: int = DEFAULT_CHUNK_POINTS) -> Path:
+    """Replace the LAS file ``source`` by a verified LAZ copy; returns its path."""
+    target = source.with_suffix(".laz")
+    part = target.with_name(target.name + ".part")
+    laspy = las_io.laspy()
+    try:
+        crc = 0
+        with laspy.open(str(source)) as reader:
+            expected = reader.header.point_count
+            with laspy.open(str(part), mode="w", header=reader.header, do_compress=True) as writer:
+                for points in reader.chunk_iterator(chunk_points):
+                    crc = zlib.crc32(points.array.tobytes(), crc)
+                    writer.write_points(points)
+        with open(part, "rb") as f:
+            os.fsync(f.fileno())
+        with laspy.open(str(part)) as reader:
+            written_crc, written = _points_crc(reader, chunk_points)
+        if written != expected or written_crc != crc:
+            raise RecompressError(
+                f"{part.name} does not match {source.name} ({written} of {expected} points)"
+            )
+        os.replace(part, target)
+    except BaseException:
+        part.unlink(missing_ok=True)
+        raise
+    return target
+
+
+def _fsync_dir(path: Path) -> None:
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class Recompressor:
+    """Background job compressing the LAS frames of finished sessions.
+
+    ``paused`` is polled between frames; compression waits while it returns
+    ``True``.  ``limiter`` paces the LAS bytes compressed per second.  ``on_progress(session_name, state)`` is called when a job
+    starts, every ``report_frames`` frames and when it ends; ``state`` lists
+    the frames still pending.
+    """
+
+    def __init__(
+        self,
+        chunk_points: int = DEFAULT_CHUNK_POINTS,
+        paused: Callable[[], bool] = lambda: False,
+        on_progress: Optional[Callable[[str, dict], None]] = None,
+        report_frames: int = 25,
+        limiter: Optional[RateLimiter] = None,
+    ):
+        self.chunk_points = chunk_points
+        self.paused = paused
+        self.on_progress = on_progress
+        self.report_frames = max(1, report_frames)
+        self.limiter = limiter
+        self._cond = threading.Condition()
+        self._queue: Deque[Path] = collections.deque()
+        self._closed = False
+        self._current: Optional[Path] = None
+        self._progress = {"frames_done": 0, "frames_total": 0, "bytes_saved": 0}
+        self._last: Optional[dict] = None
+        self._thread = threading.Thread(target=self._run, name="recompress", daemon=True)
+        self._thread.start()
+
+    def submit(self, session: Path) -> bool:
+        """Queue ``session``; returns ``False`` if it is already pending."""
+        with self._cond:
+            if self._closed or session in self._queue or self._current == session:
+                return False
+            self._queue.append(session)
+            self._cond.notify_all()
+            return True
+
+    def recover(self, output_dir: Path) -> int:
+        """Queue the sessions that still have uncompressed frames."""
+        try:
+            sessions = sorted(p for p in output_dir.glob("session_*") if p.is_dir())
+        except OSError:
+            return 0
+        queued = sum(self.submit(s) for s in sessions if pending_frames(s))
+        if queued:
+            logger.info("Resuming LAZ compression of %d sessions", queued)
+        return queued
+
+    def busy(self) -> bool:
+        """Whether a job is running or waiting."""
+        with self._cond:
+            return self._current is not None or bool(self._queue)
+
+    def status(self) -> dict:
+        with self._cond:
+            return {
+                "active": self._current.name if self._current else None,
+                "queued": [p.name for p in self._queue],
+                **self._progress,
+                "last": self._last,
+            }
+
+    def close(self) -> None:
+        with self._cond:
+            self._closed = True
+            self._queue.clear()
+            self._cond.notify_all()
+        self._thread.join(timeout=30)
+
+    # ---- worker ---------------------------------------------------------------------
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._queue and not self._closed:
+                    self._cond.wait()
+                if self._closed:
+                    return
+                session = self._queue.popleft()
+                self._current = session
+                self._progress = dict.fromkeys(self._progress, 0)
+            try:
+                state = self._compress_session(session)
+            except Exception as e:
+                # Whatever went wrong, the queue must keep going
+                logger.exception("LAZ compression of %s failed", session.name)
+                state = {
+                    "state": "failed",
+                    "error": str(e),
+                    "pending": self._names(session, pending_frames(session)),
+                }
+            with self._cond:
+                self._current = None
+                self._last = dict(state, session=session.name)
+                self._last.pop("pending", None)
+            self._report(session, state)
+
+    def _wait_unpaused(self) -> bool:
+        while self.paused():
+            with self._cond:
+                if self._closed:
+                    return False
+                self._cond.wait(1.0)
+        return not self._closed
+
+    def _report(self, session: Path, state: dict) -> None:
+        if self.on_progress:
+            self.on_progress(session.name, state)
+
+    def _compress_session(self, session: Path) -> dict:
+        frames = pending_frames(session)
+        if las_io.laspy() is None:
+            logger.warning("Cannot compress %s: writing LAZ requires laspy", session.name)
+            return {"state": "failed", "error": "laspy_missing", "pending": self._names(session, frames)}
+        with self._cond:
+            self._progress["frames_total"] = len(frames)
+        t0 = time.monotonic()
+        manifest_path = session / integrity.MANIFEST_NAME
+        manifest = None
+        if manifest_path.exists():
+            try:
+                manifest = integrity.ManifestWriter(manifest_path)
+            except OSError as e:
+                logger.warning("Cannot update the manifest of %s: %s", session.name, e)
+        failed: List[Path] = []
+        error = None
+        saved = 0
+        position = 0
+        try:
+            for position, frame in enumerate(frames):
+                if position % self.report_frames == 0:
+                    self._report(
+                        session,
+                        {
+                            "state": "running",
+                            "frames_done": position - len(failed),
+                            "pending": self._names(session, failed + frames[position:]),
+                        },
+                    )
+                if not self._wait_unpaused():
+                    break
+                try:
+                    before = frame.stat().st_size
+                    if self.limiter:
+                        self.limiter.consume(before)
+                    target = compress_frame(frame, self.chunk_points)
+                    crc, size = integrity.file_crc32(target, self.limiter)
+                    if manifest:
+                        manifest.add(
+                            self._name(session, target),
+                            size,
+                            crc,
+                            replaces=self._name(session, frame),
+                        )
+                    frame.unlink()
+                    _fsync_dir(frame.parent)
+                except _frame_errors() as e:
+                    logger.warning("Cannot compress %s: %s", frame, e)
+                    failed.append(frame)
+                    error = str(e)
+                    continue
+                saved += before - size
+                with self._cond:
+                    self._progress["frames_done"] += 1
+                    self._progress["bytes_saved"] = saved
+            else:
+                position = len(frames)
+        finally:
+            if manifest:
+                manifest.close()
+        remaining = frames[position:]
+        pending = failed + remaining
+        state = {
+            "state": "failed" if failed else ("done" if not remaining else "interrupted"),
+            "frames_done": len(frames) - len(pending),
+            "pending": self._names(session, pending),
+            "bytes_saved": saved,
+            "seconds": round(time.monotonic() - t0, 3),
+            "finished": datetime.utcnow().isoformat(),
+        }
+        if error:
+            state["error"] = error
+        logger.info(
+            "Compressed %d of %d frames of %s in %.1f s (%d bytes saved)",
+            state["frames_done"],
+            len(frames),
+            session.name,
+            state["seconds"],
+            saved,
+        )
+        return state
+
+    @staticmethod
+    def _name(session: Path, frame: Path) -> str:
+        return str(frame.relative_to(session))
+
+    def _names(self, session: Path, frames: List[Path]) -> List[str]:
+        return [self._name(session, f) for f in frames]
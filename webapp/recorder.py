@@ -0,0 +1,253 @@
+"""Long-lived connection to the ``save_laz`` recorder.
+
+Spawning ``save_laz`` once per frame means every frame pays for a fork/exec,
+dynamic linking of LASzip/Livox-SDK2 and re-initialising the SDK.  When
+started with ``--server`` the recorder stays running for the whole session
+and captures frames on request.  The protocol is line based: the manager
+writes ``FRAME <path>`` to the recorder's stdin and reads back one JSON line
+per command containing the ``LazStats.produceStatus`` fields (``filename``,
+``points_count``, ``size_mb``, ``save_duration_sec1`` …) plus an ``ok`` flag.
+An optional ``crc32`` field (hex) is the checksum of the written file; without
+it the manager checksums the file itself.
+``DECIMATE <n>`` sets the minimum decimation step for subsequent frames.
+
+Stopping a recording must not wait for a frame the sensor may never
+deliver.  :meth:`PersistentRecorder.cancel` asks the server to quit after the
+frame in flight and escalates to ``SIGTERM`` and ``SIGKILL`` when it does
+not exit in time; :func:`run_child` gives one-shot recorder and converter
+processes the same treatment when its ``cancel`` event is set.
+"""
+
+import json
+import logging
+import os
+import select
+import subprocess
+import threading
+import time
+from pathlib import Path
+from typing import List, Optional
+
+logger = logging.getLogger(__name__)
+
+# How often run_child() checks its cancel event
+_POLL_INTERVAL = 0.05
+
+
+class Cancelled(subprocess.SubprocessError):
+    """A child process was terminated because its work was cancelled."""
+
+
+def terminate(proc: subprocess.Popen, grace: float) -> int:
+    """Let ``proc`` exit within ``grace`` seconds, then ``SIGTERM`` and ``SIGKILL`` it.
+
+    Returns the exit status.
+    """
+    try:
+        return proc.wait(timeout=grace)
+    except subprocess.TimeoutExpired:
+        pass
+    logger.warning("Terminating %s (pid %s)", os.path.basename(str(proc.args[0])), proc.pid)
+    proc.terminate()
+    try:
+        return proc.wait(timeout=grace)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+        return proc.wait()
+
+
+def run_child(cmd: List[str], cancel: Optional[threading.Event] = None, grace: float = 2.0) -> None:
+    """Run ``cmd`` to completion like ``subprocess.run(cmd, check=True)``.
+
+    Once ``cancel`` is set the process gets ``grace`` seconds to finish
+    before it is terminated (see :func:`terminate`); :class:`Cancelled` is
+    raised if it did not finish successfully.
+    """
+    proc = subprocess.Popen(cmd)
+    while True:
+        try:
+            returncode = proc.wait(timeout=_POLL_INTERVAL)
+            break
+        except subprocess.TimeoutExpired:
+            if cancel is not None and cancel.is_set():
+                returncode = terminate(proc, grace)
+                if returncode:
+                    raise Cancelled(f"{cmd[0]} cancelled")
+                break
+    if returncode:
+        raise subprocess.CalledProcessError(returncode, cmd)
+
+
+class PersistentRecorder:
+    """Drive a ``save_laz --server`` process over its stdin/stdout pipes."""
+
+    def __init__(
+        self,
+        cmd: str,
+        start_timeout: float = 5.0,
+        frame_timeout: float = 30.0,
+        args: Optional[List[str]] = None,
+    ):
+        self.cmd = cmd
+        # Extra arguments, e.g. ``--device <serial>``
+        self.args = list(args or [])
+        self.start_timeout = start_timeout
+        self.frame_timeout = frame_timeout
+        self._proc: Optional[subprocess.Popen] = None
+        self._buffer = b""
+        # Commands are written by the capture worker, QUIT also by cancel()
+        self._write_lock = threading.Lock()
+        self._cancelled = False
+
+    @property
+    def alive(self) -> bool:
+        return self._proc is not None and self._proc.poll() is None
+
+    def start(self) -> bool:
+        """Launch the recorder and wait for its ready line.
+
+        Returns ``False`` if the process cannot be started or does not speak
+        the server protocol (e.g. an older ``save_laz`` build).
+        """
+        try:
+            self._proc = subprocess.Popen(
+                [self.cmd, *self.args, "--server"],
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL,
+            )
+        except OSError as e:
+            logger.warning("Failed to start persistent recorder: %s", e)
+            self._proc = None
+            return False
+        self._buffer = b""
+        self._cancelled = False
+        reply = self._read_reply(self.start_timeout)
+        if not reply or not reply.get("ready"):
+            logger.warning("Recorder '%s' does not support server mode", self.cmd)
+            self.close()
+            return False
+        logger.info("Persistent recorder started (pid %s)", self._proc.pid)
+        return True
+
+    def capture(self, path: Path) -> Optional[dict]:
+        """Capture one frame to ``path``.
+
+        Returns the recorder's stats for the frame, or ``None`` if the frame
+        failed.  A recorder that dies or stops answering is terminated so the
+        caller can restart it or fall back to per-frame spawning.
+        """
+        if not self.alive or self._cancelled:
+            return None
+        if not self._send(f"FRAME {path}"):
+            return None
+        reply = self._read_reply(self.frame_timeout)
+        if reply is None:
+            if not self._cancelled:
+                logger.warning("Recorder did not answer for frame %s", path)
+            self.close()
+            return None
+        if not reply.get("ok"):
+            logger.warning("Recorder failed to save frame %s: %s", path, reply.get("error"))
+            return None
+        return reply
+
+    def set_decimation(self, step: int) -> bool:
+        """Ask the recorder to keep at most every ``step``-th point."""
+        if not self.alive or self._cancelled:
+            return False
+        if not self._send(f"DECIMATE {int(step)}"):
+            return False
+        reply = self._read_reply(self.start_timeout)
+        if reply is None:
+            logger.warning("Recorder did not answer the decimation request")
+            self.close()
+            return False
+        if not reply.get("ok"):
+            logger.warning("Recorder rejected decimation step %s: %s", step, reply.get("error"))
+            return False
+        return True
+
+    def _send(self, command: str) -> bool:
+        try:
+            with self._write_lock:
+                self._proc.stdin.write(f"{command}\n".encode())
+                self._proc.stdin.flush()
+        except (OSError, ValueError) as e:
+            if not self._cancelled:
+                logger.warning("Lost connection to recorder: %s", e)
+            self.close()
+            return False
+        return True
+
+    def cancel(self, grace: float = 2.0) -> None:
+        """Stop the recorder from another thread without waiting for it.
+
+        The recorder is asked to quit after the frame in flight; if it has
+        not exited within ``grace`` seconds it is terminated, which makes a
+        :meth:`capture` blocked on it return ``None``.  The recorder cannot
+        be used for further frames afterwards.
+        """
+        proc = self._proc
+        if proc is None or self._cancelled:
+            return
+        self._cancelled = True
+        if proc.poll() is None:
+            try:
+                with self._write_lock:
+                    proc.stdin.write(b"QUIT\n")
+                    proc.stdin.flush()
+            except (OSError, ValueError):
+                pass
+        threading.Thread(
+            target=terminate, args=(proc, grace), name="recorder-cancel", daemon=True
+        ).start()
+
+    def close(self) -> None:
+        """Ask the recorder to exit and reap it."""
+        proc = self._proc
+        self._proc = None
+        if proc is None:
+            return
+        if proc.poll() is None:
+            if not self._cancelled:
+                try:
+                    with self._write_lock:
+                        proc.stdin.write(b"QUIT\n")
+                        proc.stdin.flush()
+                except (OSError, ValueError):
+                    pass
+            try:
+                proc.wait(timeout=2)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+                proc.wait()
+        for stream in (proc.stdin, proc.stdout):
+            try:
+                stream.close()
+            except (OSError, ValueError):
+                pass
+
+    def _read_reply(self, timeout: float) -> Optional[dict]:
+        """Read one JSON line from the recorder within ``timeout`` seconds."""
+        if self._proc is None:
+            return None
+        fd = self._proc.stdout.fileno()
+        deadline = time.monotonic() + timeout
+        while b"\n" not in self._buffer:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            ready, _, _ = select.select([fd], [], [], remaining)
+            if not ready:
+                return None
+            chunk = os.read(fd, 65536)
+            if not chunk:
+                return None
+            self._buffer += chunk
+        line, self._buffer = self._buffer.split(b"\n", 1)
+        try:
+            return json.loads(line)
+        except json.JSONDecodeError:
+            logger.warning("Malformed recorder reply: %r", line[:200])
+            return None
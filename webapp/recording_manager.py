@@ -10,12 +10,34 @@ timestamped session directory on the removable storage, accompanied by a
 The path to the Livox recorder executable can be configured via the
 ``LIVOX_RECORD_CMD`` environment variable.  It should point to a command that
 accepts the desired output filename as its last argument and exits after
-capturing a frame.
+capturing a frame.  By default the recorder is started once per session in
+server mode (see :mod:`webapp.recorder`) and asked for each frame over a pipe;
+set ``LIVOX_RECORDER_MODE=spawn`` to launch it once per frame instead.
+Several LiDARs can be recorded in parallel, one recorder and capture thread
+per device (see :mod:`webapp.devices`).
+
+Starting and stopping are asynchronous operations (see
+:mod:`webapp.operations`): :meth:`RecordingManager.request_stop` interrupts
+the capture workers, cancelling recorder processes that do not finish their
+frame within ``STOP_GRACE_PERIOD`` seconds, and returns at once; the
+recording thread then finalizes the session itself.
+
+When LAZ compression cannot keep up (see :mod:`webapp.admission`) frames are
+captured as ``frame_<n>.las`` and compressed in the background once the
+session has ended (see :mod:`webapp.recompress`).  All other work besides
+capture is scheduled by a :class:`~webapp.governor.Governor` that holds it
+back when the system runs hot or capture slows down; CSV exports it holds
+back are written once the session has ended (see :mod:`webapp.exports`).
 """
 
+import fcntl
+import functools
 import json
 import os
+import socket
+import struct
 import subprocess
+import tempfile
 import threading
 import time
 from typing import Optional, List
@@ -23,7 +45,6 @@ from datetime import datetime
 from pathlib import Path
 import logging
 import shutil
-import re
 import types
 
 try:
@@ -41,8 +62,26 @@ except ModuleNotFoundError:
         "save_laz module not found; auxiliary metadata files will not be generated"
     )
 
+from . import csv_export, exports, integrity, logging_config, merge, preview, recompress
+from .admission import AdmissionController, AdmissionPolicy
+from .container import CONTAINER_NAME, KIND_FRAME, ContainerWriter
+from .devices import DeviceCapture, DeviceConfig, devices_from_env
+from .governor import LEVELS, Governor, GovernorPolicy, rates_from_env
+from .lidar_detect import HeartbeatDetector, ports_from_env
+from .metrics import FrameMetrics
+from .mounts import get_monitor, mount_roots_from_env
+from .operations import OperationLog
+from .pipeline import FramePipeline
+from .recorder import Cancelled, PersistentRecorder, run_child
+from .recordings_log import RecordingsLog
+from .session_index import SessionIndex
+from .staging import StagingArea
+from .status import StatusPublisher, StatusSnapshot
+
 logger = logging.getLogger(__name__)
 
+_SIOCGIFADDR = 0x8915
+
 class RecordingManager:
     """Manage MID360 recordings by delegating to the Livox SDK.
 
@@ -59,25 +98,44 @@ class RecordingManager:
         if mount_roots is not None:
             self.mount_roots = [r.rstrip("/") for r in mount_roots]
         else:
-            env_roots = os.getenv("LIVOX_MOUNT_ROOTS")
-            if env_roots:
-                self.mount_roots = [r.rstrip("/") for r in env_roots.split(os.pathsep) if r]
-            else:
-                mr = os.getenv("MOUNT_ROOT")
-                if mr:
-                    self.mount_roots = [mr.rstrip("/")]
-                else:
-                    self.mount_roots = ["/media", "/run/media"]
+            self.mount_roots = mount_roots_from_env()
+        self._mounts = get_monitor(self.mount_roots)
         self.usb_mount: Optional[Path] = None
         self.output_dir: Optional[Path] = None
-        self.log_file: Optional[Path] = None
-        self.archive_file: Optional[Path] = None
+        self.recordings_log: Optional[RecordingsLog] = None
+        self.session_index: Optional[SessionIndex] = None
         self._thread: Optional[threading.Thread] = None
         self._stop_event: Optional[threading.Event] = None
         self.current_dir: Optional[Path] = None
         self.current_file: Optional[Path] = None
+        # Size of ``current_file``, so status reads never stat the drive
+        self._current_size: Optional[int] = None
         self.current_started: Optional[datetime] = None
         self.frame_counter: int = 0
+        # Optionally pack each session into one container file; per-frame
+        # files are then produced in a local scratch directory first.
+        self.session_container = os.getenv("SESSION_CONTAINER", "").lower() in ("1", "true", "yes")
+        self.container_scratch = os.getenv("CONTAINER_SCRATCH_DIR") or tempfile.gettempdir()
+        # Sensors recorded in parallel (``LIDAR_DEVICES``); empty for the
+        # usual single unnamed LiDAR.  Per-device capture state (recorder,
+        # frame directory, container, preview) lives in ``_devices``.
+        self.device_configs = devices_from_env()
+        self._devices: List[DeviceCapture] = []
+        # Optional fast local staging tier; frames are moved to the drive in
+        # batches by a background mover.
+        self.staging: Optional[StagingArea] = None
+        staging_dir = os.getenv("STAGING_DIR")
+        if staging_dir:
+            try:
+                self.staging = StagingArea(
+                    Path(staging_dir),
+                    cap_bytes=int(float(os.getenv("STAGING_MAX_MB", "512")) * 1024 * 1024),
+                    batch_bytes=int(float(os.getenv("STAGING_BATCH_MB", "32")) * 1024 * 1024),
+                    batch_interval=float(os.getenv("STAGING_BATCH_INTERVAL", "5")),
+                )
+            except OSError as e:
+                logger.error("Cannot use staging directory %s: %s", staging_dir, e)
+        self.staging_flush_timeout = float(os.getenv("STAGING_FLUSH_TIMEOUT", "300"))
         # Allow overriding the command used to invoke the recorder.
         cmd = os.getenv("LIVOX_RECORD_CMD", "save_laz")
         resolved = shutil.which(cmd)
@@ -88,175 +146,264 @@ class RecordingManager:
             logger.error("Recorder command '%s' not found; recordings disabled", cmd)
             self.record_cmd = None
             self._recorder_available = False
+        self.recorder_mode = os.getenv("LIVOX_RECORDER_MODE", "persistent").lower()
+        self.frame_timeout = float(os.getenv("LIVOX_FRAME_TIMEOUT", "30"))
+        self.last_frame_stats: Optional[dict] = None
         conv = os.getenv("LIVOX_CONVERT_CMD")
         self.convert_cmd = shutil.which(conv) if conv else None
-        self._last_size = 0
+        # ``builtin`` uses the in-process exporter and only falls back to
+        # ``LIVOX_CONVERT_CMD`` when it cannot decode a frame.
+        self.csv_converter = os.getenv("CSV_CONVERTER", "builtin").lower()
+        self.csv_columns = csv_export.columns_from_env()
         self._last_size_time: Optional[datetime] = None
-        self._lock = threading.Lock()
+        # Re-entrant: mount notifications may arrive while the lock is held
+        # by a caller of ``_ensure_storage``.
+        self._lock = threading.RLock()
+        # Auxiliary files and CSV conversion run off the capture thread
+        self.pipeline = FramePipeline(
+            workers=int(os.getenv("PIPELINE_WORKERS", "2")),
+            depth=int(os.getenv("PIPELINE_QUEUE_DEPTH", "8")),
+        )
+        self.metrics = FrameMetrics()
+        # Throughput/space tracking and degradation policy for the session
+        self.admission = AdmissionController(AdmissionPolicy.from_env())
+        if self.staging:
+            # Staged batches are the drive's real sequential write rate
+            self.staging.on_batch = self.admission.observe_write
+        self._aux_paused = False
+        self._decimation = 1
+        # Frame format chosen by the admission policy and the number of
+        # frames of the session captured as uncompressed LAS
+        self._compress = True
+        self._uncompressed_frames = 0
+        # Optional per-frame stage timings written next to the frames
+        self.timing_dump = os.getenv("FRAME_TIMING_DUMP", "").lower() in ("1", "true", "yes")
+        self._timing_file = None
+        self._timing_lock = threading.Lock()
+        # Priorities, rate limits and pausing of all non-capture work
+        self.governor = Governor(GovernorPolicy.from_env(), rates_from_env())
+        # LAS frames are compressed once the session has ended; verification
+        # and merging wait for it since they read the same frames.
+        self.recompressor = recompress.Recompressor(
+            paused=lambda: self._thread is not None or not self.governor.allowed("recompress"),
+            on_progress=self._on_recompress_progress,
+            limiter=self.governor.limiter("recompress"),
+        )
+        # CSV exports the governor held back during capture are written
+        # once the session has ended
+        self.exporter = exports.DeferredExports(
+            self._convert_to_csv,
+            paused=lambda: self._thread is not None
+            or self.recompressor.busy()
+            or not self.governor.allowed("convert"),
+            on_progress=self._on_exports_progress,
+            limiter=self.governor.limiter("convert"),
+            scratch=self.container_scratch,
+        )
+        # Frame checksums of the active session and background re-checks
+        self._manifest: Optional[integrity.ManifestWriter] = None
+        self.verifier = integrity.SessionVerifier(
+            rate=0,
+            paused=lambda: self._thread is not None
+            or self.recompressor.busy()
+            or self.exporter.busy()
+            or not self.governor.allowed("verify"),
+            on_result=self._on_verified,
+            sweep=self._sessions_to_verify,
+            interval=float(os.getenv("VERIFY_INTERVAL_HOURS", "0")) * 3600,
+            limiter=self.governor.limiter("verify"),
+        )
+        # Finished sessions are merged into one point cloud in the background
+        # (automatically with ``MERGE_SESSIONS``), never while recording.
+        self.merge_sessions = os.getenv("MERGE_SESSIONS", "").lower() in ("1", "true", "yes")
+        self.merger = merge.MergeQueue(
+            # Decoder processes are opt-in: each one is a separate
+            # interpreter with its own NumPy and laspy
+            workers=int(os.getenv("MERGE_WORKERS", "1")),
+            tile_size=float(os.getenv("MERGE_TILE_SIZE", "0")),
+            checkpoint_frames=int(os.getenv("MERGE_CHECKPOINT_FRAMES", "50")),
+            paused=lambda: self._thread is not None
+            or self.recompressor.busy()
+            or self.exporter.busy()
+            or not self.governor.allowed("merge"),
+            on_progress=self._on_merge_progress,
+            limiter=self.governor.limiter("merge"),
+        )
+        # ``/status`` is served from snapshots published in the background
+        self._status = StatusPublisher(
+            self._fast_status,
+            self._slow_status,
+            fast_interval=float(os.getenv("STATUS_FAST_INTERVAL", "0.5")),
+            slow_interval=float(os.getenv("STATUS_SLOW_INTERVAL", "10")),
+        )
         self.max_log_entries = int(os.getenv("RECORDINGS_LOG_LIMIT", "100"))
         archive_env = os.getenv("RECORDINGS_LOG_ARCHIVE", "").lower()
         self.archive_enabled = archive_env in ("1", "true", "yes")
-        self._log_error = False
-        self._archive_error = False
-        # Cache LiDAR detection result and refresh periodically
-        self._lidar_detected = self._probe_lidar()
+        # Bumped whenever a session is logged so clients know to refetch
+        self._log_version = 0
+        # LiDAR presence is inferred passively from its UDP traffic; probing
+        # with ``save_laz --check`` (backing off while nothing changes) is
+        # only used when the ports cannot be watched.
+        self._lidar_detected = False
         self._probe_interval = float(os.getenv("LIDAR_PROBE_INTERVAL", "5"))
+        self._probe_max_interval = float(os.getenv("LIDAR_PROBE_MAX_INTERVAL", "60"))
+        self._detector: Optional[HeartbeatDetector] = None
         self._detector_stop = threading.Event()
-        self._detector_thread = threading.Thread(
-            target=self._detection_loop, daemon=True
-        )
-        self._detector_thread.start()
-        self._ensure_storage()
+        self._detector_thread: Optional[threading.Thread] = None
+        # Why the capture loop ended early (storage removed, policy stop)
+        self._abort_reason: Optional[str] = None
+        # Start/stop requests and the transition in progress (``starting``,
+        # ``stopping`` or ``finalizing``); the stop operation is finished by
+        # the recording thread once the session is logged.
+        self.operations = OperationLog()
+        self.stop_grace = float(os.getenv("STOP_GRACE_PERIOD", "2"))
+        self._phase: Optional[str] = None
+        self._stop_op: Optional[str] = None
+        self._stop_requested: Optional[float] = None
+        # Set by close(); cancels CSV converters still running
+        self._closing = threading.Event()
+        # Hardware detection and opening the drive's logs happen in the
+        # background so the web server can answer right away; until then
+        # ``/status`` reports the ``initializing`` state.
+        self.startup_timeout = float(os.getenv("STARTUP_TIMEOUT", "30"))
+        self._ready = threading.Event()
+        self._init_started = time.monotonic()
+        self._status.start()
+        threading.Thread(target=self._initialize, name="manager-init", daemon=True).start()
 
-    # ---- internal helpers -------------------------------------------------
-    def _find_usb_mount(self) -> Optional[Path]:
-        """Locate the first writable USB mount created by ``usb-automount.sh``.
-
-        The install script mounts removable drives under ``<root>/usbN`` where
-        ``root`` defaults to ``/media``.  This helper probes the current mounts
-        using the ``mount`` and ``lsblk`` utilities and falls back to scanning
-        the filesystem directly.  The mount roots can be customised via the
-        ``MOUNT_ROOT`` (from the install script) or ``LIVOX_MOUNT_ROOTS``
-        environment variables.
-        """
-
-        prefixes = [f"{root}/usb" for root in self.mount_roots]
-
-        # Probe with ``mount`` first
-        try:
-            result = subprocess.run(["mount"], capture_output=True, text=True, check=False)
-            for line in result.stdout.splitlines():
-                parts = line.split()
-                if len(parts) >= 3:
-                    mp = parts[2]
-                    if any(mp.startswith(p) for p in prefixes) and os.access(mp, os.W_OK):
-                        return Path(mp)
-        except OSError:
-            pass
-
-        # Fallback to ``lsblk`` which lists mount points per block device
-        try:
-            result = subprocess.run(
-                ["lsblk", "-nr", "-o", "MOUNTPOINT"],
-                capture_output=True,
-                text=True,
-                check=False,
+    def _initialize(self) -> None:
+        """Detect the LiDAR and open the USB drive; runs once, off the caller."""
+        if os.getenv("LIDAR_DETECTION", "passive").lower() == "passive":
+            heartbeat_timeout = float(os.getenv("LIDAR_HEARTBEAT_TIMEOUT", "0.75"))
+            detector = HeartbeatDetector(
+                ports_from_env(),
+                timeout=heartbeat_timeout,
+                # While recording, frames are the heartbeats
+                suspended_timeout=self.frame_timeout + heartbeat_timeout,
+                on_change=self._on_lidar_change,
             )
-            for mp in result.stdout.splitlines():
-                if any(mp.startswith(p) for p in prefixes) and os.access(mp, os.W_OK):
-                    return Path(mp)
-        except OSError:
-            pass
-
-        # Final fallback: scan the filesystem directly
-        for root in self.mount_roots:
-            base = Path(root)
             try:
-                candidates = [
-                    p
-                    for p in base.glob("usb*")
-                    if os.path.ismount(p) and os.access(p, os.W_OK)
-                ]
-            except OSError:
-                continue
-            if candidates:
-                candidates.sort(
-                    key=lambda p: int(re.search(r"usb(\d+)$", p.name).group(1))
-                    if re.search(r"usb(\d+)$", p.name)
-                    else float("inf"),
+                detector.start()
+                self._detector = detector
+            except OSError as e:
+                logger.warning(
+                    "%s; probing with '%s --check' instead", e, self.record_cmd or "save_laz"
                 )
-                return candidates[0]
-        return None
+        if self._detector is None:
+            # The loop probes right away
+            self._detector_thread = threading.Thread(
+                target=self._detection_loop, name="lidar-probe", daemon=True
+            )
+            self._detector_thread.start()
+        self._mounts.subscribe(self._on_mount_change)
+        with self._lock:
+            self._ensure_storage()
+        self._ready.set()
+        logger.info("Initialised in %.3f s", time.monotonic() - self._init_started)
+        self._status.poke(slow=True)
+
+    @property
+    def ready(self) -> bool:
+        """Whether background initialisation has finished."""
+        return self._ready.is_set()
+
+    def wait_ready(self, timeout: Optional[float] = None) -> bool:
+        """Block until initialisation has finished or ``timeout`` expires."""
+        return self._ready.wait(timeout)
 
+    # ---- internal helpers -------------------------------------------------
     def _ensure_storage(self) -> bool:
-        mount = self._find_usb_mount()
+        """Point the output paths at the current USB mount.
+
+        The mount comes from the shared :class:`~webapp.mounts.MountMonitor`
+        cache, so this never spawns processes.
+        """
+        mount = self._mounts.current()
         if mount != self.usb_mount:
             self.usb_mount = mount
             if mount:
                 self.output_dir = mount / "recordings"
                 self.output_dir.mkdir(parents=True, exist_ok=True)
-                self.log_file = self.output_dir / "recordings.json"
-                self.archive_file = self.output_dir / "recordings_archive.json"
-                if not self.log_file.exists():
-                    self._write_log([])
+                self._open_log()
             else:
                 self.output_dir = None
-                self.log_file = None
-                self.archive_file = None
+                self._close_log()
         return self.output_dir is not None
 
+    def _on_mount_change(self, old: Optional[Path], new: Optional[Path]) -> None:
+        """React to the USB drive appearing or disappearing."""
+        if self.staging and old is not None and new != old:
+            # Ends a staging flush waiting on the drive that went away
+            self.staging.detach(old / "recordings")
+        with self._lock:
+            self._ensure_storage()
+            if (
+                self.current_dir
+                and self._stop_event
+                and (new is None or new not in self.current_dir.parents)
+            ):
+                logger.error("USB storage removed during recording; stopping")
+                self._abort_reason = "storage_removed"
+                self._interrupt_capture()
+        self._status.poke(slow=True)
+
     def _get_ip_address(self, iface: str) -> Optional[str]:
         """Return the IPv4 address for the given network interface."""
         try:
-            out = subprocess.check_output(
-                ["ip", "-4", "addr", "show", iface], text=True
-            )
-        except (OSError, subprocess.SubprocessError):
+            with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+                packed = fcntl.ioctl(
+                    sock.fileno(),
+                    _SIOCGIFADDR,
+                    struct.pack("256s", iface[:15].encode()),
+                )
+        except OSError:
             return None
-        m = re.search(r"inet (\d+\.\d+\.\d+\.\d+)", out)
-        return m.group(1) if m else None
+        return socket.inet_ntoa(packed[20:24])
 
-    def _load_log(self):
-        if not self.log_file or not self.log_file.exists():
-            return []
-        try:
-            return json.loads(self.log_file.read_text())
-        except json.JSONDecodeError:
-            logger.error("Corrupted recordings log detected; resetting")
-            self._write_log([])
-            return []
+    def _open_log(self) -> None:
+        self._close_log()
+        self.recordings_log = RecordingsLog(
+            self.output_dir, limit=self.max_log_entries, archive=self.archive_enabled
+        )
+        self.recordings_log.start_compactor()
+        self.session_index = SessionIndex(self.output_dir)
+        if self.staging and not self.current_dir:
+            # Finish moving sessions interrupted by a crash or a pulled drive
+            self.staging.recover(self.output_dir)
+        # Index sessions recorded before the index existed without delaying
+        # the caller; this scans each unknown session directory once.
+        threading.Thread(
+            target=self.session_index.seed,
+            args=(self.recordings_log.entries(), functools.partial(self.governor.acquire, "index")),
+            name="session-index-seed",
+            daemon=True,
+        ).start()
+        # Pick up compression and merges cut short by a power loss or a
+        # pulled drive
+        threading.Thread(
+            target=self._recover_jobs, args=(self.output_dir,), name="jobs-recover", daemon=True
+        ).start()
 
-    def _write_log(self, data):
-        if not self.log_file:
-            return
-        tmp_path = self.log_file.with_name(self.log_file.name + ".tmp")
-        try:
-            with tmp_path.open("w") as f:
-                f.write(json.dumps(data, indent=2))
-                f.flush()
-                os.fsync(f.fileno())
-            os.replace(tmp_path, self.log_file)
-            self._log_error = False
-        except OSError as e:
-            logger.warning("Failed to write recordings log: %s", e)
-            self._log_error = True
+    def _recover_jobs(self, output_dir: Path) -> None:
+        self.recompressor.recover(output_dir)
+        self.exporter.recover(output_dir)
+        self.merger.recover(output_dir)
+
+    def _close_log(self) -> None:
+        log = self.recordings_log
+        self.recordings_log = None
+        if log:
+            log.close()
+        index = self.session_index
+        self.session_index = None
+        if index:
+            index.close()
 
     def _save_log(self, entry):
-        if not self.log_file:
+        if not self.recordings_log:
             return
-        data = self._load_log()
-        data.append(entry)
-        overflow = []
-        if self.max_log_entries and len(data) > self.max_log_entries:
-            overflow = data[:-self.max_log_entries]
-            data = data[-self.max_log_entries:]
-        if overflow and self.archive_enabled:
-            self._archive_log(overflow)
-        self._write_log(data)
-
-    def _archive_log(self, entries):
-        if not self.archive_file or not entries:
-            return
-        try:
-            existing = (
-                json.loads(self.archive_file.read_text())
-                if self.archive_file.exists()
-                else []
-            )
-        except json.JSONDecodeError:
-            existing = []
-        existing.extend(entries)
-        tmp_path = self.archive_file.with_name(self.archive_file.name + ".tmp")
-        try:
-            with tmp_path.open("w") as f:
-                f.write(json.dumps(existing, indent=2))
-                f.flush()
-                os.fsync(f.fileno())
-            os.replace(tmp_path, self.archive_file)
-            self._archive_error = False
-        except OSError as e:
-            logger.warning("Failed to archive recordings log: %s", e)
-            self._archive_error = True
+        self.recordings_log.append(entry)
+        self._log_version += 1
 
     def _probe_lidar(self) -> bool:
         """Invoke the recorder in detection mode to check for a connected LiDAR."""
@@ -275,30 +422,183 @@ class RecordingManager:
             return False
 
     def _detection_loop(self) -> None:
-        """Background thread to refresh cached LiDAR detection results."""
+        """Background thread probing for the LiDAR when it cannot be heard.
+
+        The interval doubles (up to ``LIDAR_PROBE_MAX_INTERVAL``) while the
+        result stays the same and is reset when it changes.  No probes are
+        run during a recording; captured frames prove the LiDAR is there.
+        """
+        interval = self._probe_interval
         while not self._detector_stop.is_set():
-            detected = self._probe_lidar()
             with self._lock:
-                self._lidar_detected = detected
+                recording = self._thread is not None
+            if not recording:
+                detected = self._probe_lidar()
+                with self._lock:
+                    changed = detected != self._lidar_detected
+                    self._lidar_detected = detected
+                if changed:
+                    self._status.poke()
+                    interval = self._probe_interval
+                else:
+                    interval = min(interval * 2, self._probe_max_interval)
             # Allow early exit during the wait period
-            self._detector_stop.wait(self._probe_interval)
+            self._detector_stop.wait(interval)
+
+    def _on_lidar_change(self, detected: bool) -> None:
+        with self._lock:
+            self._lidar_detected = detected
+        self._status.poke()
+
+    def _lidar_seen(self) -> None:
+        """A frame was captured, so the LiDAR is connected."""
+        if self._detector:
+            self._detector.heartbeat()
+            return
+        with self._lock:
+            changed = not self._lidar_detected
+            self._lidar_detected = True
+        if changed:
+            self._status.poke()
+
+    def _open_recorder(self, device: DeviceCapture) -> None:
+        """Start the persistent recorder for a device if enabled."""
+        if self.recorder_mode != "persistent" or not self.record_cmd:
+            return
+        recorder = PersistentRecorder(
+            self.record_cmd, frame_timeout=self.frame_timeout, args=device.config.recorder_args
+        )
+        t0 = time.perf_counter()
+        started = recorder.start()
+        self.metrics.observe("recorder_start", time.perf_counter() - t0)
+        if started:
+            device.recorder = recorder
+            device.decimation = 1
+        else:
+            logger.warning("Falling back to spawning the recorder for each frame")
+
+    def _close_recorder(self, device: DeviceCapture) -> None:
+        recorder = device.recorder
+        device.recorder = None
+        if recorder:
+            recorder.close()
+
+    def _apply_decimation(self, device: DeviceCapture, step: int) -> None:
+        """Ask a device's recorder to thin out frames as requested by the policy.
 
-    def _save_frame(self, path: Path) -> bool:
-        """Invoke the recorder to capture a single frame to ``path``."""
+        Only called from the device's own worker, which owns the recorder pipe.
+        """
+        device.decimation = step
+        if device.recorder:
+            device.recorder.set_decimation(step)
+        else:
+            logger.warning("Recorder in spawn mode cannot decimate; step %d not applied", step)
+
+    def _save_frame(self, device: DeviceCapture, path: Path) -> bool:
+        """Invoke the device's recorder to capture a single frame to ``path``."""
         if not self.record_cmd:
             return False
+        stop_event = self._stop_event
+        if device.recorder:
+            stats = device.recorder.capture(path)
+            if not device.recorder.alive and not (stop_event and stop_event.is_set()):
+                # Restart once; keep spawning per frame if that fails too.
+                device.recorder.close()
+                device.recorder = None
+                self._open_recorder(device)
+            if stats is None:
+                return False
+            device.last_stats = stats
+            return True
+        device.last_stats = None
         try:
-            subprocess.run([self.record_cmd, str(path)], check=True)
+            run_child(
+                [self.record_cmd, *device.config.recorder_args, str(path)],
+                cancel=stop_event,
+                grace=self.stop_grace,
+            )
             return True
+        except Cancelled:
+            return False
         except (OSError, subprocess.SubprocessError) as e:
             logger.warning("Failed to save frame %s: %s", path, e)
             return False
 
+    def _open_container(self, device: DeviceCapture) -> None:
+        """Set up where the frames of a device are written."""
+        device.container = None
+        device.frame_dir = device.dir
+        if not self.session_container:
+            if self.staging and self.output_dir:
+                try:
+                    device.frame_dir = self.staging.session_dir(
+                        str(device.dir.relative_to(self.output_dir))
+                    )
+                except (OSError, ValueError) as e:
+                    logger.warning("Staging unavailable (%s); writing to the drive directly", e)
+            return
+        try:
+            device.container = ContainerWriter(device.dir / CONTAINER_NAME)
+            device.frame_dir = Path(
+                tempfile.mkdtemp(prefix=f"{device.dir.name}-", dir=self.container_scratch)
+            )
+        except OSError as e:
+            logger.warning("Cannot use a session container (%s); writing individual files", e)
+            if device.container:
+                device.container.close()
+            device.container = None
+            device.frame_dir = device.dir
+
+    def _close_container(self, device: DeviceCapture) -> None:
+        container = device.container
+        frame_dir = device.frame_dir
+        device.container = None
+        device.frame_dir = None
+        if container is None:
+            return
+        try:
+            container.close()
+        except OSError as e:
+            logger.error("Failed to finish session container %s: %s", container.path, e)
+        if frame_dir:
+            shutil.rmtree(frame_dir, ignore_errors=True)
+
+    def _flush_staging(self) -> bool:
+        """Wait until the session's staged files are on the drive."""
+        staging = self.staging
+        session = self.current_dir
+        if staging is None or session is None:
+            return True
+        if not staging.flush(self.staging_flush_timeout):
+            logger.error(
+                "Staged files of %s are not on the drive yet; they stay in %s",
+                session.name,
+                staging.root / session.name,
+            )
+            return False
+        staging.discard_session(session.name)
+        return True
+
+    def _close_preview(self, device: DeviceCapture) -> None:
+        session_preview = device.preview
+        device.preview = None
+        if session_preview is not None:
+            session_preview.save()
+
     def _convert_to_csv(self, laz: Path, csv: Path) -> bool:
-        """Convert ``laz`` to ``csv`` using an external command if available."""
+        """Convert ``laz`` to ``csv`` in-process or with an external command."""
+        if self.csv_converter == "builtin" and csv_export.available():
+            try:
+                csv_export.convert(laz, csv, self.csv_columns)
+                return True
+            except (ValueError, OSError) as e:
+                if not self.convert_cmd:
+                    logger.warning("Failed to convert %s to CSV: %s", laz, e)
+                    return False
+                logger.debug("Built-in CSV export of %s failed (%s); using %s", laz, e, self.convert_cmd)
         if self.convert_cmd:
             try:
-                subprocess.run([self.convert_cmd, str(laz), str(csv)], check=True)
+                run_child([self.convert_cmd, str(laz), str(csv)], self._closing, self.stop_grace)
                 return True
             except (OSError, subprocess.SubprocessError) as e:
                 logger.warning("Failed to convert %s to CSV: %s", laz, e)
@@ -306,10 +606,21 @@ class RecordingManager:
         return csv.exists()
 
     def _finalize_recording(self, success: bool, error: Optional[str] = None) -> None:
-        """Join the worker thread, reset state and log the result."""
+        """Join the worker thread, reset state, log the result and finish the
+        pending stop operation."""
         thread = self._thread
         if thread and thread is not threading.current_thread():
             thread.join()
+        # Make sure every captured frame is fully post-processed before the
+        # session is logged as finished.
+        self.pipeline.flush()
+        devices = list(self._devices)
+        for device in devices:
+            self._close_preview(device)
+            self._close_container(device)
+        self._close_manifest()
+        staging_flushed = self._flush_staging()
+        self._close_timing_dump()
         with self._lock:
             entry = {
                 "folder": self.current_dir.name if self.current_dir else None,
@@ -321,73 +632,575 @@ class RecordingManager:
             }
             if not success:
                 entry["error"] = error or "save_failed"
+            if not staging_flushed:
+                entry["pending_flush"] = True
+            if self._uncompressed_frames:
+                entry["uncompressed_frames"] = self._uncompressed_frames
+            if self.device_configs:
+                entry["devices"] = {
+                    d.name: {"frames": d.frames, "error": d.error} for d in devices
+                }
             self._save_log(entry)
+            if self.session_index and self.current_dir:
+                self.session_index.finish(
+                    self.current_dir.name,
+                    entry["stopped"],
+                    entry.get("error"),
+                    frames=self.frame_counter,
+                )
+            stop_op, requested = self._stop_op, self._stop_requested
+            finished = self.current_dir
+            self._stop_op = None
+            self._stop_requested = None
+            self._phase = None
             self._thread = None
             self._stop_event = None
+            self._devices = []
             self.current_dir = None
             self.current_file = None
+            self._current_size = None
             self.current_started = None
             self.frame_counter = 0
-            self._last_size = 0
+            self._uncompressed_frames = 0
             self._last_size_time = None
+        if requested is not None:
+            seconds = time.perf_counter() - requested
+            self.metrics.observe("stop", seconds)
+            logger.info("Recording %s stopped in %.3f s", entry["folder"], seconds)
+        if finished and staging_flushed and entry.get("uncompressed_frames"):
+            # Queued before the stop finishes so the pending frames are
+            # listed as soon as the session is
+            self._compress_session(finished)
+        if finished and staging_flushed:
+            self._export_session(finished)
+        # Publish the idle state before the stop is reported as done
+        self._status.refresh()
+        if stop_op:
+            self.operations.finish(stop_op, error=entry.get("error"))
+        if self.merge_sessions and finished and staging_flushed and entry["frames"]:
+            self.merger.submit(finished)
+
+    def _interrupt_capture(self) -> None:
+        """Make the capture workers stop as soon as possible.
+
+        Sets the stop event and cancels the persistent recorders, so that a
+        frame in flight gets ``stop_grace`` seconds before its recorder is
+        terminated; spawned recorders watch the stop event themselves.
+        """
+        with self._lock:
+            stop_event = self._stop_event
+            devices = list(self._devices)
+        if stop_event is None:
+            return
+        stop_event.set()
+        for device in devices:
+            recorder = device.recorder
+            if recorder:
+                recorder.cancel(self.stop_grace)
 
     def _record_loop(self) -> None:
-        """Background loop that saves frames until stopped."""
+        """Body of the recording thread; cleans up after itself if it fails."""
+        try:
+            self._record_session()
+        except Exception:
+            logger.exception("Recording thread failed")
+            self._abandon_recording()
+
+    def _abandon_recording(self) -> None:
+        """Reset the recording state after the recording thread crashed."""
+        with self._lock:
+            if self._thread is not threading.current_thread():
+                # The session was finalized before the failure
+                return
+            self._thread = None
+            self._stop_event = None
+            self._phase = None
+            if self._stop_op:
+                self.operations.finish(self._stop_op, error="save_failed")
+                self._stop_op = None
+            self.current_dir = None
+            self.current_file = None
+            self._current_size = None
+            self.current_started = None
+            self.frame_counter = 0
+        self._status.poke()
+
+    def _record_session(self) -> None:
+        """Run one capture worker per device, then finalize the session."""
+        if self.current_dir:
+            self.admission.begin(self.current_dir)
+        # The recorders bind the LiDAR ports themselves
+        if self._detector:
+            self._detector.suspend()
+        devices = list(self._devices)
+        try:
+            if len(devices) == 1:
+                self._device_loop(devices[0])
+            else:
+                for device in devices:
+                    device.thread = threading.Thread(
+                        target=self._device_loop,
+                        args=(device,),
+                        name=f"capture-{device.name}",
+                        daemon=True,
+                    )
+                    device.thread.start()
+                for device in devices:
+                    device.thread.join()
+        finally:
+            if self._detector:
+                self._detector.resume()
+            self.admission.end()
+        with self._lock:
+            stop_event = self._stop_event
+            self._phase = "finalizing"
+            stop_op = self._stop_op
+        if stop_op:
+            self.operations.update(stop_op, "finalizing")
+        self._status.poke()
+        if self._abort_reason:
+            self._finalize_recording(False, self._abort_reason)
+        elif stop_event is not None and stop_event.is_set():
+            self._finalize_recording(True)
+        else:
+            # Every device dropped out on its own
+            self._finalize_recording(False, "save_failed")
+
+    def _device_loop(self, device: DeviceCapture) -> None:
+        self._open_recorder(device)
+        try:
+            self._capture_frames(device)
+        finally:
+            self._close_recorder(device)
+
+    def _capture_frames(self, device: DeviceCapture) -> None:
         frame_idx = 0
         failures = 0
         max_failures = 3
-        while self._stop_event and not self._stop_event.is_set():
+        stop_event = self._stop_event
+        named = bool(self.device_configs)
+        while stop_event and not stop_event.is_set():
             if not self.current_dir:
                 break
-            path = self.current_dir / f"frame_{frame_idx:06d}.laz"
-            csv_path = path.with_suffix(".csv")
-            if not self._save_frame(path):
+            # The policy may have changed on another device's frame
+            if self._decimation != device.decimation:
+                self._apply_decimation(device, self._decimation)
+            frame_dir = device.frame_dir
+            staged = self.staging is not None and device.container is None and frame_dir != device.dir
+            if staged and not self.staging.has_room(device.last_size):
+                # Staging is full; do not wait for the mover
+                staged = False
+                frame_dir = device.dir
+            # Packed sessions are never recompressed, so they stay LAZ
+            compress = self._compress or device.container is not None
+            path = frame_dir / f"frame_{frame_idx:06d}.{'laz' if compress else 'las'}"
+            t0 = time.perf_counter()
+            if not self._save_frame(device, path):
+                if stop_event.is_set():
+                    # The frame in flight was cancelled by a stop request
+                    path.unlink(missing_ok=True)
+                    break
                 failures += 1
+                self.metrics.inc("failures_total")
                 logger.error("Failed to save frame %s", path)
+                with self._lock:
+                    device.failures += 1
+                if self.session_index:
+                    self.session_index.add_failure(self.current_dir.name)
                 if failures <= max_failures:
-                    time.sleep(1)
+                    self.metrics.inc("retries_total")
+                    stop_event.wait(1)
                     continue
-                self._finalize_recording(False, "save_failed")
+                # Drop this device; the others keep recording
+                if named:
+                    logger.error("Device %s dropped out of the session", device.name)
+                with self._lock:
+                    device.state = "failed"
+                    device.error = "save_failed"
                 return
+            timings = {"capture": time.perf_counter() - t0}
+            self.governor.observe_capture(timings["capture"])
             failures = 0
-            # Generate auxiliary files following mandeye_controller conventions
-            lidar_sn = self.current_dir / f"lidar{frame_idx:04d}.sn"
-            status_file = self.current_dir / f"status{frame_idx:04d}.json"
-            gnss_proc = self.current_dir / f"gnss{frame_idx:04d}.gnss"
-            gnss_raw = self.current_dir / f"gnss{frame_idx:04d}.nmea"
-            with self._lock:
-                lidar_detected = self._lidar_detected
-            sl_utils.write_lidar_sn(lidar_sn)
-            sl_utils.write_status(status_file, lidar_detected=lidar_detected)
-            sl_utils.write_gnss(gnss_proc, gnss_raw)
-            # Write IMU CSV and serial number files if utilities are available
-            imu_csv = self.current_dir / f"imu{frame_idx:04d}.csv"
-            imu_sn = self.current_dir / f"imu{frame_idx:04d}.sn"
-            try:
-                # Some versions expose a combined helper
-                sl_utils.write_imu(imu_csv, imu_sn)  # type: ignore[attr-defined]
-            except Exception:
-                try:
-                    sl_utils.write_imu_csv(imu_csv)  # type: ignore[attr-defined]
-                except Exception:
-                    pass
-                try:
-                    sl_utils.write_imu_sn(imu_sn)  # type: ignore[attr-defined]
-                except Exception:
-                    pass
-            if not csv_path.exists():
-                self._convert_to_csv(path, csv_path)
+            self._lidar_seen()
             try:
                 size = path.stat().st_size
             except OSError:
                 size = 0
+            stats = device.last_stats or {}
+            if stats.get("save_duration_sec1", -1) >= 0:
+                timings["laz_write"] = stats["save_duration_sec1"]
+            for stage, seconds in timings.items():
+                self.metrics.observe(stage, seconds)
+            self.metrics.frame(size)
+            if staged:
+                self.staging.reserve(size)
+            decision = self.admission.observe_frame(size, timings.get("laz_write"), compress)
+            with self._lock:
+                self._decimation = decision.decimation
+                self._compress = decision.compress
+                if not compress:
+                    self._uncompressed_frames += 1
+                aux_changed = decision.aux_paused != self._aux_paused
+                self._aux_paused = decision.aux_paused
+            if decision.decimation != device.decimation:
+                self._apply_decimation(device, decision.decimation)
+            if aux_changed:
+                logger.warning(
+                    "%s auxiliary exports", "Pausing" if decision.aux_paused else "Resuming"
+                )
             now = datetime.utcnow()
             with self._lock:
+                device.state = "recording"
+                device.frames = frame_idx + 1
+                device.bytes += size
+                device.last_size = size
+                device.current_file = path
+                device.throughput.add(size)
                 self.current_file = path
-                self.frame_counter = frame_idx + 1
-                self._last_size = size
+                self._current_size = size
+                self.frame_counter += 1
+                self.last_frame_stats = device.last_stats
                 self._last_size_time = now
+                lidar_detected = self._lidar_detected
+                started = self.current_started
+            index = self.session_index
+            if index:
+                index.add_frame(
+                    self.current_dir.name,
+                    size,
+                    points=stats.get("points_count"),
+                    elapsed=(now - started).total_seconds() if started else None,
+                )
+            self._status.poke()
+            # Hand the frame to the post-processing workers; blocks only when
+            # the queue is full so capture stays ahead of slow storage.
+            self.pipeline.submit(
+                functools.partial(
+                    self._postprocess_frame,
+                    frame_dir,
+                    frame_idx,
+                    path,
+                    lidar_detected,
+                    timings,
+                    time.perf_counter(),
+                    not decision.aux_paused,
+                    device.container,
+                    device.dir if staged else None,
+                    device.preview,
+                    device.name if named else None,
+                    None if device.container else self._manifest,
+                    stats.get("crc32"),
+                )
+            )
             frame_idx += 1
+            if decision.stop_reason:
+                self._abort_reason = decision.stop_reason
+                # Stop the other devices as well
+                self._interrupt_capture()
+                return
+        with self._lock:
+            if device.state != "failed":
+                device.state = "stopped"
+
+    def _postprocess_frame(
+        self,
+        session_dir: Path,
+        frame_idx: int,
+        path: Path,
+        lidar_detected: bool,
+        timings: Optional[dict] = None,
+        queued: Optional[float] = None,
+        exports: bool = True,
+        container: Optional[ContainerWriter] = None,
+        staged_to: Optional[Path] = None,
+        session_preview: Optional[preview.SessionPreview] = None,
+        device: Optional[str] = None,
+        manifest: Optional[integrity.ManifestWriter] = None,
+        checksum: Optional[str] = None,
+    ) -> None:
+        """Write auxiliary files and the CSV export for a captured frame.
+
+        With ``exports`` false (the admission policy paused them) only the
+        timings are recorded; the frame alone is kept.  A CSV export the
+        governor does not allow is deferred to the end of the session (see
+        :mod:`webapp.exports`); auxiliary files it does not allow are skipped.  With a
+        ``container`` the frame and its files are packed into it here, off
+        the capture thread, and removed from the scratch directory
+        ``session_dir``.  ``staged_to`` names the session
+        directory on the drive when ``session_dir`` is in the staging area;
+        the finished files are then handed to the mover.  The frame is
+        folded into ``session_preview`` before any file is moved.  ``device``
+        names the sensor in the timing dump of a multi-LiDAR session.  The
+        frame's CRC-32 (``checksum`` from the recorder, or computed here) is
+        added to ``manifest`` while the frame is still on local storage or in
+        the page cache.
+        """
+        timings = dict(timings or {})
+        t0 = time.perf_counter()
+        if queued is not None:
+            timings["queue_wait"] = t0 - queued
+        # Files to move along with the frame; the frame leaves the staging
+        # area (or the container scratch directory) even if a step fails
+        outputs: List[Path] = []
+        try:
+            if session_preview is not None:
+                session_preview.add_frame(path)
+                timings["preview"] = time.perf_counter() - t0
+                self.metrics.observe("preview", timings["preview"])
+                t0 = time.perf_counter()
+            if manifest is not None:
+                self._add_to_manifest(manifest, path, device, checksum)
+                timings["checksum"] = time.perf_counter() - t0
+                self.metrics.observe("checksum", timings["checksum"])
+                t0 = time.perf_counter()
+            if not exports:
+                if "queue_wait" in timings:
+                    self.metrics.observe("queue_wait", timings["queue_wait"])
+                self._dump_timings(frame_idx, timings, device)
+                return
+            csv_path = path.with_suffix(".csv")
+            outputs.append(csv_path)
+            # Generate auxiliary files following mandeye_controller conventions
+            lidar_sn = session_dir / f"lidar{frame_idx:04d}.sn"
+            status_file = session_dir / f"status{frame_idx:04d}.json"
+            gnss_proc = session_dir / f"gnss{frame_idx:04d}.gnss"
+            gnss_raw = session_dir / f"gnss{frame_idx:04d}.nmea"
+            imu_csv = session_dir / f"imu{frame_idx:04d}.csv"
+            imu_sn = session_dir / f"imu{frame_idx:04d}.sn"
+            aux = [lidar_sn, status_file, gnss_proc, gnss_raw, imu_csv, imu_sn]
+            # Like the export, never wait for the governor here
+            if self.governor.acquire("aux", len(aux), timeout=0):
+                outputs += aux
+                sl_utils.write_lidar_sn(lidar_sn)
+                sl_utils.write_status(status_file, lidar_detected=lidar_detected)
+                sl_utils.write_gnss(gnss_proc, gnss_raw)
+                # Write IMU CSV and serial number files if utilities are available
+                try:
+                    # Some versions expose a combined helper
+                    sl_utils.write_imu(imu_csv, imu_sn)  # type: ignore[attr-defined]
+                except Exception:
+                    try:
+                        sl_utils.write_imu_csv(imu_csv)  # type: ignore[attr-defined]
+                    except Exception:
+                        pass
+                    try:
+                        sl_utils.write_imu_sn(imu_sn)  # type: ignore[attr-defined]
+                    except Exception:
+                        pass
+            else:
+                self.metrics.inc("aux_skipped_total")
+            t1 = time.perf_counter()
+            timings["aux"] = t1 - t0
+            if not csv_path.exists():
+                if self._convert_allowed(path):
+                    if not self._convert_to_csv(path, csv_path):
+                        self.metrics.inc("postprocess_failures_total")
+                    timings["convert"] = time.perf_counter() - t1
+                else:
+                    # Written after the session, once the governor allows it
+                    self._defer_export(path, container, staged_to, device)
+            for stage in ("queue_wait", "aux", "convert"):
+                if stage in timings:
+                    self.metrics.observe(stage, timings[stage])
+            self._dump_timings(frame_idx, timings, device)
+        finally:
+            if container is not None:
+                self._pack_outputs(container, path, outputs)
+            elif staged_to is not None:
+                self._commit_staged(path, outputs, staged_to)
+
+    def _defer_export(
+        self,
+        frame: Path,
+        container: Optional[ContainerWriter],
+        staged_to: Optional[Path],
+        device: Optional[str],
+    ) -> None:
+        """Leave the CSV of ``frame`` to :class:`~webapp.exports.DeferredExports`."""
+        if container is not None:
+            drive_dir = container.path.parent
+        else:
+            drive_dir = staged_to or frame.parent
+        session = drive_dir.parent if device else drive_dir
+        try:
+            exports.defer(session, f"{device}/{frame.name}" if device else frame.name)
+            self.metrics.inc("exports_deferred_total")
+        except OSError as e:
+            self.metrics.inc("postprocess_failures_total")
+            logger.warning("Cannot defer the CSV export of %s: %s", frame, e)
+
+    def _convert_allowed(self, frame: Path) -> bool:
+        """Take the governor's tokens for exporting ``frame`` without waiting
+        for it to resume; capture must not queue up behind a paused export."""
+        try:
+            size = frame.stat().st_size
+        except OSError:
+            size = 0
+        return self.governor.acquire("convert", size, timeout=0)
+
+    def _commit_staged(self, frame: Path, outputs: List[Path], dest: Path) -> None:
+        """Queue a frame and its exports for moving to the drive."""
+        try:
+            reserved = frame.stat().st_size
+        except OSError:
+            reserved = 0
+        self.staging.commit([frame] + [f for f in outputs if f.exists()], dest, reserved=reserved)
+
+    def _pack_outputs(self, container: ContainerWriter, frame: Path, outputs: List[Path]) -> None:
+        """Move a frame and its auxiliary files into the container."""
+        try:
+            container.add_file(frame.name, frame, KIND_FRAME)
+        except (OSError, ValueError) as e:
+            self.metrics.inc("failures_total")
+            logger.error("Failed to pack frame %s: %s", frame.name, e)
+        for f in outputs:
+            if not f.exists():
+                continue
+            try:
+                container.add_file(f.name, f)
+            except (OSError, ValueError) as e:
+                self.metrics.inc("postprocess_failures_total")
+                logger.warning("Failed to pack %s: %s", f.name, e)
+            f.unlink(missing_ok=True)
+        frame.unlink(missing_ok=True)
+
+    def _open_manifest(self) -> None:
+        if all(d.container for d in self._devices):
+            # Container records carry their own checksums
+            return
+        try:
+            self._manifest = integrity.ManifestWriter(self.current_dir / integrity.MANIFEST_NAME)
+        except OSError as e:
+            logger.warning("Failed to open session manifest: %s", e)
+
+    def _close_manifest(self) -> None:
+        manifest = self._manifest
+        self._manifest = None
+        if manifest:
+            manifest.close()
+
+    def _add_to_manifest(
+        self, manifest: integrity.ManifestWriter, path: Path, device: Optional[str], checksum: Optional[str]
+    ) -> None:
+        name = f"{device}/{path.name}" if device else path.name
+        try:
+            if checksum:
+                crc, size = int(checksum, 16), path.stat().st_size
+            else:
+                crc, size = integrity.file_crc32(path)
+        except (OSError, ValueError) as e:
+            logger.warning("Cannot checksum %s: %s", path, e)
+            return
+        manifest.add(name, size, crc)
+
+    def _sessions_to_verify(self) -> List[Path]:
+        output_dir = self.output_dir
+        if not output_dir:
+            return []
+        try:
+            return sorted(p for p in output_dir.glob("session_*") if p.is_dir())
+        except OSError:
+            return []
+
+    def _on_verified(self, name: str, result: dict) -> None:
+        index = self.session_index
+        if index:
+            index.update(
+                name,
+                integrity={
+                    "verified": result["verified"],
+                    "checked": result.get("checked", 0),
+                    "bad": result.get("bad", []),
+                    "missing": result.get("missing", []),
+                    "error": result.get("error"),
+                },
+            )
+        self._status.poke()
+
+    def _on_merge_progress(self, name: str, state: dict) -> None:
+        index = self.session_index
+        if index:
+            index.update(
+                name,
+                merge={
+                    key: state.get(key)
+                    for key in ("state", "frames_done", "frames_total", "points", "file", "tiles", "error")
+                    if key in state
+                },
+            )
+        self._status.poke()
+
+    def _compress_session(self, session: Path) -> None:
+        """Queue the LAS frames of ``session`` for compression."""
+        pending = recompress.pending_frames(session)
+        if pending and self.recompressor.submit(session):
+            self._on_recompress_progress(
+                session.name,
+                {"state": "queued", "pending": [str(f.relative_to(session)) for f in pending]},
+            )
+
+    def _on_recompress_progress(self, name: str, state: dict) -> None:
+        index = self.session_index
+        if index:
+            index.update(
+                name,
+                compression={
+                    key: state.get(key)
+                    for key in ("state", "frames_done", "pending", "bytes_saved", "error")
+                    if key in state
+                },
+            )
+        self._status.poke()
+
+    def _export_session(self, session: Path) -> None:
+        """Queue the CSV exports deferred during ``session``."""
+        pending = exports.pending_frames(session)
+        if pending and self.exporter.submit(session):
+            self._on_exports_progress(session.name, {"state": "queued", "pending": pending})
+
+    def _on_exports_progress(self, name: str, state: dict) -> None:
+        index = self.session_index
+        if index:
+            index.update(
+                name,
+                exports={
+                    key: state.get(key)
+                    for key in ("state", "frames_done", "pending", "error")
+                    if key in state
+                },
+            )
+        self._status.poke()
+
+    def _open_timing_dump(self, session_dir: Path) -> None:
+        if not self.timing_dump:
+            return
+        try:
+            self._timing_file = (session_dir / "timings.jsonl").open("a", buffering=1)
+        except OSError as e:
+            logger.warning("Failed to open frame timing dump: %s", e)
+
+    def _close_timing_dump(self) -> None:
+        with self._timing_lock:
+            f = self._timing_file
+            self._timing_file = None
+        if f:
+            try:
+                f.close()
+            except OSError:
+                pass
+
+    def _dump_timings(self, frame_idx: int, timings: dict, device: Optional[str] = None) -> None:
+        with self._timing_lock:
+            if not self._timing_file:
+                return
+            record = {"frame": frame_idx}
+            if device:
+                record["device"] = device
+            record.update({k: round(v, 6) for k, v in timings.items()})
+            try:
+                self._timing_file.write(json.dumps(record) + "\n")
+            except OSError as e:
+                logger.warning("Failed to write frame timings: %s", e)
 
     # ---- public API -------------------------------------------------------
     def start_recording(self) -> tuple[bool, Optional[str]]:
@@ -396,11 +1209,15 @@ class RecordingManager:
         Returns a tuple ``(started, error)`` where ``started`` indicates
         whether the recording thread was launched and ``error`` is ``None`` on
         success or a string identifying the failure.  Possible error codes are
-        ``"already_active"`` when a recording is in progress, ``"no_recorder"``
-        when the recorder command is missing, and ``"spawn_failed"`` when the
+        ``"already_active"`` when a recording is in progress, ``"initializing"``
+        when start-up did not finish within ``STARTUP_TIMEOUT``, ``"no_recorder"``
+        when the recorder command is missing, ``"storage_full"`` when the
+        drive is below the admission reserve, and ``"spawn_failed"`` when the
         recording loop cannot be created.
         """
 
+        if not self._ready.wait(self.startup_timeout):
+            return False, "initializing"
         with self._lock:
             if not self._recorder_available:
                 return False, "no_recorder"
@@ -410,9 +1227,13 @@ class RecordingManager:
                 return False, "no_storage"
             cached_detected = self._lidar_detected
 
-        # Probe for the LiDAR outside the lock to avoid blocking other calls
+        # Check for the LiDAR outside the lock to avoid blocking other calls;
+        # a just-plugged LiDAR is heard within the heartbeat timeout.
         if not cached_detected:
-            cached_detected = self._probe_lidar()
+            if self._detector:
+                cached_detected = self._detector.wait(self._detector.timeout)
+            else:
+                cached_detected = self._probe_lidar()
 
         with self._lock:
             self._lidar_detected = cached_detected
@@ -422,6 +1243,9 @@ class RecordingManager:
                 return False, "already_active"
             if not self._ensure_storage():
                 return False, "no_storage"
+            refusal = self.admission.admit(self.output_dir)
+            if refusal:
+                return False, refusal
 
             timestamp = datetime.utcnow().strftime("%Y%m%d_%H%M%S")
             self.current_dir = self.output_dir / f"session_{timestamp}"
@@ -429,8 +1253,27 @@ class RecordingManager:
             self.current_started = datetime.utcnow()
             self.current_file = None
             self.frame_counter = 0
-            self._last_size = 0
             self._last_size_time = None
+            self.last_frame_stats = None
+            self._abort_reason = None
+            self._aux_paused = False
+            self._decimation = 1
+            self._compress = True
+            self._uncompressed_frames = 0
+            self._devices = [
+                DeviceCapture(config, self.current_dir / config.name)
+                for config in self.device_configs
+            ] or [DeviceCapture(DeviceConfig("lidar"), self.current_dir)]
+            for device in self._devices:
+                device.dir.mkdir(parents=True, exist_ok=True)
+                self._open_container(device)
+                device.preview = preview.from_env(device.dir / preview.PREVIEW_NAME)
+            self._open_manifest()
+            self._open_timing_dump(self.current_dir)
+            if self.session_index:
+                self.session_index.begin(
+                    self.current_dir.name, self.current_started.isoformat()
+                )
             self._stop_event = threading.Event()
             self._thread = threading.Thread(target=self._record_loop, daemon=True)
             try:
@@ -440,89 +1283,290 @@ class RecordingManager:
                 self._stop_event = None
                 self.current_dir = None
                 self.current_started = None
+                for device in self._devices:
+                    device.preview = None
+                    self._close_container(device)
+                self._devices = []
+                self._close_manifest()
+                self._close_timing_dump()
                 return False, "spawn_failed"
-            return True, None
+        self._status.refresh()
+        return True, None
 
-    def stop_recording(self) -> bool:
-        """Stop the Livox recording and log the result."""
+    def request_start(self) -> dict:
+        """Start a recording in the background.
+
+        Returns the start operation; it fails with one of the error codes of
+        :meth:`start_recording`.
+        """
+        op = self.operations.create("start", "starting")
+        threading.Thread(
+            target=self._run_start, args=(op["id"],), name="start-recording", daemon=True
+        ).start()
+        return op
+
+    def _run_start(self, op_id: str) -> None:
         with self._lock:
-            if not self._thread or not self._thread.is_alive():
-                return False
-            if self._stop_event:
-                self._stop_event.set()
-        self._finalize_recording(True)
-        return True
+            if self._phase is None and self._thread is None:
+                self._phase = "starting"
+        self._status.poke()
+        try:
+            started, error = self.start_recording()
+        except Exception:
+            logger.exception("Starting the recording failed")
+            started, error = False, "spawn_failed"
+        with self._lock:
+            if self._phase == "starting":
+                self._phase = None
+            session = self.current_dir.name if started and self.current_dir else None
+        self.operations.finish(op_id, error=error, failed=not started, session=session)
+        self._status.poke()
+
+    def request_stop(self) -> Optional[dict]:
+        """Ask the active recording to stop and return without waiting.
 
-    def status(self):
+        Returns the stop operation (the pending one if a stop is already
+        under way), or ``None`` when nothing is recording.  The operation
+        finishes once the session has been finalized and logged.
+        """
         with self._lock:
-            storage = self._ensure_storage()
-            if self._thread and not self._thread.is_alive():
-                self._thread = None
-                self._stop_event = None
-                self.current_dir = None
-                self.current_file = None
-                self.current_started = None
-                self.frame_counter = 0
-            lidar_detected = self._lidar_detected
-            lidar_streaming = False
-            current_size = None
-            if self.current_file:
-                try:
-                    current_size = self.current_file.stat().st_size
-                except OSError:
-                    current_size = None
-            if self._last_size_time:
-                now = datetime.utcnow()
-                if (now - self._last_size_time).total_seconds() < 2:
-                    lidar_streaming = True
-            ip_eth0 = self._get_ip_address("eth0")
-            lidar_ip = os.getenv("LIDAR_IP")
-            sdk_files = [
-                "/usr/local/lib/liblivox_lidar_sdk_shared.so",
-                "/usr/local/lib/liblivox_lidar_sdk_static.a",
-                "/usr/local/include/livox_lidar_api.h",
-                "/usr/local/include/livox_lidar_cfg.h",
-                "/usr/local/include/livox_lidar_def.h",
-            ]
-            livox_sdk2 = all(Path(p).exists() for p in sdk_files)
-            save_laz_ok = shutil.which("save_laz") is not None
-            laszip_lib_dir = Path(__file__).resolve().parent.parent / "3rd" / "LASzip" / "lib"
-            laszip_ok = (
-                (laszip_lib_dir / "liblaszip_api.so").exists()
-                and (laszip_lib_dir / "liblaszip.so").exists()
+            if not self._thread or not self._thread.is_alive():
+                return None
+            if self._stop_op:
+                return self.operations.wait(self._stop_op, 0)
+            op = self.operations.create(
+                "stop", "stopping", session=self.current_dir.name if self.current_dir else None
             )
-            free_space = None
-            if self.usb_mount:
-                try:
-                    free_space = shutil.disk_usage(self.usb_mount).free
-                except OSError:
-                    free_space = None
+            self._stop_op = op["id"]
+            self._stop_requested = time.perf_counter()
+            if self._phase != "finalizing":
+                self._phase = "stopping"
+        self._interrupt_capture()
+        self._status.poke()
+        return op
+
+    def wait_operation(self, op_id: str, timeout: Optional[float] = None) -> Optional[dict]:
+        """Wait up to ``timeout`` seconds for a start or stop operation.
+
+        Returns the operation's state, or ``None`` if the ID is unknown.
+        """
+        return self.operations.wait(op_id, timeout)
+
+    def stop_recording(self) -> bool:
+        """Stop the Livox recording and wait until the session is logged."""
+        op = self.request_stop()
+        if op is None:
+            return False
+        self.operations.wait(op["id"])
+        return True
+
+    def _fast_status(self) -> dict:
+        """Fields that change with every frame; refreshed frequently.
+
+        Reads the fields the capture and mount threads maintain without
+        taking the recording lock, which start and stop hold for a while, and
+        never touches the drive.
+        """
+        ready = self._ready.is_set()
+        storage = ready and self.output_dir is not None
+        recording = self._thread is not None
+        current_file = self.current_file
+        current_dir = self.current_dir
+        started = self.current_started
+        frames = self.frame_counter
+        current_size = self._current_size if current_file else None
+        last_size_time = self._last_size_time
+        lidar_detected = self._lidar_detected
+        last_frame = self.last_frame_stats
+        device_list = list(self._devices)
+        devices = [d.status() for d in device_list] if self.device_configs else None
+        persistent = any(d.recorder for d in device_list)
+        log = self.recordings_log
+        phase = self._phase
+        lidar_streaming = False
+        if last_size_time:
+            now = datetime.utcnow()
+            if (now - last_size_time).total_seconds() < 2:
+                lidar_streaming = True
+        if not ready:
+            state = "initializing"
+        elif phase:
+            state = phase
+        else:
+            state = "recording" if recording else "idle"
         return {
-            "recording": self._thread is not None,
-            "current_file": self.current_file.name if self.current_file else None,
-            "current_session": self.current_dir.name if self.current_dir else None,
-            "started": self.current_started.isoformat() if self.current_started else None,
-            "frames_recorded": self.frame_counter,
+            "state": state,
+            "recording": recording,
+            "current_file": current_file.name if current_file else None,
+            "current_session": current_dir.name if current_dir else None,
+            "output_dir": str(self.output_dir) if self.output_dir else None,
+            "started": started.isoformat() if started else None,
+            "frames_recorded": frames,
             "current_size": current_size,
+            "last_frame": last_frame,
+            "recorder_mode": "persistent" if persistent else "spawn",
+            "devices": devices,
+            "pipeline_queue": self.pipeline.pending(),
+            "metrics": self.metrics.summary(),
+            "admission": self.admission.status(),
+            "staging": self.staging.status() if self.staging else None,
+            "verification": self.verifier.status(),
+            "merge": self.merger.status(),
+            "recompression": self.recompressor.status(),
+            "exports": self.exporter.status(),
+            "governor": self.governor.status(),
             "storage_present": storage,
-            "free_space": free_space,
             "lidar_detected": lidar_detected,
             "lidar_streaming": lidar_streaming,
+            "log_error": log.error if log else False,
+            "archive_error": log.archive_error if log else False,
+            "log_version": self._log_version,
+        }
+
+    def _slow_status(self) -> dict:
+        """Environment fields that rarely change; refreshed occasionally."""
+        ip_eth0 = self._get_ip_address("eth0")
+        lidar_ip = os.getenv("LIDAR_IP")
+        sdk_files = [
+            "/usr/local/lib/liblivox_lidar_sdk_shared.so",
+            "/usr/local/lib/liblivox_lidar_sdk_static.a",
+            "/usr/local/include/livox_lidar_api.h",
+            "/usr/local/include/livox_lidar_cfg.h",
+            "/usr/local/include/livox_lidar_def.h",
+        ]
+        livox_sdk2 = all(Path(p).exists() for p in sdk_files)
+        save_laz_ok = shutil.which("save_laz") is not None
+        laszip_lib_dir = Path(__file__).resolve().parent.parent / "3rd" / "LASzip" / "lib"
+        laszip_ok = (
+            (laszip_lib_dir / "liblaszip_api.so").exists()
+            and (laszip_lib_dir / "liblaszip.so").exists()
+        )
+        free_space = None
+        mount = self.usb_mount
+        if mount:
+            try:
+                free_space = shutil.disk_usage(mount).free
+            except OSError:
+                free_space = None
+        return {
+            "free_space": free_space,
             "eth0_ip": ip_eth0,
             "lidar_ip": lidar_ip,
             "livox_sdk2": livox_sdk2,
             "save_laz": save_laz_ok,
             "laszip": laszip_ok,
-            "log_error": self._log_error,
-            "archive_error": self._archive_error,
         }
 
+    def status_snapshot(self) -> StatusSnapshot:
+        """Return the latest published status without taking the lock."""
+        return self._status.snapshot()
+
+    def render_metrics(self) -> str:
+        """Return frame metrics and key gauges in Prometheus text format."""
+        snap = self._status.snapshot().data
+        governor = snap.get("governor") or {}
+        # The raw samples change with every reading and are kept out of the
+        # status snapshot
+        sample = self.governor.sample()
+        pressure = sample["pressure"]
+        return self.metrics.render_prometheus(
+            {
+                "recording": int(bool(snap.get("recording"))),
+                "frames_recorded": snap.get("frames_recorded"),
+                "pipeline_queue": self.pipeline.pending(),
+                "free_space_bytes": snap.get("free_space"),
+                "storage_remaining_seconds": (snap.get("admission") or {}).get("remaining_seconds"),
+                "staging_bytes": (snap.get("staging") or {}).get("occupancy_bytes"),
+                "staging_lag_seconds": (snap.get("staging") or {}).get("flush_lag_seconds"),
+                "governor_level": LEVELS.index(governor["state"]) if governor.get("state") in LEVELS else None,
+                "temperature_celsius": sample["temperature"],
+                "load_per_cpu": sample["load_per_cpu"],
+                "cpu_pressure_percent": pressure.get("cpu"),
+                "io_pressure_percent": pressure.get("io"),
+                "memory_pressure_percent": pressure.get("memory"),
+                "capture_latency_seconds": sample["capture_seconds"],
+            }
+        )
+
+    def add_status_listener(self, callback) -> None:
+        """Register ``callback`` for every newly published status snapshot."""
+        self._status.add_listener(callback)
+
+    def status(self) -> dict:
+        return dict(self._status.snapshot().data)
+
     def list_recordings(self):
-        self._ensure_storage()
-        return self._load_log()
+        if not self._ready.is_set():
+            return []
+        with self._lock:
+            self._ensure_storage()
+            log = self.recordings_log
+        return log.entries() if log else []
+
+    def query_recordings(
+        self,
+        limit: int = 50,
+        cursor: Optional[str] = None,
+        since: Optional[str] = None,
+        until: Optional[str] = None,
+        error: Optional[bool] = None,
+        order: str = "desc",
+    ) -> dict:
+        """Return one page of sessions from the session index.
+
+        See :meth:`SessionIndex.query` for the parameters.  The result has
+        the form ``{"recordings": [...], "next_cursor": str | None}``.
+        """
+        if not self._ready.is_set():
+            return {"recordings": [], "next_cursor": None}
+        with self._lock:
+            self._ensure_storage()
+            index = self.session_index
+        if not index:
+            return {"recordings": [], "next_cursor": None}
+        items, next_cursor = index.query(
+            limit=limit, cursor=cursor, since=since, until=until, error=error, order=order
+        )
+        return {"recordings": items, "next_cursor": next_cursor}
+
+    def verify_session(self, name: Optional[str] = None) -> int:
+        """Queue session ``name`` (all sessions if ``None``) for verification.
+
+        Returns the number of sessions queued.
+        """
+        if name is None:
+            sessions = self._sessions_to_verify()
+        else:
+            with self._lock:
+                output_dir = self.output_dir
+                active = self.current_dir
+            session = output_dir / name if output_dir else None
+            if session is None or not session.is_dir() or session == active:
+                return 0
+            sessions = [session]
+        return sum(self.verifier.submit(s) for s in sessions if s != self.current_dir)
+
+    def merge_session(self, name: str) -> bool:
+        """Queue the frames of session ``name`` to be merged into one cloud.
+
+        Returns ``False`` if the session is unknown, still recording or
+        already queued.
+        """
+        with self._lock:
+            output_dir = self.output_dir
+            active = self.current_dir
+        session = output_dir / name if output_dir else None
+        if session is None or not session.is_dir() or session == active:
+            return False
+        return self.merger.submit(session)
+
+    def recent_logs(self, level: int = logging.NOTSET, limit: int = 200, since: Optional[int] = None) -> dict:
+        """Recent log records of this process from the in-memory buffer."""
+        return logging_config.recent_logs(level, limit, since)
 
     def close(self) -> None:
         """Shut down background threads and clean up resources."""
+        self._closing.set()
         # Stop an active recording if one is running
         try:
             self.stop_recording()
@@ -532,6 +1576,19 @@ class RecordingManager:
             self._detector_stop.set()
             self._detector_thread.join()
             self._detector_thread = None
+        if self._detector:
+            self._detector.close()
+        self.pipeline.close()
+        self.recompressor.close()
+        self.exporter.close()
+        self.verifier.close()
+        self.merger.close()
+        self.governor.close()
+        if self.staging:
+            self.staging.close(self.staging_flush_timeout)
+        self._mounts.unsubscribe(self._on_mount_change)
+        self._status.stop()
+        self._close_log()
 
     def __del__(self):
         try:
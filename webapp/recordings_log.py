@@ -0,0 +1,227 @@
+"""Append-only, segmented log of finished recording sessions.
+
+Each session is appended as a single JSON line to the active segment file
+``recordings.d/segment-NNNNNN.jsonl`` and fsynced, so logging a session costs
+one line of I/O no matter how long the history is.  Segments are rolled over
+every ``segment_size`` entries.  A background compactor retires segments that
+fall completely outside the most recent ``limit`` entries by moving them into
+``recordings.d/archive/`` (or deleting them when archiving is disabled); old
+data is never rewritten.
+
+The most recent ``limit`` entries are kept in memory, so listing recordings
+does not touch the drive.  A legacy ``recordings.json`` is imported once and
+renamed to ``recordings.json.migrated``.
+"""
+
+import json
+import logging
+import os
+import re
+import threading
+from collections import deque
+from pathlib import Path
+from typing import Deque, List, Optional
+
+logger = logging.getLogger(__name__)
+
+_SEGMENT_RE = re.compile(r"segment-(\d+)\.jsonl$")
+
+
+class RecordingsLog:
+    """Session log stored as JSON-lines segments under ``output_dir``."""
+
+    def __init__(
+        self,
+        output_dir: Path,
+        limit: int = 100,
+        archive: bool = False,
+        segment_size: int = 50,
+    ):
+        self.output_dir = Path(output_dir)
+        self.dir = self.output_dir / "recordings.d"
+        self.archive_dir = self.dir / "archive"
+        self.limit = limit
+        self.archive = archive
+        self.segment_size = max(1, segment_size)
+        self.error = False
+        self.archive_error = False
+        self._lock = threading.Lock()
+        # (segment number, entry count) for every live segment, oldest first
+        self._segments: List[List[int]] = []
+        self._recent: Deque[dict] = deque(maxlen=limit or None)
+        self._total = 0
+        self._torn_tail = False
+        self._compact_wake = threading.Event()
+        self._stop = threading.Event()
+        self._compactor: Optional[threading.Thread] = None
+        self._load()
+
+    # ---- loading ----------------------------------------------------------
+    def _segment_path(self, number: int) -> Path:
+        return self.dir / f"segment-{number:06d}.jsonl"
+
+    def _read_segment(self, path: Path) -> List[dict]:
+        entries = []
+        try:
+            with path.open() as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        entries.append(json.loads(line))
+                    except json.JSONDecodeError:
+                        # A torn final line after power loss; skip it
+                        logger.warning("Skipping corrupt entry in %s", path)
+        except OSError as e:
+            logger.warning("Failed to read %s: %s", path, e)
+            self.error = True
+        return entries
+
+    def _load(self) -> None:
+        try:
+            self.dir.mkdir(parents=True, exist_ok=True)
+        except OSError as e:
+            logger.warning("Failed to create recordings log directory: %s", e)
+            self.error = True
+            return
+        numbers = sorted(
+            int(m.group(1))
+            for m in (_SEGMENT_RE.search(p.name) for p in self.dir.iterdir())
+            if m
+        )
+        if not numbers:
+            self._migrate_legacy()
+            return
+        for number in numbers:
+            entries = self._read_segment(self._segment_path(number))
+            self._segments.append([number, len(entries)])
+            self._total += len(entries)
+            self._recent.extend(entries)
+        self._torn_tail = not self._ends_with_newline(self._segment_path(numbers[-1]))
+
+    def _migrate_legacy(self) -> None:
+        legacy = self.output_dir / "recordings.json"
+        if not legacy.exists():
+            return
+        try:
+            entries = json.loads(legacy.read_text())
+        except (OSError, json.JSONDecodeError) as e:
+            logger.warning("Could not import legacy recordings log: %s", e)
+            entries = []
+        for entry in entries if isinstance(entries, list) else []:
+            self.append(entry)
+        try:
+            os.replace(legacy, legacy.with_name(legacy.name + ".migrated"))
+        except OSError as e:
+            logger.warning("Failed to retire legacy recordings log: %s", e)
+
+    # ---- public API -------------------------------------------------------
+    def append(self, entry: dict) -> bool:
+        """Durably append ``entry`` to the active segment."""
+        line = json.dumps(entry, separators=(",", ":")) + "\n"
+        with self._lock:
+            if not self._segments or self._segments[-1][1] >= self.segment_size:
+                number = self._segments[-1][0] + 1 if self._segments else 1
+                self._segments.append([number, 0])
+            segment = self._segments[-1]
+            path = self._segment_path(segment[0])
+            try:
+                with path.open("ab") as f:
+                    if self._torn_tail:
+                        f.write(b"\n")
+                    f.write(line.encode())
+                    f.flush()
+                    os.fsync(f.fileno())
+                self._torn_tail = False
+                self.error = False
+            except OSError as e:
+                logger.warning("Failed to write recordings log: %s", e)
+                self.error = True
+                return False
+            segment[1] += 1
+            self._total += 1
+            self._recent.append(entry)
+        self._compact_wake.set()
+        return True
+
+    def entries(self) -> List[dict]:
+        """Return the most recent ``limit`` entries, oldest first."""
+        with self._lock:
+            return list(self._recent)
+
+    @property
+    def total(self) -> int:
+        """Number of entries in the live (not yet retired) segments."""
+        return self._total
+
+    @staticmethod
+    def _ends_with_newline(path: Path) -> bool:
+        try:
+            with path.open("rb") as f:
+                if f.seek(0, os.SEEK_END) == 0:
+                    return True
+                f.seek(-1, os.SEEK_END)
+                return f.read(1) == b"\n"
+        except OSError:
+            return True
+
+    # ---- compaction -------------------------------------------------------
+    def compact(self) -> int:
+        """Retire segments entirely older than the newest ``limit`` entries.
+
+        Returns the number of segments retired.
+        """
+        if not self.limit:
+            return 0
+        retired = 0
+        while True:
+            with self._lock:
+                if len(self._segments) < 2:
+                    break
+                number, count = self._segments[0]
+                if self._total - count < self.limit:
+                    break
+            path = self._segment_path(number)
+            try:
+                if self.archive:
+                    self.archive_dir.mkdir(exist_ok=True)
+                    os.replace(path, self.archive_dir / path.name)
+                    self.archive_error = False
+                else:
+                    path.unlink()
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.warning("Failed to archive recordings log segment %s: %s", path, e)
+                self.archive_error = True
+                break
+            with self._lock:
+                self._segments.pop(0)
+                self._total -= count
+            retired += 1
+        return retired
+
+    def start_compactor(self) -> None:
+        if self._compactor is not None:
+            return
+        self._compactor = threading.Thread(
+            target=self._compact_loop, name="recordings-compactor", daemon=True
+        )
+        self._compactor.start()
+
+    def close(self) -> None:
+        thread = self._compactor
+        self._compactor = None
+        if thread:
+            self._stop.set()
+            self._compact_wake.set()
+            thread.join()
+
+    def _compact_loop(self) -> None:
+        while not self._stop.is_set():
+            self._compact_wake.wait()
+            self._compact_wake.clear()
+            if self._stop.is_set():
+                break
+            self.compact()
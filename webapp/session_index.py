@@ -0,0 +1,386 @@
+"""Persistent per-session aggregates for fast, paginated listing.
+
+The :class:`SessionIndex` keeps one record per session directory with the
+facts the dashboard and API need (frames, bytes, points, duration, error
+state) so nobody has to walk session directories.  Records are updated in
+memory as frames land and checkpointed by appending the current record to
+``sessions.idx.jsonl``; on load the last record for each session wins.
+Frame updates only mark a record dirty: a ``session-index`` thread writes
+it every ``checkpoint_frames`` frames or ``checkpoint_interval`` seconds,
+so neither the capture loop nor queries wait for the drive.
+Sessions are kept sorted by start time, and separately for failed and clean
+sessions, so a page of results is found with a binary search instead of a
+scan of the whole history, also when it is filtered by error state.
+"""
+
+import bisect
+import io
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from . import container, las_io
+
+logger = logging.getLogger(__name__)
+
+INDEX_NAME = "sessions.idx.jsonl"
+
+
+class SessionIndex:
+    """In-memory session aggregates backed by an append-only checkpoint file."""
+
+    def __init__(self, output_dir: Path, checkpoint_frames: int = 25, checkpoint_interval: float = 10.0):
+        self.output_dir = Path(output_dir)
+        self.path = self.output_dir / INDEX_NAME
+        self.checkpoint_frames = max(1, checkpoint_frames)
+        self.checkpoint_interval = checkpoint_interval
+        self.error = False
+        self._lock = threading.Lock()
+        self._cond = threading.Condition(self._lock)
+        # Serialises writes to the file; taken before ``_lock``, never while
+        # holding it, so records are written in the order they were copied
+        self._write_lock = threading.Lock()
+        self._records: Dict[str, dict] = {}
+        # (started, session) pairs kept sorted for range queries and paging
+        self._order: List[Tuple[str, str]] = []
+        # The same pairs split by error state, so filtered pages skip nothing
+        self._by_error: Dict[bool, List[Tuple[str, str]]] = {False: [], True: []}
+        # Session -> (frames since the last checkpoint, when it became dirty)
+        self._dirty: Dict[str, Tuple[int, float]] = {}
+        self._lines = 0
+        self._closed = False
+        self._load()
+        self._thread = threading.Thread(target=self._run, name="session-index", daemon=True)
+        self._thread.start()
+
+    # ---- persistence ------------------------------------------------------
+    def _load(self) -> None:
+        if not self.path.exists():
+            return
+        try:
+            with self.path.open() as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        rec = json.loads(line)
+                    except json.JSONDecodeError:
+                        logger.warning("Skipping corrupt session index entry")
+                        continue
+                    self._lines += 1
+                    if isinstance(rec, dict) and rec.get("folder"):
+                        self._put(rec)
+        except OSError as e:
+            logger.warning("Failed to read session index: %s", e)
+            self.error = True
+            return
+        # Sessions still marked active were cut short by a crash or power loss
+        for rec in list(self._records.values()):
+            if rec.get("active"):
+                self._put(dict(rec, active=False, error=rec.get("error") or "interrupted"))
+        # Collapse superseded checkpoints once they dominate the file
+        if self._lines > 2 * len(self._records) + 100:
+            self._rewrite()
+
+    def _rewrite(self) -> None:
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        try:
+            with tmp.open("w") as f:
+                for _, name in self._order:
+                    f.write(json.dumps(self._records[name], separators=(",", ":")) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.path)
+            self._lines = len(self._records)
+        except OSError as e:
+            logger.warning("Failed to compact session index: %s", e)
+            self.error = True
+
+    def _append(self, records: Iterable[dict]) -> None:
+        data = "".join(json.dumps(r, separators=(",", ":")) + "\n" for r in records)
+        if not data:
+            return
+        try:
+            with self.path.open("a") as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            self._lines += data.count("\n")
+            self.error = False
+        except OSError as e:
+            logger.warning("Failed to write session index: %s", e)
+            self.error = True
+
+    def _put(self, rec: dict) -> None:
+        """Store ``rec``; records are replaced, never changed in place, when
+        their start time or error state changes."""
+        name = rec["folder"]
+        old = self._records.get(name)
+        if old is not None:
+            key = (old.get("started") or "", name)
+            _discard(self._order, key)
+            _discard(self._by_error[bool(old.get("error"))], key)
+        self._records[name] = rec
+        key = (rec.get("started") or "", name)
+        bisect.insort(self._order, key)
+        bisect.insort(self._by_error[bool(rec.get("error"))], key)
+
+    def _checkpoint(self, names: Optional[Iterable[str]] = None) -> None:
+        """Append the current record of ``names`` (default: all dirty ones)."""
+        with self._write_lock:
+            with self._lock:
+                if names is None:
+                    names = list(self._dirty)
+                records = []
+                for name in names:
+                    self._dirty.pop(name, None)
+                    if name in self._records:
+                        records.append(dict(self._records[name]))
+            self._append(records)
+
+    def _due(self) -> Tuple[List[str], Optional[float]]:
+        """Dirty sessions due for a checkpoint and the wait until the next."""
+        now = time.monotonic()
+        due = []
+        wait = None
+        for name, (frames, at) in self._dirty.items():
+            left = at + self.checkpoint_interval - now
+            if frames >= self.checkpoint_frames or left <= 0:
+                due.append(name)
+            elif wait is None or left < wait:
+                wait = left
+        return due, wait
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                due, wait = self._due()
+                while not due and not self._closed:
+                    self._cond.wait(wait)
+                    due, wait = self._due()
+                if self._closed:
+                    return
+            self._checkpoint(due)
+
+    def close(self) -> None:
+        """Stop the checkpoint thread and write every dirty record."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join(timeout=10)
+        self.flush()
+
+    # ---- updates from the recorder ----------------------------------------
+    def begin(self, name: str, started: str) -> None:
+        with self._lock:
+            self._put(
+                {
+                    "folder": name,
+                    "started": started,
+                    "stopped": None,
+                    "frames": 0,
+                    "bytes": 0,
+                    "points": 0,
+                    "failures": 0,
+                    "duration": 0.0,
+                    "active": True,
+                    "error": None,
+                }
+            )
+        self._checkpoint([name])
+
+    def add_frame(self, name: str, size: int, points: Optional[int] = None, elapsed: Optional[float] = None) -> None:
+        with self._lock:
+            rec = self._records.get(name)
+            if rec is None:
+                return
+            rec["frames"] += 1
+            rec["bytes"] += size
+            if points:
+                rec["points"] += points
+            if elapsed is not None:
+                rec["duration"] = round(elapsed, 3)
+            frames, at = self._dirty.get(name, (0, time.monotonic()))
+            self._dirty[name] = (frames + 1, at)
+            if frames == 0 or frames + 1 >= self.checkpoint_frames:
+                self._cond.notify_all()
+
+    def add_failure(self, name: str) -> None:
+        with self._lock:
+            rec = self._records.get(name)
+            if rec is not None:
+                rec["failures"] += 1
+
+    def finish(self, name: str, stopped: str, error: Optional[str] = None, frames: Optional[int] = None) -> None:
+        with self._lock:
+            rec = self._records.get(name)
+            if rec is None:
+                return
+            rec = dict(
+                rec,
+                stopped=stopped,
+                duration=_duration(rec.get("started"), stopped),
+                active=False,
+                error=error,
+            )
+            if frames is not None:
+                rec["frames"] = frames
+            self._put(rec)
+        self._checkpoint([name])
+
+    def update(self, name: str, **fields) -> None:
+        """Merge extra fields into a session record and checkpoint it."""
+        with self._lock:
+            rec = self._records.get(name)
+            if rec is None:
+                return
+            if "started" in fields or "error" in fields:
+                self._put(dict(rec, **fields))
+            else:
+                rec.update(fields)
+        self._checkpoint([name])
+
+    def flush(self) -> None:
+        self._checkpoint()
+
+    # ---- seeding ------------------------------------------------------------
+    def seed(self, log_entries: Iterable[dict], throttle: Optional[Callable[[], None]] = None) -> int:
+        """Index sessions that predate the index from the log and the drive.
+
+        Runs once per drive; each unknown session directory is scanned a
+        single time and its aggregates are persisted.  ``throttle`` is
+        called before each scan and may block.
+        """
+        entries = {e.get("folder"): e for e in log_entries if e.get("folder")}
+        try:
+            dirs = [p for p in self.output_dir.glob("session_*") if p.is_dir()]
+        except OSError:
+            dirs = []
+        added = []
+        for d in dirs:
+            with self._lock:
+                if d.name in self._records:
+                    continue
+            if throttle:
+                throttle()
+            rec = _scan_session(d, entries.get(d.name, {}))
+            with self._lock:
+                if d.name not in self._records:
+                    self._put(rec)
+                    added.append(rec["folder"])
+        self._checkpoint(added)
+        return len(added)
+
+    # ---- queries ------------------------------------------------------------
+    def get(self, name: str) -> Optional[dict]:
+        with self._lock:
+            rec = self._records.get(name)
+            return dict(rec) if rec else None
+
+    def query(
+        self,
+        limit: int = 50,
+        cursor: Optional[str] = None,
+        since: Optional[str] = None,
+        until: Optional[str] = None,
+        error: Optional[bool] = None,
+        order: str = "desc",
+    ) -> Tuple[List[dict], Optional[str]]:
+        """Return one page of sessions and the cursor for the next page.
+
+        ``since``/``until`` bound the ISO start time (inclusive/exclusive),
+        ``error`` keeps only failed (``True``) or clean (``False``) sessions
+        and ``cursor`` is the ``folder`` of the last item of the previous
+        page.
+        """
+        limit = max(1, limit)
+        with self._lock:
+            order_list = self._order if error is None else self._by_error[bool(error)]
+            lo = bisect.bisect_left(order_list, (since or "",))
+            hi = bisect.bisect_left(order_list, (until,)) if until else len(order_list)
+            if cursor and cursor in self._records:
+                key = (self._records[cursor].get("started") or "", cursor)
+                pos = bisect.bisect_left(order_list, key)
+                if order == "asc":
+                    lo = max(lo, pos + 1)
+                else:
+                    hi = min(hi, pos)
+            indices = range(lo, hi) if order == "asc" else range(hi - 1, lo - 1, -1)
+            items: List[dict] = []
+            next_cursor = None
+            for n, i in enumerate(indices):
+                rec = self._records[order_list[i][1]]
+                items.append(dict(rec))
+                if len(items) >= limit:
+                    if n + 1 < len(indices):
+                        next_cursor = rec["folder"]
+                    break
+        return items, next_cursor
+
+
+def _discard(keys: List[Tuple[str, str]], key: Tuple[str, str]) -> None:
+    i = bisect.bisect_left(keys, key)
+    if i < len(keys) and keys[i] == key:
+        del keys[i]
+
+
+def _duration(started: Optional[str], stopped: Optional[str]) -> Optional[float]:
+    try:
+        delta = datetime.fromisoformat(stopped) - datetime.fromisoformat(started)
+    except (TypeError, ValueError):
+        return None
+    return round(delta.total_seconds(), 3)
+
+
+def _scan_session(path: Path, entry: dict) -> dict:
+    frames = 0
+    size = 0
+    points = 0
+    for packed in [path / container.CONTAINER_NAME, *path.glob(f"*/{container.CONTAINER_NAME}")]:
+        if not packed.exists():
+            continue
+        try:
+            reader = container.ContainerReader(packed)
+            size += packed.stat().st_size
+            for item in reader.frames():
+                frames += 1
+                try:
+                    points += las_io.read_header(io.BytesIO(reader.read(item, 512))).point_count
+                except ValueError:
+                    continue
+        except (OSError, ValueError) as e:
+            logger.warning("Cannot read session container %s: %s", packed, e)
+    # Multi-LiDAR sessions keep each device in a subdirectory
+    for f in sorted([*path.glob("frame_*.la[sz]"), *path.glob("*/frame_*.la[sz]")]):
+        try:
+            size += f.stat().st_size
+            frames += 1
+            points += las_io.open_header(f).point_count
+        except (OSError, ValueError):
+            continue
+    rec = {
+        "folder": path.name,
+        "started": entry.get("started"),
+        "stopped": entry.get("stopped"),
+        "frames": entry.get("frames", frames),
+        "bytes": size,
+        "points": points,
+        "failures": 0,
+        "duration": _duration(entry.get("started"), entry.get("stopped")),
+        "active": False,
+        "error": entry.get("error"),
+    }
+    if rec["started"] is None:
+        # session_YYYYmmdd_HHMMSS
+        try:
+            stamp = time.strptime(path.name[len("session_"):], "%Y%m%d_%H%M%S")
+            rec["started"] = time.strftime("%Y-%m-%dT%H:%M:%S", stamp)
+        except ValueError:
+            rec["started"] = ""
+    return rec
@@ -0,0 +1,320 @@
+"""Local staging tier in front of the USB drive.
+
+Small random writes and ``fsync`` calls on USB sticks have long latency
+spikes, and each spike used to delay the next capture.  With ``STAGING_DIR``
+pointing at fast local storage (tmpfs or the SD card) frames and their
+exports are produced there instead.  A background mover copies completed
+frames to the session directory on the drive in large sequential batches and
+syncs the drive once per batch; staged files are only removed after the
+batch is durable, so a crash or a pulled drive never loses data that was
+already captured.
+
+The staging area has a size cap.  When it is full the capture loop writes
+straight to the drive rather than waiting for the mover.
+
+When the drive is removed :meth:`StagingArea.detach` stops moving files to
+it and ends a :meth:`~StagingArea.flush` waiting for it; the files stay
+staged until :meth:`~StagingArea.recover` finds them on the next mount.
+"""
+
+import ctypes
+import ctypes.util
+import logging
+import os
+import shutil
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Deque, Dict, Iterable, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+_COPY_BLOCK = 4 * 1024 * 1024
+
+try:
+    _libc = ctypes.CDLL(ctypes.util.find_library("c") or None, use_errno=True)
+    _syncfs = _libc.syncfs
+except (OSError, AttributeError):
+    _syncfs = None
+
+
+def sync_filesystem(path: Path) -> None:
+    """Flush the file system holding ``path`` (``syncfs``; ``sync`` fallback)."""
+    if _syncfs is not None:
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            if _syncfs(fd) == 0:
+                return
+            err = ctypes.get_errno()
+        finally:
+            os.close(fd)
+        raise OSError(err, os.strerror(err), str(path))
+    os.sync()
+
+
+@dataclass
+class _Item:
+    src: Path
+    dest_dir: Path
+    size: int
+    queued: float
+
+
+class StagingArea:
+    """Stage files locally and move them to their destination in batches."""
+
+    def __init__(
+        self,
+        root: Path,
+        cap_bytes: int = 512 * 1024 * 1024,
+        batch_bytes: int = 32 * 1024 * 1024,
+        batch_interval: float = 5.0,
+    ):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.cap_bytes = cap_bytes
+        self.batch_bytes = batch_bytes
+        self.batch_interval = batch_interval
+        self._cond = threading.Condition()
+        self._queue: Deque[_Item] = deque()
+        self._queued_bytes = 0
+        # Bytes of frames still being post-processed in the staging area
+        self._producing = 0
+        self._in_flight = 0
+        self._moving = False
+        self._flush_requested = False
+        # Destination roots on drives that went away, and how often one did
+        self._gone: Set[Path] = set()
+        self._detached = 0
+        self._closed = False
+        self.error: Optional[str] = None
+        self.batches = 0
+        self.last_batch: Optional[dict] = None
+        # Called with the bytes and seconds of every batch made durable
+        self.on_batch: Optional[Callable[[int, float], None]] = None
+        self._thread = threading.Thread(target=self._run, name="staging-mover", daemon=True)
+        self._thread.start()
+
+    # ---- producer side --------------------------------------------------------
+    def session_dir(self, name: str) -> Path:
+        path = self.root / name
+        path.mkdir(parents=True, exist_ok=True)
+        return path
+
+    def has_room(self, expected: int) -> bool:
+        """Whether a frame of about ``expected`` bytes fits under the cap."""
+        with self._cond:
+            return self._occupancy() + expected <= self.cap_bytes
+
+    def _occupancy(self) -> int:
+        return self._producing + self._queued_bytes + self._in_flight
+
+    def reserve(self, size: int) -> None:
+        """Account for a ``size``-byte frame captured into the staging area."""
+        with self._cond:
+            self._producing += size
+
+    def commit(self, files: Iterable[Path], dest_dir: Path, reserved: int = 0) -> None:
+        """Queue finished ``files`` for moving to ``dest_dir``.
+
+        ``reserved`` releases the amount previously passed to :meth:`reserve`.
+        """
+        now = time.monotonic()
+        with self._cond:
+            if self._is_gone(dest_dir):
+                # Left for recover() once the drive is back
+                files = []
+            for f in files:
+                try:
+                    size = f.stat().st_size
+                except OSError:
+                    continue
+                self._queue.append(_Item(f, dest_dir, size, now))
+                self._queued_bytes += size
+            self._producing = max(0, self._producing - reserved)
+            self._cond.notify_all()
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Move everything queued now; returns ``False`` on timeout, error or
+        when a drive is detached meanwhile."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            self._flush_requested = True
+            self._cond.notify_all()
+            detached = self._detached
+            while self._queue or self._moving:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if (remaining is not None and remaining <= 0) or self._detached != detached:
+                    return False
+                self._cond.wait(remaining if remaining is not None else 1.0)
+            self._flush_requested = False
+            return self.error is None
+
+    def detach(self, root: Path) -> None:
+        """Stop moving files below ``root``, whose drive was removed.
+
+        Its queued files stay in the staging area and a running
+        :meth:`flush` returns at once instead of waiting for the drive.
+        """
+        with self._cond:
+            self._gone.add(root)
+            kept = deque(item for item in self._queue if not self._is_gone(item.dest_dir))
+            dropped = len(self._queue) - len(kept)
+            self._queue = kept
+            self._queued_bytes = sum(item.size for item in kept)
+            self._detached += 1
+            self._cond.notify_all()
+        if dropped:
+            logger.warning("%d staged files stay in %s until the drive is back", dropped, self.root)
+
+    def _is_gone(self, dest_dir: Path) -> bool:
+        return any(root == dest_dir or root in dest_dir.parents for root in self._gone)
+
+    def discard_session(self, name: str) -> None:
+        """Remove a session's staging directory once it is empty.
+
+        Empty per-device subdirectories are removed as well.
+        """
+        path = self.root / name
+        try:
+            if not path.is_dir():
+                return
+            for sub in path.iterdir():
+                if sub.is_dir() and not any(sub.iterdir()):
+                    sub.rmdir()
+            if not any(path.iterdir()):
+                path.rmdir()
+        except OSError:
+            pass
+
+    def recover(self, output_dir: Path) -> int:
+        """Queue files left behind by an earlier run for ``output_dir``."""
+        with self._cond:
+            self._gone.discard(output_dir)
+        count = 0
+        try:
+            sessions = [p for p in self.root.iterdir() if p.is_dir()]
+        except OSError:
+            return 0
+        with self._cond:
+            known = {item.src for item in self._queue}
+        for session in sessions:
+            # Group by directory; multi-LiDAR sessions stage one per device
+            groups: Dict[Path, List[Path]] = {}
+            for f in sorted(session.rglob("*")):
+                if f.is_file() and f not in known:
+                    groups.setdefault(f.parent, []).append(f)
+            for parent, files in groups.items():
+                self.commit(files, output_dir / parent.relative_to(self.root))
+                count += len(files)
+        if count:
+            logger.warning("Moving %d staged files left from a previous run", count)
+        return count
+
+    # ---- mover ----------------------------------------------------------------
+    def _take_batch(self) -> List[_Item]:
+        with self._cond:
+            while not self._closed:
+                if self._queue:
+                    age = time.monotonic() - self._queue[0].queued
+                    if (
+                        self._flush_requested
+                        or self._queued_bytes >= self.batch_bytes
+                        or age >= self.batch_interval
+                    ):
+                        break
+                    self._cond.wait(self.batch_interval - age)
+                else:
+                    self._cond.wait()
+            batch: List[_Item] = []
+            size = 0
+            while self._queue and (not batch or size < self.batch_bytes):
+                item = self._queue.popleft()
+                batch.append(item)
+                size += item.size
+            self._queued_bytes -= size
+            self._in_flight = size
+            self._moving = bool(batch)
+            return batch
+
+    def _run(self) -> None:
+        delay = 1.0
+        while not self._closed:
+            batch = self._take_batch()
+            if not batch:
+                continue
+            t0 = time.monotonic()
+            try:
+                moved = self._move(batch)
+            except OSError as e:
+                logger.error("Failed to move staged files to storage: %s", e)
+                with self._cond:
+                    self.error = str(e)
+                    # Keep the files queued; they are still on local storage
+                    batch = [i for i in batch if not self._is_gone(i.dest_dir)]
+                    self._queue.extendleft(reversed(batch))
+                    self._queued_bytes += sum(i.size for i in batch)
+                    self._in_flight = 0
+                    self._moving = False
+                    self._cond.notify_all()
+                    self._cond.wait(delay)
+                delay = min(delay * 2, 30.0)
+                continue
+            delay = 1.0
+            elapsed = time.monotonic() - t0
+            if self.on_batch and moved:
+                self.on_batch(moved, elapsed)
+            with self._cond:
+                self.error = None
+                self.batches += 1
+                self.last_batch = {
+                    "files": len(batch),
+                    "bytes": moved,
+                    "seconds": round(elapsed, 3),
+                }
+                self._in_flight = 0
+                self._moving = False
+                self._cond.notify_all()
+
+    def _move(self, batch: List[_Item]) -> int:
+        moved = 0
+        copied: List[_Item] = []
+        for item in batch:
+            if not item.src.exists():
+                continue
+            item.dest_dir.mkdir(parents=True, exist_ok=True)
+            # A copy torn by a crash is redone from the staged source
+            with open(item.src, "rb") as s, open(item.dest_dir / item.src.name, "wb") as d:
+                shutil.copyfileobj(s, d, _COPY_BLOCK)
+            copied.append(item)
+            moved += item.size
+        if not copied:
+            return 0
+        # One sync for the whole batch instead of one per file
+        sync_filesystem(copied[0].dest_dir)
+        for item in copied:
+            item.src.unlink(missing_ok=True)
+        return moved
+
+    # ---- reporting / lifecycle --------------------------------------------------
+    def status(self) -> dict:
+        with self._cond:
+            oldest = self._queue[0].queued if self._queue else None
+            return {
+                "occupancy_bytes": self._occupancy(),
+                "cap_bytes": self.cap_bytes,
+                "pending_files": len(self._queue),
+                "flush_lag_seconds": round(time.monotonic() - oldest, 1) if oldest else 0.0,
+                "batches": self.batches,
+                "last_batch": self.last_batch,
+                "error": self.error,
+            }
+
+    def close(self, timeout: Optional[float] = None) -> None:
+        self.flush(timeout)
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join(timeout=5)
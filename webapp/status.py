@@ -0,0 +1,141 @@
+"""Background publication of immutable status snapshots.
+
+Computing the full status is comparatively expensive (network interface
+lookup, SDK file checks, ``disk_usage``) and used to happen under the
+recording lock on every ``/status`` request.  :class:`StatusPublisher`
+instead refreshes fast-changing and slow-changing fields on independent
+intervals in a background thread and publishes the merged result as a
+:class:`StatusSnapshot`.  Readers simply grab the latest snapshot reference;
+no lock is involved and the JSON body and ``ETag`` are precomputed.
+"""
+
+import hashlib
+import json
+import logging
+import threading
+import time
+import types
+from dataclasses import dataclass
+from typing import Callable, List, Mapping, Optional
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class StatusSnapshot:
+    data: Mapping
+    body: bytes
+    etag: str
+    version: int
+    published: float
+
+
+def _make_snapshot(data: dict, version: int) -> StatusSnapshot:
+    body = json.dumps(data, sort_keys=True, default=str).encode()
+    etag = hashlib.blake2b(body, digest_size=8).hexdigest()
+    return StatusSnapshot(
+        data=types.MappingProxyType(data),
+        body=body,
+        etag=etag,
+        version=version,
+        published=time.time(),
+    )
+
+
+class StatusPublisher:
+    """Periodically merge ``fast()`` and ``slow()`` into a published snapshot."""
+
+    def __init__(
+        self,
+        fast: Callable[[], dict],
+        slow: Callable[[], dict],
+        fast_interval: float = 0.5,
+        slow_interval: float = 10.0,
+    ):
+        self._fast = fast
+        self._slow = slow
+        self.fast_interval = fast_interval
+        self.slow_interval = slow_interval
+        self._fast_data: dict = {}
+        self._slow_data: dict = {}
+        self._slow_at = 0.0
+        self._snapshot: Optional[StatusSnapshot] = None
+        # Serialises writers only; readers never take it.
+        self._publish_lock = threading.Lock()
+        self._listeners: List[Callable[[StatusSnapshot], None]] = []
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        # Publish the cheap fields right away; the slow ones (network, the
+        # drive) are filled in by the thread's first refresh.
+        self._slow_at = time.monotonic()
+        self.refresh()
+        self._slow_at = 0.0
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="status-publisher", daemon=True)
+        self._thread.start()
+        self._wake.set()
+
+    def stop(self) -> None:
+        thread = self._thread
+        self._thread = None
+        if thread:
+            self._stop.set()
+            self._wake.set()
+            thread.join()
+
+    def add_listener(self, callback: Callable[[StatusSnapshot], None]) -> None:
+        """Call ``callback`` with every newly published snapshot."""
+        self._listeners.append(callback)
+
+    def poke(self, slow: bool = False) -> None:
+        """Request an immediate refresh (e.g. after a frame completed)."""
+        if slow:
+            self._slow_at = 0.0
+        self._wake.set()
+
+    def snapshot(self) -> StatusSnapshot:
+        snap = self._snapshot
+        if snap is None:
+            snap = self.refresh(slow=True)
+        return snap
+
+    def refresh(self, slow: bool = False) -> StatusSnapshot:
+        """Recompute the fast (and optionally slow) fields and publish."""
+        with self._publish_lock:
+            now = time.monotonic()
+            if slow or now - self._slow_at >= self.slow_interval:
+                try:
+                    self._slow_data = self._slow()
+                except Exception:
+                    logger.exception("Failed to refresh slow status fields")
+                self._slow_at = now
+            try:
+                self._fast_data = self._fast()
+            except Exception:
+                logger.exception("Failed to refresh status fields")
+            data = {**self._slow_data, **self._fast_data}
+            current = self._snapshot
+            if current is not None and dict(current.data) == data:
+                return current
+            snap = _make_snapshot(data, current.version + 1 if current else 1)
+            # A single reference assignment publishes the snapshot atomically.
+            self._snapshot = snap
+            for callback in self._listeners:
+                try:
+                    callback(snap)
+                except Exception:
+                    logger.exception("Status listener failed")
+            return snap
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self._wake.wait(self.fast_interval)
+            self._wake.clear()
+            if self._stop.is_set():
+                break
+            self.refresh()